@@ -0,0 +1,111 @@
+import os
+import random
+from typing import Dict, List
+
+import pymupdf
+
+SYLLABLES = (
+    "ka", "ro", "mi", "te", "sa", "lo", "ne", "vi", "da", "pu",
+    "ri", "so", "ma", "ke", "ti", "no", "la", "ve", "du", "ba",
+)  # fmt: skip
+# Повторяющиеся от документа к документу блоки, как в реальных
+# регламентах: шапка, определения и юридический подвал
+BOILERPLATE = (
+    "This document is the property of the company and may not be "
+    "disclosed to third parties without written consent.",
+    "Terms and definitions used in this regulation are given in the "
+    "glossary of the configuration security management system.",
+)
+
+
+class CorpusGenerator:
+    """
+    Воспроизводимый синтетический корпус: при одинаковых параметрах
+    и зерне генерируются одни и те же файлы.
+    """
+
+    def __init__(self, seed: int = 0, vocabulary_size: int = 5000):
+        # Нужна воспроизводимость, а не криптостойкость
+        self.random = random.Random(seed)  # noqa: S311
+        self.vocabulary = [self._word() for _ in range(vocabulary_size)]
+
+    def _word(self) -> str:
+        return "".join(
+            self.random.choice(SYLLABLES)
+            for _ in range(self.random.randint(1, 4))
+        )
+
+    def sentence(self) -> str:
+        words = self.random.choices(
+            self.vocabulary, k=self.random.randint(6, 24)
+        )
+        return " ".join(words).capitalize() + "."
+
+    def paragraph(self) -> str:
+        return " ".join(
+            self.sentence() for _ in range(self.random.randint(2, 6))
+        )
+
+    def sections(self, paragraphs: int) -> List[Dict[str, str]]:
+        result = []
+        for number in range(paragraphs):
+            chapter, item = divmod(number, 5)
+            title = self.sentence().rstrip(".") if item == 0 else ""
+            text = f"{chapter + 1}.{item + 1}. {self.paragraph()}"
+            result.append({"title": title, "text": text})
+        result.append({"title": "", "text": self.random.choice(BOILERPLATE)})
+        return result
+
+    def markdown(self, paragraphs: int) -> str:
+        lines = [f"# {self.sentence().rstrip('.')}", ""]
+        for section in self.sections(paragraphs):
+            if section["title"]:
+                lines += [f"## {section['title']}", ""]
+            lines += [section["text"], ""]
+        return "\n".join(lines)
+
+    def write_pdf(self, path: str, paragraphs: int) -> None:
+        document = pymupdf.open()
+        page, y = None, 0.0
+        for section in self.sections(paragraphs):
+            for text, size in ((section["title"], 14), (section["text"], 10)):
+                if not text:
+                    continue
+                height = 14 * size * (len(text) // 90 + 1) / 10
+                if page is None or y + height > 790:
+                    page, y = document.new_page(), 50.0
+                page.insert_textbox(
+                    pymupdf.Rect(50, y, 545, y + height + size),
+                    text,
+                    fontsize=size,
+                )
+                y += height + size
+        document.save(path)
+        document.close()
+
+
+def generate_corpus(
+    path: str,
+    documents: int,
+    pdf_ratio: float = 0.2,
+    paragraphs: int = 40,
+    seed: int = 0,
+) -> Dict[str, int]:
+    generator = CorpusGenerator(seed)
+    counts = {"md": 0, "pdf": 0, "bytes": 0}
+    for index in range(documents):
+        # Документы раскладываются по папкам, как отделы в базе знаний
+        folder = os.path.join(path, f"department-{index % 8}")
+        os.makedirs(folder, exist_ok=True)
+        size = max(1, int(generator.random.gauss(paragraphs, paragraphs / 3)))
+        if generator.random.random() < pdf_ratio:
+            file_path = os.path.join(folder, f"document-{index:05d}.pdf")
+            generator.write_pdf(file_path, size)
+            counts["pdf"] += 1
+        else:
+            file_path = os.path.join(folder, f"document-{index:05d}.md")
+            with open(file_path, "w", encoding="utf-8") as file:
+                file.write(generator.markdown(size))
+            counts["md"] += 1
+        counts["bytes"] += os.path.getsize(file_path)
+    return counts
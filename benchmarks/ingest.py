@@ -0,0 +1,261 @@
+"""
+Бенчмарк загрузки документов на синтетическом корпусе.
+
+    python -m benchmarks.ingest --docs 10 100 1000 --pdf-ratio 0.2
+
+Каждый размер корпуса прогоняется в отдельном процессе (чистые кеши,
+манифест и честный пиковый RSS) через полный путь загрузки
+process_document с Chroma в памяти процесса. Результаты сохраняются
+в benchmarks/results/ в JSON, чтобы сравнивать их между коммитами.
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import orjson
+
+from benchmarks.corpus import generate_corpus
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+COLLECTION = "benchmark"
+
+
+class _AsyncCollection:
+    # Асинхронный интерфейс поверх синхронной коллекции EphemeralClient
+    def __init__(self, collection):
+        self._collection = collection
+
+    @property
+    def name(self) -> str:
+        return self._collection.name
+
+    @property
+    def metadata(self):
+        return self._collection.metadata
+
+    def __getattr__(self, name: str):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        return call
+
+
+class AsyncEphemeralClient:
+    def __init__(self):
+        import chromadb
+        import chromadb.config
+
+        self._client = chromadb.EphemeralClient(
+            settings=chromadb.config.Settings(anonymized_telemetry=False)
+        )
+
+    async def get_or_create_collection(self, *args, **kwargs):
+        return _AsyncCollection(
+            await asyncio.to_thread(
+                self._client.get_or_create_collection, *args, **kwargs
+            )
+        )
+
+    async def get_collection(self, *args, **kwargs):
+        return _AsyncCollection(
+            await asyncio.to_thread(
+                self._client.get_collection, *args, **kwargs
+            )
+        )
+
+    async def delete_collection(self, name: str) -> None:
+        await asyncio.to_thread(self._client.delete_collection, name)
+
+
+def _peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss в Linux в килобайтах; для дочерних процессов (пул
+    # конвертации) это максимум по одному процессу, а не сумма
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "self": round(usage_self.ru_maxrss / 1024, 1),
+        "children": round(usage_children.ru_maxrss / 1024, 1),
+    }
+
+
+async def run_one(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="ingest-benchmark-")
+    corpus_path = os.path.join(workdir, "knowledge")
+    started = time.perf_counter()
+    corpus = generate_corpus(
+        corpus_path, args.docs[0], args.pdf_ratio, args.paragraphs, args.seed
+    )
+    generation_seconds = time.perf_counter() - started
+
+    # Настройки читаются при импорте src.config, поэтому окружение
+    # готовится до импорта пайплайна
+    os.environ.update(
+        {
+            "KNOWLEDGE_BASE_PATH": corpus_path,
+            "CHROMA_COLLECTION_NAME": COLLECTION,
+            "MANIFEST_PATH": os.path.join(workdir, "manifest.sqlite"),
+            "CONVERSION_CACHE_PATH": os.path.join(workdir, "conversions"),
+            "DEDUP_PATH": os.path.join(workdir, "dedup.sqlite"),
+            "PROJECTION_DIM": "0",
+            "STATUS_PORT": "0",
+        }
+    )
+    if args.model:
+        os.environ["EMBEDDING_MODEL_NAME"] = args.model
+
+    from src.__main__ import close_resources, initial_load
+    from src.config import EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME
+    from src.embedding_service import embedding_service
+    from src.status import ingest_stats
+
+    chroma_client = AsyncEphemeralClient()
+    try:
+        # Модель загружается до замера, чтобы не учитывать ее в docs/sec
+        await asyncio.to_thread(embedding_service._load_model)
+        started = time.perf_counter()
+        await initial_load(corpus_path, chroma_client, workers=args.workers)
+        elapsed = time.perf_counter() - started
+        collection = await chroma_client.get_or_create_collection(COLLECTION)
+        chunks_stored = await collection.count()
+    finally:
+        await close_resources()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    snapshot = ingest_stats.snapshot()
+    return {
+        "documents": args.docs[0],
+        "corpus": corpus,
+        "generation_seconds": round(generation_seconds, 3),
+        "ingest_seconds": round(elapsed, 3),
+        "docs_per_second": round(snapshot["processed"] / elapsed, 3),
+        "chunks_per_second": snapshot["chunks_per_second"],
+        "chunks_embedded": snapshot["chunks_embedded"],
+        "chunks_stored": chunks_stored,
+        "errors": snapshot["errors"],
+        "stage_seconds": snapshot["stage_seconds"],
+        "peak_rss_mb": _peak_rss_mb(),
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "embedding_backend": EMBEDDING_BACKEND,
+    }
+
+
+def _git_commit() -> str:
+    git = shutil.which("git")
+    if git is None:
+        return "unknown"
+    try:
+        # Фиксированные аргументы, пользовательского ввода нет
+        return subprocess.run(
+            [git, "rev-parse", "--short", "HEAD"],  # noqa: S603
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_all(args: argparse.Namespace) -> str:
+    runs: List[Dict[str, Any]] = []
+    for documents in args.docs:
+        logger.info(f"Benchmarking ingestion of {documents} documents")
+        command = [
+            sys.executable,
+            "-m",
+            "benchmarks.ingest",
+            "--single",
+            "--docs",
+            str(documents),
+            "--pdf-ratio",
+            str(args.pdf_ratio),
+            "--paragraphs",
+            str(args.paragraphs),
+            "--workers",
+            str(args.workers),
+            "--seed",
+            str(args.seed),
+        ]
+        if args.model:
+            command += ["--model", args.model]
+        # Логи дочернего процесса идут в stderr, результат - последней
+        # строкой stdout. Запускается этот же модуль тем же интерпретатором
+        result = subprocess.run(
+            command, stdout=subprocess.PIPE, check=True  # noqa: S603
+        ).stdout
+        run = orjson.loads(result.strip().splitlines()[-1])
+        logger.info(
+            f"{documents} documents: {run['docs_per_second']} docs/sec, "
+            f"{run['chunks_per_second']} chunks/sec, "
+            f"peak RSS {run['peak_rss_mb']['self']:.0f} MB"
+        )
+        runs.append(run)
+
+    commit = _git_commit()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    report = {
+        "commit": commit,
+        "created_at": now.isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {
+            "pdf_ratio": args.pdf_ratio,
+            "paragraphs": args.paragraphs,
+            "workers": args.workers,
+            "seed": args.seed,
+        },
+        "runs": runs,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(
+        args.output, f"ingest-{now:%Y%m%d-%H%M%S}-{commit}.json"
+    )
+    with open(path, "wb") as file:
+        file.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    return path
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ingest")
+    parser.add_argument("--docs", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--pdf-ratio", type=float, default=0.2)
+    parser.add_argument(
+        "--paragraphs",
+        type=int,
+        default=40,
+        help="Среднее число абзацев в документе",
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--output", default=RESULTS_DIR)
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.single:
+        result = asyncio.run(run_one(args))
+        sys.stdout.write(orjson.dumps(result).decode() + "\n")
+    else:
+        logger.info(f"Results saved to {run_all(args)}")
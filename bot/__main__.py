@@ -1,7 +1,7 @@
 from aiogram import Bot, Dispatcher
 
 from bot.factories import create_bot, create_dispatcher
-from bot.runners import run_polling, run_webhook
+from bot.runners import run_polling, run_webhook, run_webhook_workers
 from bot.settings import settings
 from utils.loggers import setup_logger
 
@@ -9,8 +9,12 @@ from utils.loggers import setup_logger
 def main() -> None:
     setup_logger()
     dispatcher: Dispatcher = create_dispatcher(settings=settings)
-    bot: Bot = create_bot(settings=settings)
+    bot: Bot = create_bot(settings=settings, redis=dispatcher["redis"])
     if settings.webhook.use:
+        if settings.webhook.workers > 1:
+            return run_webhook_workers(
+                dispatcher=dispatcher, bot=bot, workers=settings.webhook.workers
+            )
         return run_webhook(dispatcher=dispatcher, bot=bot)
     return run_polling(dispatcher=dispatcher, bot=bot)
 
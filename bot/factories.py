@@ -15,39 +15,73 @@ from redis.asyncio import ConnectionPool, Redis
 from bot.enums import Locale
 from bot.handlers import admin, common, extra
 from bot.middlewares import (
+    BufferedFSMContextMiddleware,
     DBSessionMiddleware,
     QueryMiddleware,
+    RequestScheduler,
     RetryRequestMiddleware,
+    SchedulerRequestMiddleware,
     StateControlMiddleware,
+    ThrottlingMiddleware,
     UserManager,
     UserMiddleware,
 )
+from services.database import UserCache
 from services.database.create_pool import create_pool
+from services.feedback_ratings import RatingRelay
+from services.question_queue import QuestionQueue
 from utils import mjson
 
 if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
     from bot.settings import Settings
 
 
 def _setup_outer_middlewares(
     dispatcher: Dispatcher, settings: Settings
 ) -> None:
-    pool = dispatcher["session_pool"] = create_pool(
-        dsn=settings.postgres.build_dsn(),
-        enable_logging=settings.sqlalchemy_logging,
-    )
+    pool = dispatcher["session_pool"] = create_session_pool(settings)
     i18n_middleware = dispatcher["i18n_middleware"] = I18nMiddleware(
-        core=FluentRuntimeCore(
-            path="lang/{locale}",
-            raise_key_error=False,
-            locales_map={Locale.RU: Locale.US},
-        ),
+        core=create_i18n_core(),
         manager=UserManager(),
         default_locale=Locale.DEFAULT,
     )
 
+    # Questions are answered by RAG workers (python -m bot.worker)
+    question_queue = dispatcher["question_queue"] = create_question_queue(
+        redis=dispatcher["redis"], settings=settings
+    )
+    dispatcher.startup.register(question_queue.ensure_group)
+    # Ratings of answers whose feedback row the worker hasn't written yet
+    dispatcher["rating_relay"] = RatingRelay(redis=dispatcher["redis"])
+
+    user_cache = dispatcher["user_cache"] = UserCache(
+        redis=dispatcher["redis"],
+        ttl=settings.user_cache.ttl,
+        local_ttl=settings.user_cache.local_ttl,
+        size=settings.user_cache.size,
+    )
+
+    # Goes first: flooders are rejected before any Redis/DB work
+    dispatcher.update.outer_middleware(
+        ThrottlingMiddleware(
+            redis=dispatcher["redis"],
+            i18n=i18n_middleware,
+            rate=settings.throttling.rate,
+            burst=settings.throttling.burst,
+            lock_ttl=settings.throttling.lock_ttl,
+        )
+    )
+    # Registered instead of the default FSM middleware (disable_fsm)
+    fsm = dispatcher.fsm = BufferedFSMContextMiddleware(
+        storage=dispatcher.fsm.storage,
+        strategy=dispatcher.fsm.strategy,
+        events_isolation=dispatcher.fsm.events_isolation,
+    )
+    dispatcher.update.outer_middleware(fsm)
     dispatcher.update.outer_middleware(DBSessionMiddleware(session_pool=pool))
-    dispatcher.update.outer_middleware(UserMiddleware())
+    dispatcher.update.outer_middleware(UserMiddleware(user_cache=user_cache))
     dispatcher.update.outer_middleware(QueryMiddleware())
     dispatcher.update.outer_middleware(StateControlMiddleware())
     i18n_middleware.setup(dispatcher=dispatcher)
@@ -62,21 +96,14 @@ def create_dispatcher(settings: Settings) -> Dispatcher:
     :return: Configured ``Dispatcher`` with
     installed middlewares and included routers
     """
-    redis: Redis = Redis(
-        connection_pool=ConnectionPool(
-            host=settings.redis.host,
-            port=settings.redis.port,
-            db=settings.redis.db,
-            username=settings.redis.user,
-            password=settings.redis.password.get_secret_value(),
-        )
-    )
+    redis: Redis = create_redis(settings)
 
     dispatcher: Dispatcher = Dispatcher(
         name="main_dispatcher",
         storage=RedisStorage(
             redis=redis, json_loads=mjson.decode, json_dumps=mjson.encode
         ),
+        disable_fsm=True,
         redis=redis,
         settings=settings,
     )
@@ -86,14 +113,78 @@ def create_dispatcher(settings: Settings) -> Dispatcher:
     return dispatcher
 
 
-def create_bot(settings: Settings) -> Bot:
+def create_i18n_core() -> FluentRuntimeCore:
+    return FluentRuntimeCore(
+        path="lang/{locale}",
+        raise_key_error=False,
+        locales_map={Locale.RU: Locale.US},
+    )
+
+
+def create_session_pool(
+    settings: Settings,
+) -> async_sessionmaker[AsyncSession]:
+    return create_pool(
+        dsn=settings.postgres.build_dsn(),
+        enable_logging=settings.sqlalchemy_logging,
+        pool_size=settings.postgres.pool_size,
+        max_overflow=settings.postgres.max_overflow,
+        pool_timeout=settings.postgres.pool_timeout,
+        pool_recycle=settings.postgres.pool_recycle,
+        pool_pre_ping=settings.postgres.pool_pre_ping,
+        statement_cache_size=settings.postgres.statement_cache_size,
+        wait_warning=settings.postgres.pool_wait_warning,
+    )
+
+
+def create_question_queue(redis: Redis, settings: Settings) -> QuestionQueue:
+    return QuestionQueue(
+        redis=redis,
+        stream=settings.question_queue.stream,
+        group=settings.question_queue.group,
+        dead_letter=settings.question_queue.dead_letter,
+        max_len=settings.question_queue.max_len,
+        claim_idle=settings.question_queue.claim_idle,
+        max_deliveries=settings.question_queue.max_deliveries,
+    )
+
+
+def create_redis(settings: Settings) -> Redis:
+    return Redis(
+        connection_pool=ConnectionPool(
+            host=settings.redis.host,
+            port=settings.redis.port,
+            db=settings.redis.db,
+            username=settings.redis.user,
+            password=settings.redis.password.get_secret_value(),
+        )
+    )
+
+
+def create_bot(settings: Settings, redis: Redis) -> Bot:
     """
-    :return: Configured ``Bot`` with retry request middleware
+    :param redis: holds the request limits shared by every process
+        that sends with the bot token
+    :return: Configured ``Bot`` with retry and scheduler request
+    middlewares
     """
     session: AiohttpSession = AiohttpSession(
         json_loads=mjson.decode, json_dumps=mjson.encode
     )
     session.middleware(RetryRequestMiddleware())
+    # Inside the retry middleware: every retry waits for its turn again
+    session.middleware(
+        SchedulerRequestMiddleware(
+            RequestScheduler(
+                global_rate=settings.scheduler.global_rate,
+                chat_rate=settings.scheduler.chat_rate,
+                chat_burst=settings.scheduler.chat_burst,
+                group_rate=settings.scheduler.group_rate,
+                group_burst=settings.scheduler.group_burst,
+                redis=redis,
+            )
+        )
+    )
     return Bot(
         token=settings.bot_token.get_secret_value(),
         default=DefaultBotProperties(
@@ -4,6 +4,9 @@ from aiogram import Router
 
 from bot.filters.chat import ADMIN_ONLY
 
+from . import pool
+
 router: Final[Router] = Router(name=__name__)
 router.message.filter(ADMIN_ONLY)
 router.callback_query.filter(ADMIN_ONLY)
+router.include_routers(pool.router)
@@ -0,0 +1,22 @@
+from typing import Any, Final
+
+from aiogram import Router, html
+from aiogram.filters import Command
+from aiogram.types import Message
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from services.database.create_pool import pool_metrics
+from utils import mjson
+
+router: Final[Router] = Router(name=__name__)
+
+
+@router.message(Command("pool"))
+async def pool_status(
+    message: Message, session_pool: async_sessionmaker[AsyncSession]
+) -> Any:
+    stats = {
+        "pool": session_pool.kw["bind"].pool.status(),
+        **pool_metrics.snapshot(),
+    }
+    return await message.answer(html.pre(html.quote(mjson.encode(stats))))
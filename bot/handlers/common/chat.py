@@ -1,100 +1,50 @@
 import logging
-from typing import Any, Final
+from typing import Any, Final, Optional
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram_i18n import I18nContext
-import orjson
 
 from bot.filters import ChatStates
 from bot.keyboards import Button, common_keyboard
 from bot.filters import CallbackData as cbd
+from bot.middlewares import QuestionLock
 from services.database import Repository
-from services.qna import ask_question_with_memory, Answer
+from services.feedback_ratings import RatingRelay
+from services.question_queue import QuestionJob, QuestionQueue
 
 logger = logging.getLogger(__name__)
 router: Final[Router] = Router(name=__name__)
 
 
-async def format_response(answer: Answer, i18n: I18nContext) -> str:
-    """Format the RAG response with i18n support."""
-    response_parts = []
-
-    # Добавляем краткий ответ без дополнительного форматирования
-    response_parts.append(answer.brief_answer)
-
-    # Добавляем подробный ответ, если он есть
-    if answer.detailed_answer:
-        response_parts.append(f"\n📝 {answer.detailed_answer}")
-
-    # Добавляем источники, если они есть
-    if answer.source_references:
-        response_parts.append("\n📚 Источники:")
-        for ref in answer.source_references:
-            response_parts.append(
-                f"• Раздел {ref.section} ({ref.relevance})\n  {
-                    ref.exact_quote}"
-            )
-
-    # Добавляем шаги рассуждения, если они есть
-    if answer.thinking_steps:
-        response_parts.append("\n🤔 Ход рассуждения:")
-        for step in answer.thinking_steps:
-            response_parts.append(
-                f"• {step.reasoning}\n  Вывод: {step.conclusion}"
-            )
-
-    return "\n".join(filter(None, response_parts))
-
-
 async def process_question(
     question: str,
     message: Message,
     i18n: I18nContext,
-    state: FSMContext,
-    repository: Repository,
+    question_queue: QuestionQueue,
+    question_lock: Optional[QuestionLock] = None,
 ) -> Any:
-    """Process the question and generate answer."""
+    """
+    Queue the question for a RAG worker, which sends the answer and
+    releases the user's question lock.
+    """
     thinking_msg = await message.answer(i18n.msg.thinking())
 
     try:
-        # Get response from RAG system
-        answer = await ask_question_with_memory(question)
-
-        # Format the response
-        response_text = await format_response(answer, i18n)
-
-        await thinking_msg.delete()
-
-        # Create feedback entry
-        feedback = await repository.feedback.create_feedback(
-            user=message.from_user.id,
-            question=question,
-            answer=response_text,
-            checklist=orjson.dumps(
-                answer.checklist.model_dump(), option=orjson.OPT_INDENT_2
-            ).decode("utf-8"),
-        )
-
-        # Send response with feedback buttons
-        return await message.answer(
-            text=response_text + "\n\n" + i18n.feedback.question(),
-            reply_markup=common_keyboard(
-                rows=[
-                    (
-                        Button(
-                            i18n.btn.like(),
-                            callback_data=cbd.like.extend(feedback.id),
-                        ),
-                        Button(
-                            i18n.btn.dislike(),
-                            callback_data=cbd.dislike.extend(feedback.id),
-                        ),
-                    ),
-                    Button(i18n.btn.back(), callback_data=cbd.main),
-                ]
-            ),
+        await question_queue.enqueue(
+            QuestionJob(
+                chat_id=message.chat.id,
+                message_id=message.message_id,
+                user_id=message.from_user.id,
+                question=question,
+                locale=i18n.locale,
+                thinking_message_id=thinking_msg.message_id,
+                lock_key=question_lock.key if question_lock else None,
+                lock_token=question_lock.token if question_lock else None,
+            )
         )
+        if question_lock is not None:
+            question_lock.hand_over()
 
     except Exception as e:
         logger.error(f"Error in process_question: {str(e)}")
@@ -111,18 +61,14 @@ async def process_question(
 async def handle_question(
     message: Message,
     i18n: I18nContext,
-    state: FSMContext,
-    repository: Repository,
+    question_queue: QuestionQueue,
+    question_lock: Optional[QuestionLock] = None,
 ) -> Any:
-    data = await state.get_data()
-    if data.get("is_processing"):
-        return await message.answer(i18n.msg.busy())
-
-    await state.update_data(is_processing=True)
-
+    # Concurrent questions of the same user are rejected by
+    # ThrottlingMiddleware
     try:
         return await process_question(
-            message.text, message, i18n, state, repository
+            message.text, message, i18n, question_queue, question_lock
         )
     except Exception as e:
         logger.error(f"Error handling question: {str(e)}")
@@ -134,8 +80,6 @@ async def handle_question(
                 ]  # Изменено с cbd.back на cbd.main
             ),
         )
-    finally:
-        await state.update_data(is_processing=False)
 
 
 @router.callback_query(cbd.ask)
@@ -154,16 +98,29 @@ async def start_chat(
     )
 
 
+async def save_rating(
+    feedback_id: int,
+    rating: bool,
+    repository: Repository,
+    rating_relay: RatingRelay,
+) -> None:
+    if await repository.feedback.set_rating(feedback_id, rating) is None:
+        # The row is still queued by the worker that wrote the answer;
+        # it merges the rating into the row or logs it if the row is lost
+        await rating_relay.send(feedback_id, rating)
+
+
 @router.callback_query(cbd.like)
 async def handle_like(
     query: CallbackQuery,
     i18n: I18nContext,
     repository: Repository,
+    rating_relay: RatingRelay,
 ) -> Any:
     """Handle positive feedback."""
     try:
         feedback_id = int(query.data.split(":", 1)[1])
-        await repository.feedback.set_rating(feedback_id, True)
+        await save_rating(feedback_id, True, repository, rating_relay)
         await query.answer(i18n.feedback.like(), show_alert=True)
 
         new_markup = common_keyboard(
@@ -183,11 +140,12 @@ async def handle_dislike(
     query: CallbackQuery,
     i18n: I18nContext,
     repository: Repository,
+    rating_relay: RatingRelay,
 ) -> Any:
     """Handle negative feedback."""
     try:
         feedback_id = int(query.data.split(":", 1)[1])
-        await repository.feedback.set_rating(feedback_id, False)
+        await save_rating(feedback_id, False, repository, rating_relay)
         await query.answer(i18n.feedback.dislike(), show_alert=True)
 
         new_markup = common_keyboard(
@@ -12,7 +12,7 @@ from aiogram.filters import (
 from aiogram.types import ChatMemberUpdated
 
 if TYPE_CHECKING:
-    from services.database import DBUser, Repository
+    from services.database import DBUser, Repository, UserCache
 
 router: Final[Router] = Router(name=__name__)
 router.my_chat_member.filter(F.chat.type == ChatType.PRIVATE)
@@ -20,15 +20,25 @@ router.my_chat_member.filter(F.chat.type == ChatType.PRIVATE)
 
 @router.my_chat_member(ChatMemberUpdatedFilter(JOIN_TRANSITION))
 async def enable_notifications(
-    _: ChatMemberUpdated, user: DBUser, repository: Repository
+    _: ChatMemberUpdated,
+    user: DBUser,
+    repository: Repository,
+    user_cache: UserCache,
 ) -> Any:
-    user.notifications = True
-    await repository.commit(user)
+    updated = await repository.user.set_notifications(user.id, True)
+    if updated is not None:
+        user.notifications = updated.notifications
+        await user_cache.set(updated)
 
 
 @router.my_chat_member(ChatMemberUpdatedFilter(LEAVE_TRANSITION))
 async def disable_notifications(
-    _: ChatMemberUpdated, user: DBUser, repository: Repository
+    _: ChatMemberUpdated,
+    user: DBUser,
+    repository: Repository,
+    user_cache: UserCache,
 ) -> Any:
-    user.notifications = False
-    await repository.commit(user)
+    updated = await repository.user.set_notifications(user.id, False)
+    if updated is not None:
+        user.notifications = updated.notifications
+        await user_cache.set(updated)
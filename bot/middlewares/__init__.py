@@ -1,17 +1,35 @@
 from .outer import (
+    BufferedFSMContext,
+    BufferedFSMContextMiddleware,
     DBSessionMiddleware,
     QueryMiddleware,
+    QuestionLock,
     StateControlMiddleware,
+    ThrottlingMiddleware,
     UserManager,
     UserMiddleware,
+    release_question_lock,
+)
+from .request import (
+    RequestScheduler,
+    RetryRequestMiddleware,
+    SchedulerRequestMiddleware,
+    bulk_requests,
 )
-from .request import RetryRequestMiddleware
 
 __all__ = [
+    "BufferedFSMContext",
+    "BufferedFSMContextMiddleware",
     "DBSessionMiddleware",
     "UserManager",
     "UserMiddleware",
     "StateControlMiddleware",
+    "ThrottlingMiddleware",
+    "QuestionLock",
+    "release_question_lock",
     "RetryRequestMiddleware",
+    "RequestScheduler",
+    "SchedulerRequestMiddleware",
+    "bulk_requests",
     "QueryMiddleware",
 ]
@@ -1,13 +1,24 @@
 from .database import DBSessionMiddleware
+from .fsm import BufferedFSMContext, BufferedFSMContextMiddleware
 from .i18n import UserManager
 from .query import QueryMiddleware
 from .statecontrol import StateControlMiddleware
+from .throttling import (
+    QuestionLock,
+    ThrottlingMiddleware,
+    release_question_lock,
+)
 from .user import UserMiddleware
 
 __all__ = [
+    "BufferedFSMContext",
+    "BufferedFSMContextMiddleware",
     "DBSessionMiddleware",
     "UserManager",
     "UserMiddleware",
     "StateControlMiddleware",
+    "ThrottlingMiddleware",
+    "QuestionLock",
+    "release_question_lock",
     "QueryMiddleware",
 ]
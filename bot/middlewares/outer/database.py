@@ -29,6 +29,10 @@ class DBSessionMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: dict[str, Any],
     ) -> Any:
-        async with self.session_pool() as session:
-            data[self.repository_key] = Repository(session=session)
+        # The repository opens a session only when a handler queries it
+        repository = Repository(session_pool=self.session_pool)
+        data[self.repository_key] = repository
+        try:
             return await handler(event, data)
+        finally:
+            await repository.release()
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Mapping, Optional
+
+from aiogram import Bot
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.middleware import FSMContextMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import DEFAULT_DESTINY, StateType, StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+from aiogram.types import TelegramObject
+
+
+class BufferedFSMContext(FSMContext):
+    """
+    ``FSMContext`` that reads state and data once per update and keeps
+    them in memory. Writes only mark fields dirty; ``flush`` stores the
+    changed fields at the end of the update. With ``RedisStorage`` both
+    the load and the flush are a single pipelined round-trip.
+    """
+
+    def __init__(self, storage: Any, key: StorageKey) -> None:
+        super().__init__(storage=storage, key=key)
+        self._loaded = False
+        self._state: Optional[str] = None
+        self._data: dict[str, Any] = {}
+        self._state_dirty = False
+        self._data_dirty = False
+
+    async def _load(self) -> None:
+        if self._loaded:
+            return
+        if isinstance(self.storage, RedisStorage):
+            build = self.storage.key_builder.build
+            async with self.storage.redis.pipeline(transaction=False) as pipe:
+                pipe.get(build(self.key, "state"))
+                pipe.get(build(self.key, "data"))
+                state, data = await pipe.execute()
+            if isinstance(state, bytes):
+                state = state.decode("utf-8")
+            if isinstance(data, bytes):
+                data = data.decode("utf-8")
+            self._state = state
+            self._data = self.storage.json_loads(data) if data else {}
+        else:
+            self._state = await self.storage.get_state(key=self.key)
+            self._data = await self.storage.get_data(key=self.key)
+        self._loaded = True
+
+    async def flush(self) -> None:
+        """Stores the fields changed since the load or the last flush."""
+        if not self._state_dirty and not self._data_dirty:
+            return
+        if isinstance(self.storage, RedisStorage):
+            build = self.storage.key_builder.build
+            async with self.storage.redis.pipeline(transaction=False) as pipe:
+                if self._state_dirty:
+                    state_key = build(self.key, "state")
+                    if self._state is None:
+                        pipe.delete(state_key)
+                    else:
+                        pipe.set(
+                            state_key, self._state, ex=self.storage.state_ttl
+                        )
+                if self._data_dirty:
+                    data_key = build(self.key, "data")
+                    if not self._data:
+                        pipe.delete(data_key)
+                    else:
+                        pipe.set(
+                            data_key,
+                            self.storage.json_dumps(self._data),
+                            ex=self.storage.data_ttl,
+                        )
+                await pipe.execute()
+        else:
+            if self._state_dirty:
+                await self.storage.set_state(key=self.key, state=self._state)
+            if self._data_dirty:
+                await self.storage.set_data(key=self.key, data=self._data)
+        self._state_dirty = self._data_dirty = False
+
+    async def get_state(self) -> Optional[str]:
+        await self._load()
+        return self._state
+
+    async def set_state(self, state: StateType = None) -> None:
+        await self._load()
+        value = state.state if isinstance(state, State) else state
+        if value != self._state:
+            self._state = value
+            self._state_dirty = True
+
+    async def get_data(self) -> dict[str, Any]:
+        await self._load()
+        return self._data.copy()
+
+    async def get_value(self, key: str, default: Any = None) -> Any:
+        await self._load()
+        return self._data.get(key, default)
+
+    async def set_data(self, data: Mapping[str, Any]) -> None:
+        await self._load()
+        if data != self._data:
+            self._data = dict(data)
+            self._data_dirty = True
+
+    async def update_data(
+        self, data: Optional[Mapping[str, Any]] = None, **kwargs: Any
+    ) -> dict[str, Any]:
+        await self._load()
+        updated = {**self._data, **(data or {}), **kwargs}
+        await self.set_data(updated)
+        return updated.copy()
+
+    async def clear(self) -> None:
+        await self.set_state(None)
+        await self.set_data({})
+
+
+class BufferedFSMContextMiddleware(FSMContextMiddleware):
+    """
+    Replaces the dispatcher's FSM middleware: handlers receive a
+    ``BufferedFSMContext`` that is flushed once the update is handled.
+    """
+
+    def get_context(
+        self,
+        bot: Bot,
+        chat_id: int,
+        user_id: int,
+        thread_id: Optional[int] = None,
+        business_connection_id: Optional[str] = None,
+        destiny: str = DEFAULT_DESTINY,
+    ) -> FSMContext:
+        return BufferedFSMContext(
+            storage=self.storage,
+            key=StorageKey(
+                user_id=user_id,
+                chat_id=chat_id,
+                bot_id=bot.id,
+                thread_id=thread_id,
+                business_connection_id=business_connection_id,
+                destiny=destiny,
+            ),
+        )
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        async def handle_and_flush(
+            event: TelegramObject, data: dict[str, Any]
+        ) -> Any:
+            try:
+                return await handler(event, data)
+            finally:
+                state = data.get("state")
+                if isinstance(state, BufferedFSMContext):
+                    await state.flush()
+
+        return await super().__call__(handle_and_flush, event, data)
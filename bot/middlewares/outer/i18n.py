@@ -6,7 +6,7 @@ from aiogram.types import User
 from aiogram_i18n.managers import BaseManager
 
 if TYPE_CHECKING:
-    from services.database import DBUser, Repository
+    from services.database import DBUser, Repository, UserCache
 
 
 class UserManager(BaseManager):
@@ -22,7 +22,13 @@ class UserManager(BaseManager):
         return cast(str, self.default_locale)
 
     async def set_locale(
-        self, locale: str, user: DBUser, repository: Repository
+        self,
+        locale: str,
+        user: DBUser,
+        repository: Repository,
+        user_cache: UserCache,
     ) -> None:
-        user.locale = locale
-        await repository.commit(user)
+        updated = await repository.user.set_locale(user.id, locale)
+        if updated is not None:
+            user.locale = updated.locale
+            await user_cache.set(updated)
@@ -21,7 +21,7 @@ class StateControlMiddleware(BaseMiddleware):
     ) -> Any:
         state: FSMContext = data["state"]
 
-        logger.debug("State: %s", await state.get_state())
+        logger.debug("State: %s", data.get("raw_state"))
 
         if isinstance(event, CallbackQuery):
             await state.set_state(ChatStates.ReadyToRespond)
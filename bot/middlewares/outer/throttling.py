@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import logging
+from secrets import token_hex
+from typing import Any, Awaitable, Callable, Final, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update, User
+from aiogram_i18n import I18nMiddleware
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY_PREFIX: Final[str] = "lock:question"
+BUCKET_KEY_PREFIX: Final[str] = "throttle"
+
+# Refills the bucket by the time elapsed since the previous call and
+# takes one token. Redis time is used so that every bot process shares
+# the same clock. Returns 1 if the token was taken.
+TOKEN_BUCKET_SCRIPT: Final[str] = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(now - ts, 0) * rate / 1000)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", now)
+redis.call("PEXPIRE", KEYS[1], math.ceil(burst / rate * 1000))
+return allowed
+"""
+
+# Deletes the lock only if it is still held by the caller: an expired
+# lock may already belong to the next question
+RELEASE_LOCK_SCRIPT: Final[str] = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class QuestionLock:
+    """
+    The in-flight lock of the current question, available to handlers
+    as ``question_lock``. A handler that passes the question on (e.g.
+    to a worker) calls ``hand_over``; the new owner releases the lock
+    with ``release_question_lock``.
+    """
+
+    key: str
+    token: str
+    handed_over: bool
+
+    __slots__ = ("key", "token", "handed_over")
+
+    def __init__(self, key: str, token: str) -> None:
+        self.key = key
+        self.token = token
+        self.handed_over = False
+
+    def hand_over(self) -> None:
+        self.handed_over = True
+
+
+async def release_question_lock(redis: Redis, key: str, token: str) -> None:
+    await redis.eval(RELEASE_LOCK_SCRIPT, 1, key, token)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Rejects updates before any other work is done: a per-user token
+    bucket limits the update rate, and a text message is handled only
+    while no other question of the same user is in flight. The lock
+    expires by itself after ``lock_ttl`` seconds, so a crashed handler
+    can't leave the user busy.
+    """
+
+    redis: Redis
+    i18n: I18nMiddleware
+    rate: float
+    burst: int
+    lock_ttl: float
+
+    __slots__ = (
+        "redis",
+        "i18n",
+        "rate",
+        "burst",
+        "lock_ttl",
+        "_take_token",
+        "_release_lock",
+    )
+
+    def __init__(
+        self,
+        redis: Redis,
+        i18n: I18nMiddleware,
+        rate: float = 1.0,
+        burst: int = 5,
+        lock_ttl: float = 300,
+    ) -> None:
+        self.redis = redis
+        self.i18n = i18n
+        self.rate = rate
+        self.burst = burst
+        self.lock_ttl = lock_ttl
+        self._take_token = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        self._release_lock = redis.register_script(RELEASE_LOCK_SCRIPT)
+
+    def _text(self, key: str, user: User) -> str:
+        locale = user.language_code
+        if locale not in self.i18n.core.available_locales:
+            locale = self.i18n.core.default_locale
+        return self.i18n.core.get(key, locale)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user: Optional[User] = data.get("event_from_user")
+        if user is None or not isinstance(event, Update):
+            return await handler(event, data)
+
+        allowed = await self._take_token(
+            keys=[f"{BUCKET_KEY_PREFIX}:{user.id}"],
+            args=[self.rate, self.burst],
+        )
+        if not allowed:
+            logger.debug("Update from %d dropped by rate limit", user.id)
+            if event.callback_query:
+                # Stops the button spinner; messages are dropped silently
+                # so a flood doesn't get a reply per message
+                await event.callback_query.answer(
+                    self._text("msg-slow-down", user)
+                )
+            return None
+
+        message = event.message
+        if message is None or not message.text or message.text[0] == "/":
+            return await handler(event, data)
+
+        lock_key = f"{LOCK_KEY_PREFIX}:{user.id}"
+        token = token_hex(16)
+        locked = await self.redis.set(
+            lock_key, token, nx=True, px=int(self.lock_ttl * 1000)
+        )
+        if not locked:
+            return await message.answer(self._text("msg-busy", user))
+        lock = data["question_lock"] = QuestionLock(lock_key, token)
+        try:
+            return await handler(event, data)
+        finally:
+            if not lock.handed_over:
+                await self._release_lock(keys=[lock_key], args=[token])
@@ -7,10 +7,17 @@ from aiogram.types import Chat, TelegramObject, User
 from aiogram_i18n import I18nMiddleware
 
 if TYPE_CHECKING:
-    from services.database import Repository
+    from services.database import Repository, UserCache
 
 
 class UserMiddleware(BaseMiddleware):
+    user_cache: UserCache
+
+    __slots__ = ("user_cache",)
+
+    def __init__(self, user_cache: UserCache) -> None:
+        self.user_cache = user_cache
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
@@ -24,19 +31,24 @@ class UserMiddleware(BaseMiddleware):
             # when accepting chat_join_request and receiving chat_member.
             return await handler(event, data)
 
-        repository: Repository = data["repository"]
-        user = await repository.user.get(id=aiogram_user.id)
+        # Returning users are served from the cache without a DB query
+        user = await self.user_cache.get(aiogram_user.id)
         if user is None:
-            i18n: I18nMiddleware = data["i18n_middleware"]
-            user = await repository.user.create_from_telegram(
-                user=aiogram_user,
-                locale=(
-                    aiogram_user.language_code
-                    if aiogram_user.language_code in i18n.core.available_locales
-                    else cast(str, i18n.core.default_locale)
-                ),
-                chat=chat,
-            )
+            repository: Repository = data["repository"]
+            user = await repository.user.get(id=aiogram_user.id)
+            if user is None:
+                i18n: I18nMiddleware = data["i18n_middleware"]
+                user = await repository.user.create_from_telegram(
+                    user=aiogram_user,
+                    locale=(
+                        aiogram_user.language_code
+                        if aiogram_user.language_code
+                        in i18n.core.available_locales
+                        else cast(str, i18n.core.default_locale)
+                    ),
+                    chat=chat,
+                )
+            await self.user_cache.set(user)
         data["user"] = user
 
         return await handler(event, data)
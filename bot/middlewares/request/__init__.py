@@ -1,3 +1,13 @@
 from .retry import RetryRequestMiddleware
+from .scheduler import (
+    RequestScheduler,
+    SchedulerRequestMiddleware,
+    bulk_requests,
+)
 
-__all__ = ["RetryRequestMiddleware"]
+__all__ = [
+    "RetryRequestMiddleware",
+    "RequestScheduler",
+    "SchedulerRequestMiddleware",
+    "bulk_requests",
+]
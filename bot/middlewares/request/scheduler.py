@@ -0,0 +1,451 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Final, Iterator, Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_CALLBACK: Final[int] = 0
+PRIORITY_DEFAULT: Final[int] = 1
+PRIORITY_BULK: Final[int] = 2
+# Idle per-chat buckets are dropped once there are more of them
+MAX_CHAT_BUCKETS: Final[int] = 10_000
+SHARED_KEY_PREFIX: Final[str] = "scheduler"
+
+# KEYS are the global bucket followed by chat buckets, ARGV holds the
+# rate and burst of each key and then, per request, the position of its
+# chat bucket in KEYS (0 for none). Requests take a token from the
+# global and their chat bucket in order: a request whose chat bucket is
+# empty is skipped, an empty global bucket stops the batch. Returns,
+# per request, the milliseconds until its chat bucket has a token (0 if
+# the tokens were taken, -1 if the request wasn't reached), followed by
+# the milliseconds until the global bucket has one.
+SHARED_TAKE_SCRIPT: Final[str] = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local rates, bursts, tokens = {}, {}, {}
+for i, key in ipairs(KEYS) do
+    rates[i] = tonumber(ARGV[i * 2 - 1])
+    bursts[i] = tonumber(ARGV[i * 2])
+    local bucket = redis.call("HMGET", key, "tokens", "ts")
+    local value = tonumber(bucket[1]) or bursts[i]
+    local ts = tonumber(bucket[2]) or now
+    tokens[i] = math.min(
+        bursts[i], value + math.max(now - ts, 0) * rates[i] / 1000
+    )
+end
+local results, global_wait = {}, 0
+for r = #KEYS * 2 + 1, #ARGV do
+    local chat = tonumber(ARGV[r])
+    local wait = -1
+    if global_wait == 0 then
+        if tokens[1] < 1 then
+            global_wait = math.ceil((1 - tokens[1]) * 1000 / rates[1])
+        elseif chat > 0 and tokens[chat] < 1 then
+            wait = math.ceil((1 - tokens[chat]) * 1000 / rates[chat])
+        else
+            tokens[1] = tokens[1] - 1
+            if chat > 0 then
+                tokens[chat] = tokens[chat] - 1
+            end
+            wait = 0
+        end
+    end
+    results[#results + 1] = wait
+end
+results[#results + 1] = global_wait
+for i, key in ipairs(KEYS) do
+    redis.call("HSET", key, "tokens", tostring(tokens[i]), "ts", now)
+    local ttl = math.ceil((bursts[i] - tokens[i]) * 1000 / rates[i])
+    redis.call("PEXPIRE", key, math.max(ttl, 1))
+end
+return results
+"""
+
+# Puts the bucket into debt so that its next token is available in
+# ARGV[3] milliseconds; a longer pause already in place is kept
+SHARED_PAUSE_SCRIPT: Final[str] = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local tokens = 1 - tonumber(ARGV[3]) * rate / 1000
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "ts")
+if bucket[1] then
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(
+        tokens, tonumber(bucket[1]) + math.max(now - ts, 0) * rate / 1000
+    )
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", now)
+redis.call("PEXPIRE", KEYS[1], math.ceil((burst - tokens) * 1000 / rate))
+return 0
+"""
+
+ChatId = Union[int, str]
+Waiter = tuple[int, int, Optional[ChatId], asyncio.Future[None]]
+
+request_priority: ContextVar[int] = ContextVar(
+    "request_priority", default=PRIORITY_DEFAULT
+)
+
+
+@contextmanager
+def bulk_requests() -> Iterator[None]:
+    """
+    Requests made inside are sent after all interactive ones, e.g. for
+    broadcasts and admin notifications.
+    """
+    token = request_priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+class TokenBucket:
+    rate: float
+    capacity: float
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at", "paused_until")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(now - max(self.updated_at, self.paused_until), 0)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = max(now, self.updated_at)
+
+    def delay(self, now: float) -> float:
+        """:return: seconds until a token can be taken"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def refund(self) -> None:
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds: float) -> None:
+        # The API accepts a request once retry_after has passed, so one
+        # token is available right at resume
+        self.tokens = min(self.capacity, 1)
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        return self.delay(now) == 0 and self.tokens >= self.capacity
+
+
+class SharedBuckets:
+    """
+    Copies of the scheduler's token buckets in Redis, shared by every
+    process that sends requests with the same bot token (webhook and
+    RAG workers). Redis time is used, so the processes share a clock.
+    """
+
+    redis: Redis
+
+    __slots__ = ("redis", "_take", "_pause")
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+        self._take = redis.register_script(SHARED_TAKE_SCRIPT)
+        self._pause = redis.register_script(SHARED_PAUSE_SCRIPT)
+
+    @staticmethod
+    def _key(chat_id: Optional[ChatId]) -> str:
+        if chat_id is None:
+            return f"{SHARED_KEY_PREFIX}:global"
+        return f"{SHARED_KEY_PREFIX}:chat:{chat_id}"
+
+    async def take(
+        self,
+        global_bucket: TokenBucket,
+        requests: list[tuple[Optional[ChatId], Optional[TokenBucket]]],
+    ) -> tuple[list[Optional[float]], float]:
+        """
+        Takes tokens for a batch of requests in one round-trip.
+
+        :param requests: the chat and the chat bucket of each request
+        :return: per request, seconds until its chat bucket has a token
+            (zero if the tokens were taken, ``None`` if the request
+            wasn't reached), and seconds until the global bucket has one
+        """
+        keys = [self._key(None)]
+        args: list[float] = [global_bucket.rate, global_bucket.capacity]
+        positions: dict[ChatId, int] = {}
+        for chat_id, bucket in requests:
+            if chat_id is None or bucket is None or chat_id in positions:
+                continue
+            keys.append(self._key(chat_id))
+            args += [bucket.rate, bucket.capacity]
+            positions[chat_id] = len(keys)
+        args += [positions.get(chat_id, 0) for chat_id, _ in requests]
+        *waits, global_wait = await self._take(keys=keys, args=args)
+        return [
+            None if int(wait) < 0 else int(wait) / 1000 for wait in waits
+        ], int(global_wait) / 1000
+
+    async def pause(
+        self, chat_id: Optional[ChatId], bucket: TokenBucket, seconds: float
+    ) -> None:
+        await self._pause(
+            keys=[self._key(chat_id)],
+            args=[bucket.rate, bucket.capacity, int(seconds * 1000)],
+        )
+
+
+class RequestScheduler:
+    """
+    Grants Bot API requests in priority order while keeping within a
+    global and a per-chat token bucket. A request blocked by its chat
+    doesn't hold back requests to other chats.
+
+    The buckets are per process. Several processes sending with one
+    bot token pass ``redis`` to keep within the limits together: a
+    request is granted only once the shared buckets in Redis allow it
+    as well. If Redis fails, only the local limits apply.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        group_rate: float = 20 / 60,
+        group_burst: float = 3,
+        redis: Optional[Redis] = None,
+    ) -> None:
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: dict[ChatId, TokenBucket] = {}
+        self._waiters: list[Waiter] = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task[None]] = None
+        self._shared = SharedBuckets(redis) if redis is not None else None
+
+    def _bucket(self, chat_id: Optional[ChatId]) -> Optional[TokenBucket]:
+        if chat_id is None:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Groups and channels (negative ids, usernames) are limited
+            # much harder than private chats
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            else:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _prune(self, now: float) -> None:
+        if len(self._chats) <= MAX_CHAT_BUCKETS:
+            return
+        for chat_id, bucket in list(self._chats.items()):
+            if bucket.is_idle(now):
+                del self._chats[chat_id]
+
+    def _collect(self) -> tuple[list[Waiter], list[Waiter], float]:
+        """
+        Pops the requests the local buckets allow and takes their
+        tokens.
+
+        :return: these requests, the requests left waiting and seconds
+            until the local buckets allow the next one
+        """
+        now = time.monotonic()
+        delay = float("inf")
+        blocked_chats: set[Optional[ChatId]] = set()
+        ready: list[Waiter] = []
+        deferred: list[Waiter] = []
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)
+            _, _, chat_id, future = waiter
+            if future.done():
+                continue
+            if chat_id in blocked_chats:
+                # Keeps requests to one chat in order
+                deferred.append(waiter)
+                continue
+            global_delay = self._global.delay(now)
+            if global_delay > 0:
+                deferred.append(waiter)
+                delay = min(delay, global_delay)
+                break
+            bucket = self._bucket(chat_id)
+            chat_delay = bucket.delay(now) if bucket is not None else 0.0
+            if chat_delay > 0:
+                blocked_chats.add(chat_id)
+                deferred.append(waiter)
+                delay = min(delay, chat_delay)
+                continue
+            self._global.take()
+            if bucket is not None:
+                bucket.take()
+            ready.append(waiter)
+        return ready, deferred, delay
+
+    async def _take_shared(
+        self, ready: list[Waiter]
+    ) -> tuple[list[Waiter], list[Waiter], float]:
+        """
+        Takes the shared tokens of the requests in one round-trip.
+
+        :return: the requests to grant, the requests refused by the
+            shared buckets and seconds until those allow the next one
+        """
+        if self._shared is None or not ready:
+            return ready, [], float("inf")
+        requests = [
+            (chat_id, self._bucket(chat_id)) for _, _, chat_id, _ in ready
+        ]
+        try:
+            waits, global_wait = await self._shared.take(self._global, requests)
+        except RedisError as e:
+            logger.warning("Shared rate limit unavailable: %s", e)
+            return ready, [], float("inf")
+        granted: list[Waiter] = []
+        refused: list[Waiter] = []
+        delay = global_wait if global_wait > 0 else float("inf")
+        for waiter, (_, bucket), wait in zip(ready, requests, waits):
+            if wait == 0:
+                granted.append(waiter)
+                continue
+            # Not sent yet, so the local tokens are given back
+            self._global.refund()
+            if bucket is not None:
+                bucket.refund()
+            refused.append(waiter)
+            if wait is not None:
+                delay = min(delay, wait)
+        return granted, refused, delay
+
+    async def _grant(self) -> float:
+        """
+        Grants every request that can be sent now.
+
+        :return: seconds until the next request can be granted
+        """
+        ready, deferred, delay = self._collect()
+        granted, refused, shared_delay = await self._take_shared(ready)
+        for _, _, _, future in granted:
+            if not future.done():
+                future.set_result(None)
+        for waiter in deferred + refused:
+            heapq.heappush(self._waiters, waiter)
+        self._prune(time.monotonic())
+        return min(delay, shared_delay)
+
+    async def _run(self) -> None:
+        while True:
+            delay = await self._grant()
+            self._wakeup.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    self._wakeup.wait(),
+                    timeout=None if delay == float("inf") else delay,
+                )
+
+    async def acquire(self, chat_id: Optional[ChatId], priority: int) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._waiters, (priority, next(self._counter), chat_id, future)
+        )
+        self._wakeup.set()
+        await future
+
+    async def pause(self, chat_id: Optional[ChatId], seconds: float) -> None:
+        """
+        Stops granting requests to the chat (or all requests when the
+        chat is unknown) for the given time.
+        """
+        bucket = self._bucket(chat_id) or self._global
+        bucket.pause(seconds)
+        self._wakeup.set()
+        if self._shared is not None:
+            try:
+                await self._shared.pause(
+                    chat_id if bucket is not self._global else None,
+                    bucket,
+                    seconds,
+                )
+            except RedisError as e:
+                logger.warning("Shared rate limit unavailable: %s", e)
+
+
+class SchedulerRequestMiddleware(BaseRequestMiddleware):
+    """
+    Holds outgoing requests until the Bot API limits allow them.
+    Callback answers go first, requests inside ``bulk_requests`` go
+    last. Requests without a chat (``getUpdates``, webhook setup) are
+    not limited.
+    """
+
+    scheduler: RequestScheduler
+
+    __slots__ = ("scheduler",)
+
+    def __init__(self, scheduler: Optional[RequestScheduler] = None) -> None:
+        self.scheduler = scheduler or RequestScheduler()
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id: Optional[ChatId] = getattr(method, "chat_id", None)
+        if isinstance(method, AnswerCallbackQuery):
+            priority = PRIORITY_CALLBACK
+        elif chat_id is not None:
+            priority = request_priority.get()
+        else:
+            return await make_request(bot, method)
+
+        await self.scheduler.acquire(chat_id, priority)
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            # Every queued request to the same chat waits, not only the
+            # one that hit the limit
+            logger.warning(
+                "Flood control for chat %s, pausing for %s seconds",
+                chat_id,
+                e.retry_after,
+            )
+            await self.scheduler.pause(chat_id, e.retry_after)
+            raise
@@ -1,5 +1,12 @@
 from __future__ import annotations
 
+import asyncio
+import gc
+import os
+import signal
+import time
+from typing import Optional
+
 from aiogram import Bot, Dispatcher, loggers
 from aiogram.webhook import aiohttp_server as server
 from aiohttp import web
@@ -44,7 +51,7 @@ def run_polling(dispatcher: Dispatcher, bot: Bot) -> None:
     return dispatcher.run_polling(bot)
 
 
-def run_webhook(dispatcher: Dispatcher, bot: Bot) -> None:
+def _create_webhook_app(dispatcher: Dispatcher, bot: Bot) -> web.Application:
     app = web.Application()
     server.SimpleRequestHandler(
         dispatcher=dispatcher,
@@ -55,6 +62,11 @@ def run_webhook(dispatcher: Dispatcher, bot: Bot) -> None:
         app, dispatcher, bot=bot, reset_webhook=settings.webhook.reset
     )
     app.update(**dispatcher.workflow_data, bot=bot)
+    return app
+
+
+def run_webhook(dispatcher: Dispatcher, bot: Bot) -> None:
+    app = _create_webhook_app(dispatcher, bot)
 
     dispatcher.startup.register(webhook_startup)
     dispatcher.shutdown.register(webhook_shutdown)
@@ -65,3 +77,130 @@ def run_webhook(dispatcher: Dispatcher, bot: Bot) -> None:
         port=settings.webhook.port,
         print=MultilineLogger(),
     )
+
+
+def _serve_webhook_worker(dispatcher: Dispatcher, bot: Bot) -> None:
+    # The supervisor's handlers are inherited; aiohttp installs its own
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    web.run_app(
+        app=_create_webhook_app(dispatcher, bot),
+        host=settings.webhook.host,
+        port=settings.webhook.port,
+        reuse_port=True,
+        shutdown_timeout=settings.webhook.shutdown_timeout,
+        print=None,
+    )
+
+
+def _spawn_webhook_worker(dispatcher: Dispatcher, bot: Bot) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        _serve_webhook_worker(dispatcher, bot)
+    except BaseException:
+        loggers.webhook.exception("Webhook worker %d crashed", os.getpid())
+        code = 1
+    finally:
+        os._exit(code)
+
+
+async def _setup_webhook(dispatcher: Dispatcher, bot: Bot) -> None:
+    await webhook_startup(dispatcher, bot)
+    await bot.session.close()
+
+
+class _WebhookSupervisor:
+    """
+    Keeps the forked webhook workers running: restarts crashed ones
+    and, once stopped, waits for them to drain within the deadline.
+    """
+
+    __slots__ = ("dispatcher", "bot", "children", "deadline")
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot) -> None:
+        self.dispatcher = dispatcher
+        self.bot = bot
+        # Worker pid -> start time
+        self.children: dict[int, float] = {}
+        # Set once stopping: workers still alive after it are killed
+        self.deadline: Optional[float] = None
+
+    @property
+    def stopping(self) -> bool:
+        return self.deadline is not None
+
+    def spawn(self) -> None:
+        pid = _spawn_webhook_worker(self.dispatcher, self.bot)
+        self.children[pid] = time.monotonic()
+
+    def stop(self, signum: int, _: object) -> None:
+        if self.stopping:
+            return
+        # A small margin over the workers' own drain timeout
+        self.deadline = time.monotonic() + settings.webhook.shutdown_timeout + 5
+        loggers.webhook.info("Draining %d webhook workers", len(self.children))
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+
+    def _kill_overdue(self) -> None:
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            for pid in self.children:
+                os.kill(pid, signal.SIGKILL)
+
+    def _reap(self, pid: int, status: int) -> None:
+        started_at = self.children.pop(pid, None)
+        if started_at is None or self.stopping:
+            return
+        loggers.webhook.error(
+            "Webhook worker %d exited with code %d, restarting",
+            pid,
+            os.waitstatus_to_exitcode(status),
+        )
+        # Don't spin if a worker dies right after start
+        time.sleep(max(0.0, 1 - (time.monotonic() - started_at)))
+        if not self.stopping:
+            self.spawn()
+
+    def run(self, workers: int) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(workers):
+            self.spawn()
+        loggers.webhook.info(
+            "Serving webhook on %s:%d with %d workers",
+            settings.webhook.host,
+            settings.webhook.port,
+            workers,
+        )
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                self._kill_overdue()
+                time.sleep(0.2)
+                continue
+            self._reap(pid, status)
+
+
+def run_webhook_workers(dispatcher: Dispatcher, bot: Bot, workers: int) -> None:
+    """
+    Serves the webhook from ``workers`` forked processes that share the
+    port through ``SO_REUSEPORT``; the kernel spreads connections
+    between them. FSM state, locks and the outgoing request limits live
+    in Redis, so any worker can handle any update.
+
+    The supervisor sets the webhook once, restarts crashed workers and,
+    on SIGTERM/SIGINT, lets every worker finish its requests within
+    ``WEBHOOK_SHUTDOWN_TIMEOUT`` before killing it.
+    """
+    asyncio.run(_setup_webhook(dispatcher, bot))
+    # Modules, translations and settings are loaded by now: keep their
+    # pages shared with the workers instead of copied by GC writes
+    gc.freeze()
+
+    _WebhookSupervisor(dispatcher, bot).run(workers)
+
+    if settings.webhook.reset:
+        asyncio.run(webhook_shutdown(bot))
@@ -1,6 +1,7 @@
 from secrets import token_urlsafe
+from typing import Optional
 
-from pydantic import Field, SecretStr
+from pydantic import Field, SecretStr, model_validator
 from pydantic_settings import BaseSettings as _BaseSettings
 from pydantic_settings import SettingsConfigDict
 from sqlalchemy import URL
@@ -19,6 +20,15 @@ class PostgresSettings(BaseSettings, env_prefix="POSTGRES_"):
     user: str
     password: SecretStr
 
+    pool_size: int = 10
+    max_overflow: int = 10
+    pool_timeout: float = 30
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    statement_cache_size: int = 100
+    # Checkouts waiting longer than this (seconds) are logged
+    pool_wait_warning: float = 1.0
+
     def build_dsn(self) -> URL:
         return URL.create(
             drivername="postgresql+asyncpg",
@@ -38,6 +48,53 @@ class RedisSettings(BaseSettings, env_prefix="REDIS_"):
     password: SecretStr
 
 
+class UserCacheSettings(BaseSettings, env_prefix="USER_CACHE_"):
+    ttl: int = 3600
+    # Seconds a process keeps its own copy; with several webhook workers
+    # a change made by one worker (e.g. the locale) reaches the others
+    # only after this
+    local_ttl: float = 5
+    size: int = 10_000
+
+
+class FeedbackSettings(BaseSettings, env_prefix="FEEDBACK_"):
+    batch_size: int = 100
+    flush_interval: float = 1.0
+    max_pending: int = 10_000
+
+
+class ThrottlingSettings(BaseSettings, env_prefix="THROTTLING_"):
+    # Token bucket per user: updates per second and the burst allowed
+    rate: float = 1.0
+    burst: int = 5
+    # Seconds after which a question lock expires if never released;
+    # must exceed QUESTION_QUEUE_CLAIM_IDLE so the lock outlives a job
+    # waiting to be taken over from a crashed worker
+    lock_ttl: float = 300
+
+
+class RequestSchedulerSettings(BaseSettings, env_prefix="SCHEDULER_"):
+    # Outgoing Bot API requests per second and bursts allowed
+    global_rate: float = 30
+    chat_rate: float = 1
+    chat_burst: float = 3
+    group_rate: float = 20 / 60
+    group_burst: float = 3
+
+
+class QuestionQueueSettings(BaseSettings, env_prefix="QUESTION_QUEUE_"):
+    stream: str = "questions"
+    group: str = "rag-workers"
+    dead_letter: str = "questions:dead"
+    max_len: int = 10_000
+    # Seconds a job may stay unacknowledged before another worker
+    # takes it over; must exceed the longest answer time
+    claim_idle: float = 180
+    max_deliveries: int = 3
+    # Questions answered concurrently by one worker process
+    concurrency: int = 4
+
+
 class WebhookSettings(BaseSettings, env_prefix="WEBHOOK_"):
     use: bool
     reset: bool
@@ -46,6 +103,11 @@ class WebhookSettings(BaseSettings, env_prefix="WEBHOOK_"):
     port: int
     host: str
     secret_token: SecretStr = Field(default_factory=token_urlsafe)
+    # Processes serving the webhook; more than one forks workers that
+    # share the port (Linux SO_REUSEPORT)
+    workers: int = 1
+    # Seconds a stopping worker waits for requests in progress
+    shutdown_timeout: float = 30
 
     def build_url(self) -> str:
         return f"{self.base_url}{self.path}"
@@ -58,11 +120,30 @@ class Settings(BaseSettings):
 
     admin_ids: str
     time_zone: str
+    # Worker id for time-based ids; claimed from Redis if not set
+    snowflake_worker_id: Optional[int] = None
 
     postgres: PostgresSettings = Field(default_factory=PostgresSettings)
     redis: RedisSettings = Field(default_factory=RedisSettings)
+    user_cache: UserCacheSettings = Field(default_factory=UserCacheSettings)
+    feedback: FeedbackSettings = Field(default_factory=FeedbackSettings)
+    throttling: ThrottlingSettings = Field(default_factory=ThrottlingSettings)
+    question_queue: QuestionQueueSettings = Field(
+        default_factory=QuestionQueueSettings
+    )
+    scheduler: RequestSchedulerSettings = Field(
+        default_factory=RequestSchedulerSettings
+    )
     webhook: WebhookSettings = Field(default_factory=WebhookSettings)
 
+    @model_validator(mode="after")
+    def check_lock_ttl(self) -> "Settings":
+        if self.throttling.lock_ttl <= self.question_queue.claim_idle:
+            raise ValueError(
+                "THROTTLING_LOCK_TTL must exceed QUESTION_QUEUE_CLAIM_IDLE"
+            )
+        return self
+
     def get_admin_ids(self) -> list[int]:
         return [
             int(admin_id)
@@ -0,0 +1,306 @@
+"""
+RAG worker: answers questions queued by the bot.
+
+Run one or more processes with ``python -m bot.worker``. Each one reads
+jobs from the question stream, runs the ``services.qna`` pipeline and
+sends the answer through the Bot API, so the bot process itself never
+loads the embedding model or waits for the LLM.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import signal
+import socket
+from typing import Any
+
+import orjson
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram_i18n.cores import FluentRuntimeCore
+from redis.asyncio import Redis
+
+from bot.enums import Locale
+from bot.factories import (
+    create_bot,
+    create_i18n_core,
+    create_question_queue,
+    create_redis,
+    create_session_pool,
+)
+from bot.filters import CallbackData as cbd
+from bot.keyboards import Button, common_keyboard
+from bot.middlewares import release_question_lock
+from bot.settings import settings
+from services.database import FeedbackQueue
+from services.feedback_ratings import RatingRelay
+from services.qna import Answer, ask_question_with_memory
+from services.question_queue import QuestionJob, QuestionQueue
+from utils.loggers import setup_logger
+from utils.snowflake import claim_worker_id, next_id, snowflake
+
+logger = logging.getLogger(__name__)
+
+
+def format_response(answer: Answer) -> str:
+    """Format the RAG response."""
+    response_parts = []
+
+    # Добавляем краткий ответ без дополнительного форматирования
+    response_parts.append(answer.brief_answer)
+
+    # Добавляем подробный ответ, если он есть
+    if answer.detailed_answer:
+        response_parts.append(f"\n📝 {answer.detailed_answer}")
+
+    # Добавляем источники, если они есть
+    if answer.source_references:
+        response_parts.append("\n📚 Источники:")
+        for ref in answer.source_references:
+            response_parts.append(
+                f"• Раздел {ref.section} ({ref.relevance})\n"
+                f"  {ref.exact_quote}"
+            )
+
+    # Добавляем шаги рассуждения, если они есть
+    if answer.thinking_steps:
+        response_parts.append("\n🤔 Ход рассуждения:")
+        for step in answer.thinking_steps:
+            response_parts.append(
+                f"• {step.reasoning}\n  Вывод: {step.conclusion}"
+            )
+
+    return "\n".join(filter(None, response_parts))
+
+
+class RagWorker:
+    """
+    Answers jobs from the question queue with ``concurrency`` consumers.
+    A failed job is retried right away until it was delivered
+    ``max_deliveries`` times, then moved to the dead-letter stream and
+    the user gets an error message. Jobs of a crashed worker are taken
+    over by the others once they stay unacknowledged for ``claim_idle``.
+
+    Feedback rows are written behind the answers, so a rating can reach
+    the bot before the row is in the database; the bot then relays it
+    here and it is merged into the queued row.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        redis: Redis,
+        core: FluentRuntimeCore,
+        queue: QuestionQueue,
+        feedback_queue: FeedbackQueue,
+        ratings: RatingRelay,
+        concurrency: int = 4,
+    ) -> None:
+        self.bot = bot
+        self.redis = redis
+        self.core = core
+        self.queue = queue
+        self.feedback_queue = feedback_queue
+        self.ratings = ratings
+        self.concurrency = concurrency
+        self.name = f"{socket.gethostname()}-{os.getpid()}"
+        self._stopping = asyncio.Event()
+
+    def _text(self, key: str, job: QuestionJob, **kwargs: Any) -> str:
+        return self.core.get(key, job.locale, **kwargs)
+
+    async def _delete_thinking(self, job: QuestionJob) -> None:
+        if job.thinking_message_id is None:
+            return
+        # Already deleted by a previous delivery of the job
+        with contextlib.suppress(TelegramBadRequest):
+            await self.bot.delete_message(
+                chat_id=job.chat_id, message_id=job.thinking_message_id
+            )
+
+    async def _release(self, job: QuestionJob) -> None:
+        if job.lock_key and job.lock_token:
+            await release_question_lock(
+                self.redis, job.lock_key, job.lock_token
+            )
+
+    async def answer(self, job: QuestionJob, feedback_id: int) -> None:
+        answer = await ask_question_with_memory(job.question)
+        response_text = format_response(answer)
+
+        # Inserted in the background together with other rows; a retry
+        # of the job replaces the queued row instead of adding one
+        self.feedback_queue.put(
+            feedback_id=feedback_id,
+            user=job.user_id,
+            question=job.question,
+            answer=response_text,
+            checklist=orjson.dumps(
+                answer.checklist.model_dump(), option=orjson.OPT_INDENT_2
+            ).decode("utf-8"),
+        )
+        await self._delete_thinking(job)
+        await self.bot.send_message(
+            chat_id=job.chat_id,
+            text=response_text + "\n\n" + self._text("feedback-question", job),
+            reply_markup=common_keyboard(
+                rows=[
+                    (
+                        Button(
+                            self._text("btn-like", job),
+                            callback_data=cbd.like.extend(feedback_id),
+                        ),
+                        Button(
+                            self._text("btn-dislike", job),
+                            callback_data=cbd.dislike.extend(feedback_id),
+                        ),
+                    ),
+                    Button(self._text("btn-back", job), callback_data=cbd.main),
+                ]
+            ),
+        )
+
+    async def fail(self, job: QuestionJob, error: Exception) -> None:
+        await self.queue.dead_letter(job, f"{type(error).__name__}: {error}")
+        await self._release(job)
+        await self._delete_thinking(job)
+        await self.bot.send_message(
+            chat_id=job.chat_id,
+            text=self._text("msg-error", job),
+            reply_markup=common_keyboard(
+                rows=[
+                    Button(self._text("btn-back", job), callback_data=cbd.main)
+                ]
+            ),
+        )
+
+    async def handle(self, job: QuestionJob, consumer: str) -> None:
+        feedback_id = next_id()
+        while True:
+            if job.deliveries > self.queue.max_deliveries:
+                # Claimed from a worker that kept crashing on it
+                await self.fail(job, RuntimeError("Delivery limit exceeded"))
+                return
+            try:
+                await self.answer(job, feedback_id)
+            except Exception as e:
+                logger.exception(
+                    "Job %s failed (delivery %d)", job.entry_id, job.deliveries
+                )
+                if job.deliveries >= self.queue.max_deliveries:
+                    await self.fail(job, e)
+                    return
+                await asyncio.sleep(job.deliveries)
+                job = await self.queue.retry(job, consumer)
+                continue
+            await self.queue.ack(job)
+            await self._release(job)
+            return
+
+    async def consume(self, consumer: str) -> None:
+        while not self._stopping.is_set():
+            try:
+                jobs = await self.queue.read(consumer, count=1)
+            except Exception:
+                logger.exception("Failed to read the question queue")
+                await asyncio.sleep(1)
+                continue
+            for job in jobs:
+                try:
+                    await self.handle(job, consumer)
+                except Exception:
+                    # The job stays pending and is claimed again later
+                    logger.exception("Failed to finish job %s", job.entry_id)
+
+    async def apply_rating(self, block: float) -> bool:
+        """:return: ``False`` if there was no rating to apply"""
+        received = await self.ratings.receive(snowflake.worker_id, block)
+        if received is None:
+            return False
+        feedback_id, rating = received
+        if not await self.feedback_queue.set_rating(feedback_id, rating):
+            logger.warning("Rating of missing feedback %d dropped", feedback_id)
+        return True
+
+    async def consume_ratings(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await self.apply_rating(block=1)
+            except Exception:
+                logger.exception("Failed to apply a feedback rating")
+                await asyncio.sleep(1)
+
+    async def drain_ratings(self) -> None:
+        try:
+            while await self.apply_rating(block=0):
+                pass
+        except Exception:
+            logger.exception("Failed to apply a feedback rating")
+
+    def stop(self) -> None:
+        """Finishes the jobs in progress and stops reading new ones."""
+        self._stopping.set()
+
+    async def run(self) -> None:
+        await self.queue.ensure_group()
+        await self.feedback_queue.start()
+        logger.info(
+            "Worker %s started with %d consumers", self.name, self.concurrency
+        )
+        try:
+            await asyncio.gather(
+                self.consume_ratings(),
+                *(
+                    self.consume(f"{self.name}-{index}")
+                    for index in range(self.concurrency)
+                ),
+            )
+        finally:
+            # Ratings sent while the last jobs were finishing
+            await self.drain_ratings()
+            await self.feedback_queue.close()
+
+
+async def run_worker() -> None:
+    redis = create_redis(settings)
+    # Replicas all run as PID 1, so the default pid-based id would repeat
+    worker_id = await claim_worker_id(redis, settings.snowflake_worker_id)
+    logger.info("Feedback ids use worker id %d", worker_id)
+    bot = create_bot(settings, redis=redis)
+    core = create_i18n_core()
+    await core.startup()
+    core.default_locale = Locale.DEFAULT
+    worker = RagWorker(
+        bot=bot,
+        redis=redis,
+        core=core,
+        queue=create_question_queue(redis=redis, settings=settings),
+        feedback_queue=FeedbackQueue(
+            session_pool=create_session_pool(settings),
+            batch_size=settings.feedback.batch_size,
+            flush_interval=settings.feedback.flush_interval,
+            max_pending=settings.feedback.max_pending,
+        ),
+        ratings=RatingRelay(redis),
+        concurrency=settings.question_queue.concurrency,
+    )
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        await bot.session.close()
+        await redis.aclose()
+
+
+def main() -> None:
+    setup_logger()
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ start =
 msg-ask = 💭 Задайте ваш вопрос о работе с программным обеспечением
 msg-thinking = 🔍
 msg-busy = ⏳ Я все еще обрабатываю ваш предыдущий вопрос. Пожалуйста, подождите.
+msg-slow-down = ⏳ Слишком много запросов. Пожалуйста, подождите немного.
 msg-error = ❌ Произошла ошибка при обработке вашего вопроса. Пожалуйста, попробуйте еще раз.
 
 answer-brief = 🤖 {$text}
@@ -0,0 +1,46 @@
+"""
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+
+from typing import Optional, Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "004"
+down_revision: Optional[str] = "003"
+branch_labels: Optional[Sequence[str]] = None
+depends_on: Optional[Sequence[str]] = None
+
+
+def upgrade() -> None:
+    # Feedback ids are generated by the bot (time-based 64-bit ids)
+    op.alter_column(
+        "feedback",
+        "id",
+        existing_type=sa.Integer(),
+        type_=sa.BigInteger(),
+        existing_nullable=False,
+        server_default=None,
+    )
+    op.execute("DROP SEQUENCE IF EXISTS feedback_id_seq")
+
+
+def downgrade() -> None:
+    # Fails once the table holds bot-generated ids: they don't fit INTEGER
+    op.execute(
+        "CREATE SEQUENCE IF NOT EXISTS feedback_id_seq OWNED BY feedback.id"
+    )
+    op.alter_column(
+        "feedback",
+        "id",
+        existing_type=sa.BigInteger(),
+        type_=sa.Integer(),
+        existing_nullable=False,
+        server_default=sa.text("nextval('feedback_id_seq'::regclass)"),
+    )
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+import chromadb
+from chromadb.errors import ChromaError
+
+ALIAS_SUFFIX = ".alias"
+# get_collection для несуществующей коллекции: ValueError в старых
+# версиях chromadb, наследники ChromaError в новых
+MISSING_COLLECTION_ERRORS = (ValueError, ChromaError)
+
+
+def alias_name(name: str) -> str:
+    return f"{name}{ALIAS_SUFFIX}"
+
+
+def versioned_name(name: str, version: Optional[int] = None) -> str:
+    return f"{name}.v{version or int(time.time())}"
+
+
+async def read_alias(
+    chroma_client: chromadb.AsyncClientAPI, name: str
+) -> Dict[str, Any]:
+    # Алиас - пустая коллекция, цель хранится в ее метаданных. Чтение
+    # ничего не создает: путь запросов бота только читает Chroma
+    try:
+        alias = await chroma_client.get_collection(alias_name(name))
+    except MISSING_COLLECTION_ERRORS:
+        return {}
+    return dict(alias.metadata or {})
+
+
+async def resolve_alias(
+    chroma_client: chromadb.AsyncClientAPI, name: str
+) -> str:
+    # До первой blue/green-переиндексации алиаса нет, и используется
+    # коллекция с базовым именем
+    return (await read_alias(chroma_client, name)).get("target") or name
+
+
+async def switch_alias(
+    chroma_client: chromadb.AsyncClientAPI, name: str, target: str
+) -> str:
+    """
+    Переключает алиас на коллекцию target одним обновлением метаданных
+    и возвращает коллекцию, на которую он указывал раньше.
+    """
+    alias = await chroma_client.get_or_create_collection(alias_name(name))
+    previous = (alias.metadata or {}).get("target") or name
+    await alias.modify(
+        metadata={
+            "target": target,
+            "previous": previous,
+            "switched_at": time.time(),
+        }
+    )
+    return previous
+
+
+class AliasResolver:
+    """
+    Коллекция, на которую указывает алиас, с коротким TTL: после
+    переключения читатели переходят на новую коллекцию не позже чем
+    через ttl секунд, а между перечитываниями запросов к алиасу нет.
+    """
+
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self._collection = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self, chroma_client: chromadb.AsyncClientAPI):
+        """Возвращает None, пока процессор не создал коллекцию."""
+        if time.monotonic() >= self._expires_at:
+            async with self._lock:
+                if time.monotonic() >= self._expires_at:
+                    target = await resolve_alias(chroma_client, self.name)
+                    # Коллекция перечитывается и без смены алиаса: ее могли
+                    # пересоздать с другой проекцией под тем же именем
+                    try:
+                        self._collection = await chroma_client.get_collection(
+                            target
+                        )
+                    except MISSING_COLLECTION_ERRORS:
+                        self._collection = None
+                    self._expires_at = time.monotonic() + self.ttl
+        return self._collection
@@ -1,4 +1,6 @@
+from .cache import UserCache
 from .create_pool import create_pool
+from .feedback_queue import FeedbackQueue
 from .models import Base, DBUser, DBFeedback
 from .repositories import Repository, UserRepository
 
@@ -8,5 +10,7 @@ __all__ = [
     "DBFeedback",
     "Repository",
     "UserRepository",
+    "UserCache",
+    "FeedbackQueue",
     "create_pool",
 ]
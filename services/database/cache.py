@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Final, Optional
+
+from redis.asyncio import Redis
+from sqlalchemy.orm import make_transient_to_detached
+
+from utils import mjson
+
+from .models import DBUser
+
+USER_KEY_PREFIX: Final[str] = "user"
+
+
+class UserCache:
+    """
+    Two-level cache of ``DBUser`` snapshots: an in-process TTL LRU in
+    front of Redis. Every read returns a fresh detached ``DBUser``, so
+    handlers can modify it and save it with ``repository.commit`` as
+    before; writers must call ``set`` afterwards (write-through).
+
+    ``set`` refreshes the local copy of the calling process only: other
+    processes serve their copy for up to ``local_ttl`` seconds.
+    """
+
+    redis: Redis
+    ttl: int
+    local_ttl: float
+    size: int
+
+    __slots__ = ("redis", "ttl", "local_ttl", "size", "_local")
+
+    def __init__(
+        self,
+        redis: Redis,
+        ttl: int = 3600,
+        local_ttl: float = 5,
+        size: int = 10_000,
+    ) -> None:
+        self.redis = redis
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.size = size
+        self._local: OrderedDict[int, tuple[float, dict[str, Any]]] = (
+            OrderedDict()
+        )
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"{USER_KEY_PREFIX}:{user_id}"
+
+    @staticmethod
+    def _snapshot(user: DBUser) -> dict[str, Any]:
+        return {
+            "id": user.id,
+            "name": user.name,
+            "locale": user.locale,
+            "notifications": user.notifications,
+            "created_at": user.created_at.isoformat(),
+            "updated_at": user.updated_at.isoformat(),
+        }
+
+    @staticmethod
+    def _restore(snapshot: dict[str, Any]) -> DBUser:
+        user = DBUser(
+            id=snapshot["id"],
+            name=snapshot["name"],
+            locale=snapshot["locale"],
+            notifications=snapshot["notifications"],
+            created_at=datetime.fromisoformat(snapshot["created_at"]),
+            updated_at=datetime.fromisoformat(snapshot["updated_at"]),
+        )
+        # Detached with an identity key: adding it to a session later
+        # issues an UPDATE of the changed columns instead of an INSERT
+        make_transient_to_detached(user)
+        return user
+
+    def _remember(self, user_id: int, snapshot: dict[str, Any]) -> None:
+        self._local[user_id] = (time.monotonic() + self.local_ttl, snapshot)
+        self._local.move_to_end(user_id)
+        while len(self._local) > self.size:
+            self._local.popitem(last=False)
+
+    async def get(self, user_id: int) -> Optional[DBUser]:
+        cached = self._local.get(user_id)
+        if cached is not None:
+            expires_at, snapshot = cached
+            if expires_at > time.monotonic():
+                self._local.move_to_end(user_id)
+                return self._restore(snapshot)
+            del self._local[user_id]
+
+        raw = await self.redis.get(self._key(user_id))
+        if raw is None:
+            return None
+        snapshot = mjson.decode(raw)
+        self._remember(user_id, snapshot)
+        return self._restore(snapshot)
+
+    async def set(self, user: DBUser) -> None:
+        snapshot = self._snapshot(user)
+        self._remember(user.id, snapshot)
+        await self.redis.set(
+            self._key(user.id), mjson.encode_bytes(snapshot), ex=self.ttl
+        )
+
+    async def invalidate(self, user_id: int) -> None:
+        self._local.pop(user_id, None)
+        await self.redis.delete(self._key(user_id))
@@ -1,15 +1,93 @@
 from __future__ import annotations
 
+import time
+from collections import deque
+from typing import Any, Final
+
 from sqlalchemy import URL
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
+
+from utils.loggers import database as logger
+
+WAIT_WINDOW: Final[int] = 1000
+
+
+class PoolMetrics:
+    """
+    How long sessions wait for a connection from the pool. Growing
+    waits mean the pool is exhausted by sessions holding connections.
+    """
+
+    warn_after: float
+
+    __slots__ = ("warn_after", "checkouts", "total_wait", "max_wait", "_waits")
+
+    def __init__(self, warn_after: float = 1.0) -> None:
+        self.warn_after = warn_after
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._waits: deque[float] = deque(maxlen=WAIT_WINDOW)
+
+    def observe(self, wait: float) -> None:
+        self.checkouts += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self._waits.append(wait)
+        if wait >= self.warn_after:
+            logger.warning("Waited %.2fs for a database connection", wait)
+
+    def snapshot(self) -> dict[str, Any]:
+        waits = sorted(self._waits)
+        p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0
+        return {
+            "checkouts": self.checkouts,
+            "wait_avg_ms": round(
+                self.total_wait / max(self.checkouts, 1) * 1000, 2
+            ),
+            "wait_p95_ms": round(p95 * 1000, 2),
+            "wait_max_ms": round(self.max_wait * 1000, 2),
+        }
+
+
+pool_metrics: Final[PoolMetrics] = PoolMetrics()
+
+
+class MeasuredQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self) -> ConnectionPoolEntry:
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_metrics.observe(time.perf_counter() - started)
 
 
 def create_pool(
-    dsn: str | URL, enable_logging: bool = False
+    dsn: str | URL,
+    enable_logging: bool = False,
+    pool_size: int = 10,
+    max_overflow: int = 10,
+    pool_timeout: float = 30,
+    pool_recycle: int = 1800,
+    pool_pre_ping: bool = True,
+    statement_cache_size: int = 100,
+    wait_warning: float = 1.0,
 ) -> async_sessionmaker[AsyncSession]:
-    engine = create_async_engine(url=dsn, echo=enable_logging)
+    pool_metrics.warn_after = wait_warning
+    engine = create_async_engine(
+        url=dsn,
+        echo=enable_logging,
+        poolclass=MeasuredQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+        connect_args={"prepared_statement_cache_size": statement_cache_size},
+    )
     return async_sessionmaker(engine, expire_on_commit=False)
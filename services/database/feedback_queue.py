@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from typing import Any, Final, Iterable, Optional
+
+from sqlalchemy.exc import IntegrityError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from utils.loggers import database as logger
+from utils.snowflake import next_id
+
+from .repositories import FeedbackRepository
+
+# Errors after which the same rows may succeed later
+RETRYABLE_ERRORS: Final = (
+    OperationalError,
+    InterfaceError,
+    OSError,
+    asyncio.TimeoutError,
+)
+
+
+class FeedbackQueue:
+    """
+    Write-behind queue for feedback rows. ``put`` assigns a time-based
+    id right away, so the answer with like/dislike buttons can be sent
+    before the row reaches the database. Rows are inserted in bulk when
+    ``batch_size`` rows are queued, every ``flush_interval`` seconds
+    and on shutdown. Ratings for rows still in the queue are merged
+    into them instead of being written separately. A failed insert is
+    retried only when the database was unreachable; rows it rejects
+    are logged and dropped.
+    """
+
+    session_pool: async_sessionmaker[AsyncSession]
+    batch_size: int
+    flush_interval: float
+    max_pending: int
+
+    def __init__(
+        self,
+        session_pool: async_sessionmaker[AsyncSession],
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_pending: int = 10_000,
+    ) -> None:
+        self.session_pool = session_pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: dict[int, dict[str, Any]] = {}
+        self._in_flight: set[int] = set()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task[None]] = None
+
+    def put(
+        self,
+        user: int,
+        question: str,
+        answer: str,
+        checklist: Optional[str] = None,
+        feedback_id: Optional[int] = None,
+    ) -> int:
+        """
+        :param feedback_id: id of a row queued before, e.g. by a failed
+            attempt to answer the same question; the row is replaced
+        """
+        if feedback_id is None:
+            feedback_id = next_id()
+        self._pending[feedback_id] = {
+            "id": feedback_id,
+            "user": user,
+            "question": question,
+            "answer": answer,
+            "checklist": checklist,
+            "is_helpful": None,
+        }
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return feedback_id
+
+    async def set_rating(self, feedback_id: int, rating: bool) -> bool:
+        """
+        Merges the rating into the queued row, or updates the row in the
+        database if it was inserted already.
+
+        :return: ``False`` if there is no such row, e.g. it was dropped
+        """
+        if self._merge_rating(feedback_id, rating):
+            return True
+        if feedback_id in self._in_flight:
+            # The row is being inserted right now: wait for the insert
+            # so the UPDATE finds it
+            async with self._flush_lock:
+                pass
+            if self._merge_rating(feedback_id, rating):
+                # The insert failed and the row went back to the queue
+                return True
+        return await self._update_rating(feedback_id, rating)
+
+    def _merge_rating(self, feedback_id: int, rating: bool) -> bool:
+        row = self._pending.get(feedback_id)
+        if row is None:
+            return False
+        row["is_helpful"] = rating
+        return True
+
+    async def _update_rating(self, feedback_id: int, rating: bool) -> bool:
+        async with self.session_pool() as session:
+            updated = await FeedbackRepository(session=session).set_rating(
+                feedback_id, rating
+            )
+        return updated is not None
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            rows, self._pending = self._pending, {}
+            self._in_flight = set(rows)
+            try:
+                try:
+                    await self._insert(rows.values())
+                except IntegrityError:
+                    # One invalid row fails the whole batch
+                    await self._insert_each(rows.values())
+            except RETRYABLE_ERRORS as e:
+                # Keep the rows for the next attempt, dropping the oldest
+                # ones if the database stays unavailable for too long
+                self._pending = {**rows, **self._pending}
+                overflow = len(self._pending) - self.max_pending
+                for feedback_id in list(self._pending)[: max(overflow, 0)]:
+                    del self._pending[feedback_id]
+                logger.error(
+                    "Failed to insert %d feedback rows (%d dropped): %s",
+                    len(rows),
+                    max(overflow, 0),
+                    e,
+                )
+            except Exception:
+                logger.exception(
+                    "Failed to insert %d feedback rows, dropping them",
+                    len(rows),
+                )
+            finally:
+                self._in_flight = set()
+
+    async def _insert(self, rows: Iterable[dict[str, Any]]) -> None:
+        # Rows of a batch that was committed before the connection broke
+        # come back with the retry; only a rating merged in the meantime
+        # is written to them
+        async with self.session_pool() as session:
+            await FeedbackRepository(session=session).insert_batch(rows)
+
+    async def _insert_each(self, rows: Iterable[dict[str, Any]]) -> None:
+        for row in rows:
+            try:
+                await self._insert([row])
+            except IntegrityError as e:
+                logger.error("Dropped feedback row %d: %s", row["id"], e)
+
+    async def _run(self) -> None:
+        while True:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    self._wakeup.wait(), timeout=self.flush_interval
+                )
+            self._wakeup.clear()
+            # Cancellation on shutdown must not interrupt an insert
+            await asyncio.shield(self.flush())
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
@@ -2,13 +2,18 @@ from sqlalchemy import BigInteger, Text, Boolean
 from sqlalchemy.orm import Mapped, mapped_column
 from typing import Optional
 
-from .base import Base
+from utils.snowflake import next_id
+
+from .base import Base, Int64
 
 
 class DBFeedback(Base):
     __tablename__ = "feedback"
 
-    id: Mapped[int] = mapped_column(primary_key=True)
+    # Generated by the bot, so the id is known before the row is written
+    id: Mapped[Int64] = mapped_column(
+        primary_key=True, autoincrement=False, default=next_id
+    )
     user: Mapped[int] = mapped_column(BigInteger)
     question: Mapped[str] = mapped_column(Text)
     answer: Mapped[str] = mapped_column(Text)
@@ -3,16 +3,24 @@ from __future__ import annotations
 from typing import (
     TYPE_CHECKING,
     Any,
+    AsyncIterator,
     Generic,
+    Iterable,
     Optional,
     Sequence,
     Type,
     TypeVar,
 )
 
+from sqlalchemy import exists, insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from utils.timeflow import now_tz
+
+from ..models.base import TimestampMixin
+
 if TYPE_CHECKING:
     from ..models import Base
 
@@ -35,12 +43,105 @@ class BaseRepository(Generic[T]):
             await self._session.delete(instance)
         await self._session.commit()
 
-    async def get(self, **filters: dict[str, Any]) -> Optional[T]:
+    async def get(self, **filters: Any) -> Optional[T]:
         query = select(self._entity).filter_by(**filters)
         result = await self._session.execute(query)
         return result.scalars().first()
 
-    async def get_many(self, **filters: dict[str, Any]) -> Sequence[T]:
+    async def get_many(self, **filters: Any) -> Sequence[T]:
+        """Loads all matching rows at once; use ``stream`` for big sets."""
         query = select(self._entity).filter_by(**filters)
         result = await self._session.execute(query)
         return result.scalars().all()
+
+    async def exists(self, **filters: Any) -> bool:
+        query = select(exists(select(self._entity).filter_by(**filters)))
+        return bool(await self._session.scalar(query))
+
+    async def stream(
+        self, yield_per: int = 1000, **filters: Any
+    ) -> AsyncIterator[T]:
+        """
+        Iterates over matching rows through a server-side cursor,
+        holding at most ``yield_per`` rows in memory. The session keeps
+        its connection until the iteration ends.
+        """
+        query = (
+            select(self._entity)
+            .filter_by(**filters)
+            .execution_options(yield_per=yield_per)
+        )
+        result = await self._session.stream_scalars(query)
+        async for instance in result:
+            yield instance
+
+    async def update_where(
+        self, values: dict[str, Any], **filters: Any
+    ) -> Sequence[T]:
+        """
+        Updates matching rows with a single ``UPDATE ... RETURNING``.
+
+        :return: the updated rows, empty if nothing matched
+        """
+        values = dict(values)
+        if issubclass(self._entity, TimestampMixin):
+            # ORM events don't fire for bulk statements
+            values.setdefault("updated_at", now_tz())
+        query = (
+            update(self._entity)
+            .filter_by(**filters)
+            .values(**values)
+            .returning(self._entity)
+            .execution_options(populate_existing=True)
+        )
+        result = await self._session.scalars(query)
+        instances = result.all()
+        await self._session.commit()
+        return instances
+
+    async def upsert(
+        self,
+        values: dict[str, Any],
+        index_elements: Sequence[str] = ("id",),
+        update_fields: Optional[Iterable[str]] = None,
+    ) -> Optional[T]:
+        """
+        ``INSERT ... ON CONFLICT`` in one round-trip.
+
+        :param update_fields: columns overwritten on conflict, all given
+            except ``index_elements`` by default; empty to keep the
+            existing row untouched
+        :return: the inserted or updated row, ``None`` if the row
+            already existed and nothing was updated
+        """
+        query = pg_insert(self._entity).values(**values)
+        if update_fields is None:
+            update_fields = [key for key in values if key not in index_elements]
+        update_fields = list(update_fields)
+        if update_fields:
+            set_ = {key: query.excluded[key] for key in update_fields}
+            if issubclass(self._entity, TimestampMixin):
+                set_.setdefault("updated_at", now_tz())
+            query = query.on_conflict_do_update(
+                index_elements=list(index_elements), set_=set_
+            )
+        else:
+            query = query.on_conflict_do_nothing(
+                index_elements=list(index_elements)
+            )
+        result = await self._session.scalars(
+            query.returning(self._entity).execution_options(
+                populate_existing=True
+            )
+        )
+        instance = result.first()
+        await self._session.commit()
+        return instance
+
+    async def insert_many(self, rows: Iterable[dict[str, Any]]) -> None:
+        """Inserts many rows with batched multi-row ``INSERT``."""
+        rows = list(rows)
+        if not rows:
+            return
+        await self._session.execute(insert(self._entity), rows)
+        await self._session.commit()
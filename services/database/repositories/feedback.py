@@ -1,4 +1,7 @@
-from typing import Optional
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from ..models import DBFeedback
 from .base import BaseRepository
@@ -7,31 +10,33 @@ from .base import BaseRepository
 class FeedbackRepository(BaseRepository[DBFeedback]):
     _entity = DBFeedback
 
-    async def create_feedback(
-        self,
-        user: int,  # Изменено с DBUser на int
-        question: str,
-        answer: str,
-        checklist: Optional[str] = None,  # Добавлен параметр checklist
-    ) -> DBFeedback:
-        """Create new feedback entry."""
-        feedback = DBFeedback(
-            user=user,  # Изменено с user_id на user
-            question=question,
-            answer=answer,
-            checklist=checklist,  # Добавлено поле checklist
-        )
-        await self.commit(feedback)
-        return feedback
-
     async def set_rating(
         self,
         feedback_id: int,
         rating: bool,
     ) -> Optional[DBFeedback]:
         """Update feedback rating."""
-        feedback = await self.get(id=feedback_id)
-        if feedback:
-            feedback.is_helpful = rating  # Изменено с rating на is_helpful
-            await self.commit(feedback)
-        return feedback
+        updated = await self.update_where(
+            {"is_helpful": rating}, id=feedback_id
+        )
+        return updated[0] if updated else None
+
+    async def insert_batch(self, rows: Iterable[dict[str, Any]]) -> None:
+        """
+        Inserts queued rows. A row that already exists keeps its
+        content; its rating is set only if the queued row has one.
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        query = pg_insert(DBFeedback)
+        query = query.on_conflict_do_update(
+            index_elements=[DBFeedback.id],
+            set_={
+                "is_helpful": func.coalesce(
+                    query.excluded.is_helpful, DBFeedback.is_helpful
+                )
+            },
+        )
+        await self._session.execute(query, rows)
+        await self._session.commit()
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from ..models import Base
 from .user import UserRepository
@@ -10,21 +12,54 @@ from .feedback import FeedbackRepository
 class Repository:
     """
     The general repository.
+
+    The session is opened on first use, so updates that never touch
+    the database never check out a connection. ``release`` returns the
+    connection to the pool (e.g. before a slow external call); the next
+    query checks out a new one.
     """
 
-    user: UserRepository
-    feedback: FeedbackRepository
+    _user: Optional[UserRepository]
+    _feedback: Optional[FeedbackRepository]
+
+    def __init__(self, session_pool: async_sessionmaker[AsyncSession]) -> None:
+        self._session_pool = session_pool
+        self._session: Optional[AsyncSession] = None
+        self._user = None
+        self._feedback = None
 
-    def __init__(self, session: AsyncSession) -> None:
-        self._session = session
-        self.user = UserRepository(session=session)
-        self.feedback = FeedbackRepository(session=session)
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._session_pool()
+        return self._session
+
+    @property
+    def user(self) -> UserRepository:
+        if self._user is None:
+            self._user = UserRepository(session=self.session)
+        return self._user
+
+    @property
+    def feedback(self) -> FeedbackRepository:
+        if self._feedback is None:
+            self._feedback = FeedbackRepository(session=self.session)
+        return self._feedback
 
     async def commit(self, *instances: Base) -> None:
-        self._session.add_all(instances)
-        await self._session.commit()
+        self.session.add_all(instances)
+        await self.session.commit()
 
     async def delete(self, *instances: Base) -> None:
         for instance in instances:
-            await self._session.delete(instance)
-        await self._session.commit()
+            await self.session.delete(instance)
+        await self.session.commit()
+
+    async def release(self) -> None:
+        """
+        Ends the current transaction (uncommitted changes are rolled
+        back) and returns its connection to the pool. Loaded objects
+        stay usable as detached instances.
+        """
+        if self._session is not None:
+            await self._session.close()
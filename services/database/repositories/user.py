@@ -1,3 +1,5 @@
+from typing import Optional
+
 from aiogram.enums import ChatType
 from aiogram.types import Chat, User
 
@@ -11,11 +13,32 @@ class UserRepository(BaseRepository[DBUser]):
     async def create_from_telegram(
         self, user: User, locale: str, chat: Chat
     ) -> DBUser:
-        db_user: DBUser = DBUser(
-            id=user.id,
-            name=user.full_name,
-            locale=locale,
-            notifications=chat.type == ChatType.PRIVATE,
+        # Two first updates of the same user may race here: the loser
+        # of the INSERT gets nothing back and reads the winner's row
+        db_user = await self.upsert(
+            {
+                "id": user.id,
+                "name": user.full_name,
+                "locale": locale,
+                "notifications": chat.type == ChatType.PRIVATE,
+            },
+            update_fields=(),
         )
-        await self.commit(db_user)
+        if db_user is None:
+            db_user = await self.get(id=user.id)
+        if db_user is None:
+            # Deleted between the INSERT and the SELECT
+            raise LookupError(f"User {user.id} was deleted while being created")
         return db_user
+
+    async def set_locale(self, user_id: int, locale: str) -> Optional[DBUser]:
+        updated = await self.update_where({"locale": locale}, id=user_id)
+        return updated[0] if updated else None
+
+    async def set_notifications(
+        self, user_id: int, enabled: bool
+    ) -> Optional[DBUser]:
+        updated = await self.update_where(
+            {"notifications": enabled}, id=user_id
+        )
+        return updated[0] if updated else None
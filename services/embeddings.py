@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import os
+import statistics
+import time
+from typing import Any, Dict, List, Protocol
+
+import numpy as np
+import orjson
+
+TORCH = "torch"
+ONNX = "onnx"
+
+
+class Encoder(Protocol):
+    backend: str
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray: ...
+
+
+class TorchEncoder:
+    backend = TORCH
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        )
+
+
+def model_directory(directory: str, model_name: str) -> str:
+    return os.path.join(directory, model_name.replace("/", "--"))
+
+
+def export_onnx(model_name: str, directory: str, quantize: bool = False) -> str:
+    """
+    Экспортирует SentenceTransformer целиком (трансформер, пулинг,
+    нормализация) в ONNX один раз; повторные вызовы берут готовый файл.
+    При quantize дополнительно строится динамически квантованная
+    int8-версия весов.
+    """
+    target = model_directory(directory, model_name)
+    model_path = os.path.join(target, "model.onnx")
+
+    if not os.path.exists(model_path):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(model_name, device="cpu").eval()
+        sample = model.tokenizer(["export"], return_tensors="pt")
+        input_names = list(sample.keys())
+
+        class SentenceEmbedding(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.model = model
+
+            def forward(self, *inputs):
+                features = dict(zip(input_names, inputs))
+                return self.model(features)["sentence_embedding"]
+
+        os.makedirs(target, exist_ok=True)
+        # Несколько процессов могут экспортировать одновременно
+        tmp_path = f"{model_path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                SentenceEmbedding(),
+                tuple(sample[name] for name in input_names),
+                tmp_path,
+                input_names=input_names,
+                output_names=["sentence_embedding"],
+                dynamic_axes={
+                    **{
+                        name: {0: "batch", 1: "sequence"}
+                        for name in input_names
+                    },
+                    "sentence_embedding": {0: "batch"},
+                },
+                opset_version=17,
+            )
+        model.tokenizer.save_pretrained(target)
+        with open(os.path.join(target, "encoder.json"), "wb") as file:
+            file.write(
+                orjson.dumps(
+                    {
+                        "model_name": model_name,
+                        "max_seq_length": model.max_seq_length,
+                        "input_names": input_names,
+                    }
+                )
+            )
+        os.replace(tmp_path, model_path)
+
+    if not quantize:
+        return model_path
+
+    quantized_path = os.path.join(target, "model.int8.onnx")
+    if not os.path.exists(quantized_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        tmp_path = f"{quantized_path}.{os.getpid()}.tmp"
+        quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, quantized_path)
+    return quantized_path
+
+
+class OnnxEncoder:
+    backend = ONNX
+
+    def __init__(
+        self,
+        model_name: str,
+        directory: str,
+        quantize: bool = False,
+        threads: int = 0,
+    ):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        model_path = export_onnx(model_name, directory, quantize)
+        target = os.path.dirname(model_path)
+        with open(os.path.join(target, "encoder.json"), "rb") as file:
+            config = orjson.loads(file.read())
+        self.max_length = config["max_seq_length"]
+        self.input_names = config["input_names"]
+        self.tokenizer = AutoTokenizer.from_pretrained(target)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        # Один запрос - одна сессия: параллелизм внутри операторов,
+        # а не между ними; 0 - по числу ядер
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            batch = self.tokenizer(
+                texts[start : start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            feeds = {
+                name: batch[name].astype(np.int64) for name in self.input_names
+            }
+            outputs.append(self.session.run(None, feeds)[0])
+        if not outputs:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.concatenate(outputs)
+
+
+def load_encoder(
+    model_name: str,
+    backend: str = TORCH,
+    onnx_dir: str = ".cache/onnx",
+    quantize: bool = False,
+    threads: int = 0,
+) -> Encoder:
+    if backend == TORCH:
+        return TorchEncoder(model_name)
+    if backend == ONNX:
+        return OnnxEncoder(model_name, onnx_dir, quantize, threads)
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def benchmark(
+    encoder: Encoder, texts: List[str], batch_size: int = 32, queries: int = 50
+) -> Dict[str, Any]:
+    # Задержка одиночного запроса (как у бота) и пропускная способность
+    # батчами (как у обработчика документов)
+    encoder.encode(texts[:1])
+    latencies = []
+    for text in texts[:queries]:
+        started = time.perf_counter()
+        encoder.encode([text])
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    encoder.encode(texts, batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+    return {
+        "backend": encoder.backend,
+        "latency_ms_p50": round(statistics.median(latencies), 2),
+        "latency_ms_p95": round(_percentile(latencies, 95), 2),
+        "texts_per_second": round(len(texts) / max(elapsed, 1e-9), 1),
+    }
+
+
+def compare_backends(
+    reference: Encoder, candidate: Encoder, texts: List[str]
+) -> Dict[str, Any]:
+    expected = reference.encode(texts)
+    actual = candidate.encode(texts)
+    cosine = np.sum(expected * actual, axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    )
+    return {
+        "texts": len(texts),
+        "cosine_min": round(float(cosine.min()), 6),
+        "cosine_mean": round(float(cosine.mean()), 6),
+    }
@@ -0,0 +1,50 @@
+from typing import Optional, Tuple
+
+import orjson
+from redis.asyncio import Redis
+
+from utils.snowflake import worker_of
+
+RATINGS_KEY_PREFIX = "feedback:ratings"
+
+
+def ratings_key(worker_id: int) -> str:
+    return f"{RATINGS_KEY_PREFIX}:{worker_id}"
+
+
+class RatingRelay:
+    """
+    Доставляет оценку ответа воркеру, который его дал: пока строка
+    отзыва ждет в его очереди отложенной записи, в базе ее еще нет.
+    Воркер определяется по идентификатору отзыва. Оценки, которые
+    никто не забрал (воркер остановлен), удаляются через ttl секунд.
+    """
+
+    def __init__(self, redis: Redis, ttl: float = 3600):
+        self.redis = redis
+        self.ttl = ttl
+
+    async def send(self, feedback_id: int, rating: bool) -> None:
+        key = ratings_key(worker_of(feedback_id))
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, orjson.dumps([feedback_id, rating]))
+            pipe.expire(key, int(self.ttl))
+            await pipe.execute()
+
+    async def receive(
+        self, worker_id: int, block: float = 0
+    ) -> Optional[Tuple[int, bool]]:
+        """
+        Следующая оценка для воркера; ждет до block секунд, при block=0
+        возвращает None сразу, если оценок нет.
+        """
+        key = ratings_key(worker_id)
+        if block > 0:
+            item = await self.redis.blpop([key], timeout=block)
+            raw = item[1] if item else None
+        else:
+            raw = await self.redis.lpop(key)
+        if raw is None:
+            return None
+        feedback_id, rating = orjson.loads(raw)
+        return feedback_id, rating
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Optional
+
+import numpy as np
+
+INT8_LIMIT = 127
+
+
+@dataclass(frozen=True)
+class Projection:
+    """
+    PCA-проекция эмбеддингов в меньшую размерность с необязательным
+    скалярным квантованием в int8. Одна и та же проекция применяется
+    к чанкам при загрузке и к запросам при поиске.
+    """
+
+    id: str
+    mean: np.ndarray
+    components: np.ndarray
+    scales: Optional[np.ndarray] = None
+
+    @property
+    def dim(self) -> int:
+        return int(self.components.shape[0])
+
+    @property
+    def quantization(self) -> str:
+        return "int8" if self.scales is not None else "none"
+
+    @classmethod
+    def fit(
+        cls, embeddings: np.ndarray, dim: int, quantize: bool = False
+    ) -> Projection:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        dim = min(dim, *vectors.shape)
+        mean = vectors.mean(axis=0)
+        _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+        components = np.ascontiguousarray(vt[:dim], dtype=np.float32)
+
+        scales = None
+        if quantize:
+            projected = normalize((vectors - mean) @ components.T)
+            # Масштаб по каждой компоненте переводит диапазон в [-127, 127]
+            scales = np.abs(projected).max(axis=0) / INT8_LIMIT
+            scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+
+        digest = hashlib.sha256()
+        for array in (mean, components, scales):
+            if array is not None:
+                digest.update(array.tobytes())
+        return cls(
+            id=f"pca{dim}{'q8' if quantize else ''}-{digest.hexdigest()[:12]}",
+            mean=mean,
+            components=components,
+            scales=scales,
+        )
+
+    def project(self, embeddings: Any) -> np.ndarray:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        return normalize((vectors - self.mean) @ self.components.T)
+
+    def quantize(self, projected: np.ndarray) -> np.ndarray:
+        codes = np.rint(projected / self.scales)
+        return np.clip(codes, -INT8_LIMIT, INT8_LIMIT).astype(np.int8)
+
+    def dequantize(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * self.scales
+
+    def transform(self, embeddings: Any) -> np.ndarray:
+        projected = self.project(embeddings)
+        if self.scales is None:
+            return projected
+        return self.dequantize(self.quantize(projected))
+
+    def metadata(self) -> dict[str, Any]:
+        return {
+            "projection": self.id,
+            "projection_dim": self.dim,
+            "projection_quantization": self.quantization,
+        }
+
+    def save(self, directory: str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.id}.npz")
+        arrays = {"mean": self.mean, "components": self.components}
+        if self.scales is not None:
+            arrays["scales"] = self.scales
+        np.savez(path, **arrays)
+        return path
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    # После центрирования норма теряется; нормируем, чтобы расстояние L2
+    # в Chroma по-прежнему соответствовало косинусному
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.where(norms > 0, norms, 1.0)).astype(np.float32)
+
+
+@lru_cache(maxsize=4)
+def load_projection(directory: str, projection_id: str) -> Projection:
+    with np.load(os.path.join(directory, f"{projection_id}.npz")) as data:
+        return Projection(
+            id=projection_id,
+            mean=data["mean"],
+            components=data["components"],
+            scales=data["scales"] if "scales" in data.files else None,
+        )
@@ -6,9 +6,12 @@ from openai import AsyncOpenAI
 from chromadb import AsyncHttpClient, Settings
 from typing import Dict, List, Literal, Optional, Any
 from pydantic import BaseModel, Field, ValidationError
-from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 
+from services.embeddings import load_encoder
+from services.projection import load_projection
+from services.shards import ShardResolver, query_shards
+
 # Загрузка переменных окружения из .env файла
 load_dotenv()
 
@@ -17,28 +20,41 @@ QWEN_MODEL = os.getenv("QWEN_MODEL", "Qwen/Qwen2.5-14B-Instruct-GPTQ-Int8")
 VLLM_BASE_URL = os.getenv("VLLM_BASE_URL", "http://65.109.137.0:60564/v1")
 VLLM_API_KEY = os.getenv("VLLM_API_KEY", "dummy_key")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "cointegrated/LaBSE-en-ru")
+# Бэкенд энкодера запросов: torch или onnx
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", ".cache/onnx")
+EMBEDDING_ONNX_QUANTIZE = (
+    os.getenv("EMBEDDING_ONNX_QUANTIZE", "false") == "true"
+)
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
 CHROMA_HOST = os.getenv("CHROMA_HOST", "91.184.242.207")
 CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
 CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "documents")
 MEMORY_SIZE = int(os.getenv("MEMORY_SIZE", "1000"))
+# Каталог проекций эмбеддингов, общий с обработчиком документов
+PROJECTION_DIR = os.getenv("PROJECTION_DIR", ".cache/projections")
+# Как часто перечитывать алиасы и реестр шардов коллекции (секунды)
+COLLECTION_ALIAS_TTL = float(os.getenv("COLLECTION_ALIAS_TTL", "10"))
+# Сколько ждать ответа одного шарда (секунды); не успевшие шарды
+# пропускаются
+CHROMA_SHARD_TIMEOUT = float(os.getenv("CHROMA_SHARD_TIMEOUT", "2.0"))
 
 # Инициализация клиента OpenAI и модели эмбеддингов
 vllm_client = AsyncOpenAI(base_url=VLLM_BASE_URL, api_key=VLLM_API_KEY)
 
-embedding_model = SentenceTransformer(EMBEDDING_MODEL)
-
-# Инициализация клиента ChromaDB
-chroma_client = asyncio.run(
-    AsyncHttpClient(
-        host=CHROMA_HOST,
-        port=CHROMA_PORT,
-        settings=Settings(anonymized_telemetry=False),
-    )
-)
-collection = asyncio.run(
-    chroma_client.get_or_create_collection(CHROMA_COLLECTION)
+embedding_model = load_encoder(
+    EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    onnx_dir=EMBEDDING_ONNX_DIR,
+    quantize=EMBEDDING_ONNX_QUANTIZE,
+    threads=EMBEDDING_THREADS,
 )
 
+# Клиент ChromaDB создается при первом запросе в цикле событий бота
+chroma_client = None
+chroma_client_lock = asyncio.Lock()
+collection_resolver = ShardResolver(CHROMA_COLLECTION, COLLECTION_ALIAS_TTL)
+
 
 # Определение класса CamelotMemory для управления памятью
 class CamelotMemory:
@@ -106,6 +122,33 @@ def create_embeddings(texts: List[str]):
     return embeddings
 
 
+async def get_chroma_client():
+    global chroma_client
+    if chroma_client is None:
+        async with chroma_client_lock:
+            if chroma_client is None:
+                chroma_client = await AsyncHttpClient(
+                    host=CHROMA_HOST,
+                    port=CHROMA_PORT,
+                    settings=Settings(anonymized_telemetry=False),
+                )
+    return chroma_client
+
+
+async def get_collections():
+    # Коллекции всех шардов, на которые указывают их алиасы: обработчик
+    # документов переключает алиас после blue/green-переиндексации
+    return await collection_resolver.get(await get_chroma_client())
+
+
+def project_embeddings(embeddings, metadata: Optional[Dict]):
+    # Запрос проецируется так же, как чанки при загрузке
+    projection_id = (metadata or {}).get("projection")
+    if not projection_id:
+        return embeddings
+    return load_projection(PROJECTION_DIR, projection_id).transform(embeddings)
+
+
 # Определение моделей данных с помощью Pydantic
 class SourceReference(BaseModel):
     document_title: str = Field(
@@ -248,11 +291,17 @@ class Prompts:
 
 # Функция для получения релевантных документов с использованием памяти CAMELoT
 async def get_relevant_documents_with_memory(query: str) -> List[Dict]:
-    query_embedding = create_embeddings([query])[0]
-
-    results = await collection.query(
-        query_embeddings=[query_embedding.tolist()],
+    query_embedding = create_embeddings([query])
+    queries = []
+    for collection in await get_collections():
+        # Шарды могут быть записаны с разными проекциями
+        projected = project_embeddings(query_embedding, collection.metadata)
+        queries.append((collection, projected[0].tolist()))
+
+    results = await query_shards(
+        queries,
         n_results=200,
+        timeout=CHROMA_SHARD_TIMEOUT,
         include=["documents", "metadatas"],
     )
 
@@ -0,0 +1,158 @@
+import logging
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionJob(BaseModel):
+    """Вопрос пользователя, ожидающий ответа RAG-воркера."""
+
+    chat_id: int
+    message_id: int
+    user_id: int
+    question: str
+    locale: str
+    # Сообщение "думаю", которое воркер удаляет перед ответом
+    thinking_message_id: Optional[int] = None
+    # Блокировка вопроса пользователя, которую снимает воркер
+    lock_key: Optional[str] = None
+    lock_token: Optional[str] = None
+
+    # Заполняются при чтении из потока
+    entry_id: Optional[str] = None
+    deliveries: int = 1
+
+
+def _decode(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class QuestionQueue:
+    """
+    Очередь вопросов на Redis Stream с группой потребителей. Задача
+    остается в списке ожидающих (PEL), пока воркер не подтвердит ее;
+    задачи упавших воркеров забираются через XAUTOCLAIM после
+    claim_idle секунд простоя. Задачи, доставленные max_deliveries раз
+    без успеха, переносятся в поток dead_letter.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        stream: str = "questions",
+        group: str = "rag-workers",
+        dead_letter: str = "questions:dead",
+        max_len: int = 10_000,
+        claim_idle: float = 180,
+        max_deliveries: int = 3,
+    ):
+        self.redis = redis
+        self.stream = stream
+        self.group = group
+        self.dead_letter_stream = dead_letter
+        self.max_len = max_len
+        self.claim_idle = claim_idle
+        self.max_deliveries = max_deliveries
+
+    async def ensure_group(self) -> None:
+        try:
+            await self.redis.xgroup_create(
+                self.stream, self.group, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def enqueue(self, job: QuestionJob) -> str:
+        entry_id = await self.redis.xadd(
+            self.stream,
+            {"job": job.model_dump_json(exclude={"entry_id", "deliveries"})},
+            maxlen=self.max_len,
+            approximate=True,
+        )
+        return _decode(entry_id)
+
+    def _parse(self, entries) -> List[QuestionJob]:
+        jobs = []
+        for entry_id, fields in entries:
+            raw = (fields or {}).get(b"job") or (fields or {}).get("job")
+            if raw is None:
+                # Запись удалена из потока (обрезка по max_len)
+                continue
+            job = QuestionJob.model_validate_json(raw)
+            job.entry_id = _decode(entry_id)
+            jobs.append(job)
+        return jobs
+
+    async def _deliveries(self, entry_id: str) -> int:
+        pending = await self.redis.xpending_range(
+            self.stream, self.group, min=entry_id, max=entry_id, count=1
+        )
+        return pending[0]["times_delivered"] if pending else 1
+
+    async def read(
+        self, consumer: str, count: int = 1, block: int = 5000
+    ) -> List[QuestionJob]:
+        """
+        Сначала забирает зависшие задачи упавших воркеров, затем читает
+        новые, ожидая до block миллисекунд.
+        """
+        claimed = await self.redis.xautoclaim(
+            self.stream,
+            self.group,
+            consumer,
+            min_idle_time=int(self.claim_idle * 1000),
+            start_id="0-0",
+            count=count,
+        )
+        jobs = self._parse(claimed[1])
+        if jobs:
+            for job in jobs:
+                job.deliveries = await self._deliveries(job.entry_id)
+                logger.warning(
+                    f"Задача {job.entry_id} забрана у упавшего воркера "
+                    f"(доставка {job.deliveries})"
+                )
+            return jobs
+
+        response = await self.redis.xreadgroup(
+            self.group, consumer, {self.stream: ">"}, count=count, block=block
+        )
+        if not response:
+            return []
+        return self._parse(response[0][1])
+
+    async def retry(self, job: QuestionJob, consumer: str) -> QuestionJob:
+        """Повторная доставка задачи тому же воркеру (счетчик растет)."""
+        await self.redis.xclaim(
+            self.stream,
+            self.group,
+            consumer,
+            min_idle_time=0,
+            message_ids=[job.entry_id],
+        )
+        job.deliveries = await self._deliveries(job.entry_id)
+        return job
+
+    async def ack(self, job: QuestionJob) -> None:
+        await self.redis.xack(self.stream, self.group, job.entry_id)
+
+    async def dead_letter(self, job: QuestionJob, error: str) -> None:
+        fields: Dict[str, str] = {
+            "job": job.model_dump_json(exclude={"entry_id"}),
+            "entry_id": job.entry_id,
+            "error": error,
+        }
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(
+                self.dead_letter_stream,
+                fields,
+                maxlen=self.max_len,
+                approximate=True,
+            )
+            pipe.xack(self.stream, self.group, job.entry_id)
+            await pipe.execute()
@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import chromadb
+import orjson
+
+from services.collection_alias import MISSING_COLLECTION_ERRORS, AliasResolver
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_SUFFIX = ".shards"
+SHARD_SLUG_LENGTH = 20
+
+
+def registry_name(name: str) -> str:
+    return f"{name}{REGISTRY_SUFFIX}"
+
+
+def shard_name(name: str, key: str) -> str:
+    """
+    Имя коллекции шарда. Ключ (например, папка отдела) может содержать
+    кириллицу и пробелы, а имена коллекций Chroma - нет, поэтому к
+    латинской части ключа добавляется короткий хеш. Пустой ключ - это
+    сама коллекция name.
+    """
+    if not key:
+        return name
+    slug = re.sub(r"[^a-zA-Z0-9_-]+", "-", key).strip("-_")
+    digest = hashlib.sha1(
+        key.encode("utf-8"), usedforsecurity=False
+    ).hexdigest()[:8]
+    if slug:
+        return f"{name}.{slug[:SHARD_SLUG_LENGTH]}-{digest}"
+    return f"{name}.{digest}"
+
+
+async def read_shards(
+    chroma_client: chromadb.AsyncClientAPI, name: str
+) -> List[str]:
+    # Реестр - пустая коллекция, список шардов хранится в ее метаданных;
+    # его создает процессор при регистрации шардов
+    try:
+        registry = await chroma_client.get_collection(registry_name(name))
+    except MISSING_COLLECTION_ERRORS:
+        return [name]
+    shards = (registry.metadata or {}).get("shards")
+    return orjson.loads(shards) if shards else [name]
+
+
+async def register_shards(
+    chroma_client: chromadb.AsyncClientAPI, name: str, shards: Iterable[str]
+) -> List[str]:
+    registry = await chroma_client.get_or_create_collection(registry_name(name))
+    current = orjson.loads((registry.metadata or {}).get("shards", "[]"))
+    merged = sorted({name, *current, *shards})
+    if merged != current:
+        await registry.modify(
+            metadata={"shards": orjson.dumps(merged).decode()}
+        )
+    return merged
+
+
+class ShardResolver:
+    """
+    Коллекции всех шардов с учетом их алиасов. Реестр шардов и алиасы
+    перечитываются не чаще раза в ttl секунд.
+    """
+
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self._shards: List[str] = []
+        self._expires_at = 0.0
+        self._resolvers: Dict[str, AliasResolver] = {}
+
+    async def get(self, chroma_client: chromadb.AsyncClientAPI) -> List[Any]:
+        if time.monotonic() >= self._expires_at:
+            self._shards = await read_shards(chroma_client, self.name)
+            self._expires_at = time.monotonic() + self.ttl
+        for shard in self._shards:
+            self._resolvers.setdefault(shard, AliasResolver(shard, self.ttl))
+        collections = await asyncio.gather(
+            *(
+                self._resolvers[shard].get(chroma_client)
+                for shard in self._shards
+            )
+        )
+        return [
+            collection for collection in collections if collection is not None
+        ]
+
+
+async def query_shards(
+    queries: Sequence[Tuple[Any, List[float]]],
+    n_results: int,
+    timeout: float,
+    include: Sequence[str] = ("documents", "metadatas"),
+) -> Dict[str, List[List[Any]]]:
+    """
+    Запрашивает шарды параллельно и объединяет лучшие n_results.
+    queries - пары (коллекция, эмбеддинг запроса в ее проекции). Шард,
+    не ответивший за timeout секунд или с ошибкой, пропускается:
+    возвращается неполный результат остальных шардов.
+
+    Расстояния сравнимы, только если все шарды записаны в одной
+    проекции; иначе результаты объединяются по месту в выдаче шарда.
+    """
+
+    async def query(collection, embedding):
+        return await asyncio.wait_for(
+            collection.query(
+                query_embeddings=[embedding],
+                n_results=n_results,
+                include=[*include, "distances"],
+            ),
+            timeout,
+        )
+
+    results = await asyncio.gather(
+        *(query(collection, embedding) for collection, embedding in queries),
+        return_exceptions=True,
+    )
+
+    hits = []
+    failures = []
+    projections = set()
+    for (collection, _), result in zip(queries, results):
+        if isinstance(result, BaseException):
+            failures.append(result)
+            logger.warning(
+                f"Shard {collection.name} skipped: {type(result).__name__} "
+                f"{str(result)}"
+            )
+            continue
+        projections.add((collection.metadata or {}).get("projection"))
+        for index, distance in enumerate(result["distances"][0]):
+            hits.append(
+                (
+                    index,
+                    distance,
+                    {key: result[key][0][index] for key in include},
+                )
+            )
+    if failures and len(failures) == len(queries):
+        raise failures[0]
+
+    if len(projections) > 1:
+        logger.warning(
+            "Shards use different projections, merging results by rank"
+        )
+        hits.sort(key=lambda hit: hit[0])
+    else:
+        hits.sort(key=lambda hit: hit[1])
+    hits = [(distance, hit) for _, distance, hit in hits[:n_results]]
+    merged = {key: [[hit[key] for _, hit in hits]] for key in include}
+    merged["distances"] = [[distance for distance, _ in hits]]
+    return merged
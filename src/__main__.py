@@ -1,13 +1,64 @@
+import argparse
 import asyncio
 import logging
 import os
+import time
+from collections import Counter
+from typing import Dict, List
 
+import aiohttp
 import chromadb
 import chromadb.config
+import orjson
 
-from src.config import CHROMA_HOST, CHROMA_PORT, KNOWLEDGE_BASE_PATH
-from src.document_processor import process_document
-from src.knowledge_base_watcher import run_knowledge_base_watcher
+from services.collection_alias import switch_alias, versioned_name
+from services.embeddings import (
+    ONNX,
+    TORCH,
+    benchmark,
+    compare_backends,
+    load_encoder,
+)
+from src.chroma_writer import close_writers, get_writer
+from src.collection_router import collection_router
+from src.config import (
+    CHROMA_HOST,
+    CHROMA_MAX_BATCH,
+    CHROMA_PORT,
+    DEDUP_ENABLED,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_ONNX_DIR,
+    EMBEDDING_ONNX_QUANTIZE,
+    EMBEDDING_THREADS,
+    INGEST_CONCURRENCY,
+    KNOWLEDGE_BASE_PATH,
+    REINDEX_GRACE_PERIOD,
+    REINDEX_MAX_FAILED_RATIO,
+    STATUS_URL,
+)
+from src.conversion_cache import conversion_cache
+from src.conversion_pool import conversion_pool
+from src.dedup import dedup_index
+from src.document_processor import (
+    change_reason,
+    pipeline_version,
+    process_document,
+    remove_document,
+    remove_misrouted,
+)
+from src.embedding_service import embedding_service
+from src.knowledge_base_watcher import (
+    list_documents,
+    run_knowledge_base_watcher,
+)
+from src.manifest import manifest
+from src.office_pool import office_pool
+from src.projection_manager import (
+    collect_sample,
+    projection_manager,
+    read_queries,
+)
+from src.status import ingest_stats, start_status_server
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,40 +67,460 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def initial_load(path: str, chroma_client: chromadb.AsyncClientAPI):
+async def initial_load(
+    path: str,
+    chroma_client: chromadb.AsyncClientAPI,
+    workers: int = INGEST_CONCURRENCY,
+    force: bool = False,
+):
     logger.info("Начало начальной загрузки документов")
-    for root, dirs, files in os.walk(path):
-        for file in files:
-            file_path = os.path.join(root, file)
+    # Несколько документов обрабатываются одновременно, чтобы их чанки
+    # попадали в общие батчи сервиса эмбеддингов
+    semaphore = asyncio.Semaphore(workers)
+    file_paths = list_documents(path)
+    for file_path in file_paths:
+        ingest_stats.enqueue(file_path)
+
+    async def load(file_path: str):
+        async with semaphore:
             try:
-                await process_document(file_path, chroma_client)
+                with ingest_stats.track(file_path):
+                    await process_document(file_path, chroma_client, force)
                 logger.info(f"Загружен файл: {file_path}")
             except Exception as e:
                 logger.error(f"Ошибка при загрузке файла {file_path}: {str(e)}")
-    logger.info("Начальная загрузка документов завершена")
 
+    await asyncio.gather(*map(load, file_paths))
+    logger.info(
+        "Начальная загрузка документов завершена "
+        f"({embedding_service.chunks_per_second:.1f} chunks/sec)"
+    )
 
-async def main():
-    # Инициализация клиента Chroma
-    chroma_client = await chromadb.AsyncHttpClient(
+
+async def connect_chroma() -> chromadb.AsyncClientAPI:
+    return await chromadb.AsyncHttpClient(
         host=CHROMA_HOST,
         port=CHROMA_PORT,
         settings=chromadb.config.Settings(anonymized_telemetry=False),
     )
 
-    # Начальная загрузка всех документов
-    await initial_load(KNOWLEDGE_BASE_PATH, chroma_client)
 
-    # Запуск отслеживания изменений
+async def close_resources() -> None:
+    await close_writers()
+    await embedding_service.close()
+    conversion_pool.shutdown()
+    await office_pool.close()
+
+
+async def main():
+    # Инициализация клиента Chroma
+    chroma_client = await connect_chroma()
+    status_server = await start_status_server()
+
     try:
+        # Запись идет в коллекцию, на которую указывает алиас
+        await collection_router.refresh(chroma_client)
+        # Проекция эмбеддингов должна быть готова до записи первых чанков
+        for name in collection_router.collections():
+            await projection_manager.ensure(chroma_client, name)
+        await remove_misrouted(chroma_client)
+
+        # Начальная загрузка всех документов
+        await initial_load(KNOWLEDGE_BASE_PATH, chroma_client)
+
+        # Запуск отслеживания изменений
         await run_knowledge_base_watcher(chroma_client)
     except asyncio.CancelledError:
         logger.info("Наблюдатель базы знаний остановлен")
     except Exception as e:
         logger.error(f"Ошибка в наблюдателе базы знаний: {str(e)}")
+    finally:
+        if status_server:
+            await status_server.cleanup()
+        await close_resources()
+
+
+async def reindex(path: str, workers: int, dry_run: bool, force: bool) -> None:
+    # Тот же пайплайн, что и у сервиса, но по требованию и без наблюдателя
+    chroma_client = await connect_chroma()
+    try:
+        await collection_router.refresh(chroma_client)
+        if dry_run:
+            # Пробный прогон ничего не меняет, в том числе коллекцию
+            for name in collection_router.collections():
+                await projection_manager.attach(chroma_client, name)
+            file_paths = list_documents(path)
+            changed = 0
+            for file_path in file_paths:
+                reason = "force" if force else await change_reason(file_path)
+                if reason:
+                    changed += 1
+                    logger.info(f"Будет обработан ({reason}): {file_path}")
+            logger.info(
+                f"Будет обработано {changed} из {len(file_paths)} документов"
+            )
+            return
+        for name in collection_router.collections():
+            await projection_manager.ensure(chroma_client, name)
+        await initial_load(path, chroma_client, workers=workers, force=force)
+        logger.info(orjson.dumps(ingest_stats.snapshot()).decode())
+    finally:
+        await close_resources()
+
+
+async def drop_collection(
+    chroma_client: chromadb.AsyncClientAPI, name: str
+) -> None:
+    try:
+        await chroma_client.delete_collection(name)
+    except Exception as e:
+        logger.warning(f"Не удалось удалить коллекцию {name}: {str(e)}")
+    get_writer(chroma_client).forget_collection(name)
+    manifest.clear(name)
+    dedup_index.clear(name)
+
+
+async def check_collection(
+    chroma_client: chromadb.AsyncClientAPI,
+    name: str,
+    documents: int,
+    samples: int = 5,
+) -> List[str]:
+    # Проверка новой коллекции перед переключением алиаса: она не пуста,
+    # загружены почти все документы и чанки находятся поиском
+    problems = []
+    collection = await chroma_client.get_collection(name)
+    count = await collection.count()
+    if not count:
+        problems.append(f"коллекция {name} пуста")
+    loaded = len(manifest.paths(name))
+    if loaded < documents * (1 - REINDEX_MAX_FAILED_RATIO):
+        problems.append(f"загружено {loaded} из {documents} документов")
+
+    sample = await collection.get(limit=samples, include=["embeddings"])
+    if len(sample["ids"]):
+        result = await collection.query(
+            query_embeddings=sample["embeddings"],
+            n_results=1,
+            include=["distances"],
+        )
+        misses = sum(
+            1 for distances in result["distances"] if distances[0] > 1e-3
+        )
+        if misses:
+            problems.append(
+                f"{misses} из {len(sample['ids'])} чанков не находятся "
+                "поиском по своему эмбеддингу"
+            )
+    logger.info(f"Коллекция {name}: {count} чанков, {loaded} документов")
+    return problems
+
+
+async def load_staging(
+    path: str,
+    chroma_client: chromadb.AsyncClientAPI,
+    workers: int,
+    staging: Dict[str, str],
+) -> List[str]:
+    """
+    Загружает документы в коллекции staging (шард -> новая коллекция)
+    и возвращает файлы на диске после догоняющего прохода.
+    """
+    for name, collection_name in staging.items():
+        collection_router.stage(name, collection_name)
+        await projection_manager.ensure(chroma_client, collection_name)
+    await initial_load(path, chroma_client, workers=workers)
+
+    # Догоняющий проход: изменения и удаления файлов за время
+    # загрузки; неизмененные документы отсекаются манифестом
+    await initial_load(path, chroma_client, workers=workers)
+    on_disk = list_documents(path)
+    for collection_name in staging.values():
+        for file_path in sorted(
+            set(manifest.paths(collection_name)) - set(on_disk)
+        ):
+            await remove_document(file_path, chroma_client)
+    return on_disk
+
+
+async def check_staging(
+    chroma_client: chromadb.AsyncClientAPI,
+    staging: Dict[str, str],
+    on_disk: List[str],
+) -> bool:
+    documents = Counter(map(collection_router.logical_name, on_disk))
+    passed = True
+    for name, collection_name in staging.items():
+        problems = await check_collection(
+            chroma_client, collection_name, documents[name]
+        )
+        if problems:
+            passed = False
+            logger.error(
+                f"Коллекция {collection_name} не прошла проверку: "
+                f"{'; '.join(problems)}"
+            )
+    return passed
+
+
+async def switch_aliases(
+    chroma_client: chromadb.AsyncClientAPI,
+    staging: Dict[str, str],
+    grace: float,
+) -> None:
+    previous = {}
+    for name, collection_name in staging.items():
+        previous[name] = await switch_alias(
+            chroma_client, name, collection_name
+        )
+        logger.info(
+            f"Алиас {name} переключен: {previous[name]} -> {collection_name}"
+        )
+    logger.info(f"Старые коллекции будут удалены через {grace:.0f} с")
+    await asyncio.sleep(grace)
+    for name, collection_name in staging.items():
+        if previous[name] != collection_name:
+            await drop_collection(chroma_client, previous[name])
+            logger.info(f"Коллекция {previous[name]} удалена")
+
+
+async def reindex_blue_green(path: str, workers: int, grace: float) -> bool:
+    """
+    Загружает документы в новые версионированные коллекции своих шардов,
+    пока бот отвечает из текущих, проверяет их и переключает алиасы.
+    С --path переиндексируются только шарды документов этой папки.
+    Старые коллекции удаляются через grace секунд, когда читатели
+    перечитают алиасы.
+    """
+    chroma_client = await connect_chroma()
+    try:
+        await collection_router.refresh(chroma_client)
+        shards = sorted(
+            {collection_router.logical_name(f) for f in list_documents(path)}
+        )
+        if not shards:
+            logger.warning(f"В {path} нет документов для переиндексации")
+            return False
+
+        version = int(time.time())
+        live = {name: collection_router.resolve(name) for name in shards}
+        staging = {name: versioned_name(name, version) for name in shards}
+        logger.info(f"Blue/green reindex: {live} -> {staging}")
+
+        # Новые коллекции наследуют проекцию текущих
+        await projection_manager.attach(chroma_client, live[shards[0]])
+        on_disk = await load_staging(path, chroma_client, workers, staging)
+
+        if not await check_staging(chroma_client, staging, on_disk):
+            # Алиасы переключаются только все вместе
+            logger.error("Алиасы не переключены")
+            for collection_name in staging.values():
+                await drop_collection(chroma_client, collection_name)
+            return False
+
+        await switch_aliases(chroma_client, staging, grace)
+        return True
+    finally:
+        await close_resources()
+
+
+async def show_status(url: str) -> None:
+    async with aiohttp.ClientSession() as session, session.get(url) as response:
+        response.raise_for_status()
+        data = await response.json(loads=orjson.loads)
+    print(orjson.dumps(data, option=orjson.OPT_INDENT_2).decode())  # noqa: T201
+
+
+async def verify(path: str) -> bool:
+    """
+    Сверяет файлы на диске, манифест и коллекцию: незагруженные и
+    удаленные файлы, устаревшие записи манифеста и чанки, которых
+    нет в Chroma.
+    """
+    chroma_client = await connect_chroma()
+    try:
+        await collection_router.refresh(chroma_client)
+        for name in collection_router.collections():
+            await projection_manager.attach(chroma_client, name)
+        version = pipeline_version()
+        on_disk = set(list_documents(path))
+        tracked = {
+            file_path
+            for name in collection_router.collections()
+            for file_path in manifest.paths(name)
+        }
+
+        stale, missing_chunks = [], {}
+        for file_path in sorted(on_disk & tracked):
+            name = collection_router.collection_for(file_path)
+            collection = await get_writer(chroma_client).get_collection(name)
+            entry = manifest.get(name, file_path)
+            if not entry.matches_stat(os.stat(file_path), version):
+                stale.append(file_path)
+            expected = (
+                dedup_index.chunk_ids(name, file_path)
+                if DEDUP_ENABLED
+                else set(entry.chunk_ids)
+            )
+            found = set()
+            ids = sorted(expected)
+            for start in range(0, len(ids), CHROMA_MAX_BATCH):
+                result = await collection.get(
+                    ids=ids[start : start + CHROMA_MAX_BATCH], include=[]
+                )
+                found.update(result["ids"])
+            if expected - found:
+                missing_chunks[file_path] = len(expected - found)
+    finally:
+        await close_resources()
+
+    report = {
+        "documents": len(on_disk),
+        "not_loaded": sorted(on_disk - tracked),
+        "deleted": sorted(tracked - on_disk),
+        "stale": stale,
+        "missing_chunks": missing_chunks,
+    }
+    output = orjson.dumps(report, option=orjson.OPT_INDENT_2).decode()
+    print(output)  # noqa: T201
+    return not any(value for key, value in report.items() if key != "documents")
+
+
+def prune_cache(max_mb: int | None) -> None:
+    removed, freed = conversion_cache.prune(
+        None if max_mb is None else max_mb * 1024 * 1024
+    )
+    logger.info(
+        f"Кеш конвертации очищен: удалено {removed} записей, "
+        f"освобождено {freed / 1024 / 1024:.1f} MB"
+    )
+
+
+async def check_embeddings(
+    texts_path: str | None, limit: int, batch_size: int
+) -> None:
+    # Сверка ONNX-бэкенда с torch на текстах базы знаний или из файла
+    try:
+        if texts_path:
+            texts = read_queries(texts_path)[:limit]
+        else:
+            texts = await collect_sample(KNOWLEDGE_BASE_PATH, limit)
+    finally:
+        conversion_pool.shutdown()
+        await office_pool.close()
+
+    reference = await asyncio.to_thread(
+        load_encoder, EMBEDDING_MODEL_NAME, TORCH
+    )
+    candidate = await asyncio.to_thread(
+        load_encoder,
+        EMBEDDING_MODEL_NAME,
+        ONNX,
+        onnx_dir=EMBEDDING_ONNX_DIR,
+        quantize=EMBEDDING_ONNX_QUANTIZE,
+        threads=EMBEDDING_THREADS,
+    )
+    results = {
+        "parity": compare_backends(reference, candidate, texts),
+        "benchmark": [
+            benchmark(encoder, texts, batch_size=batch_size)
+            for encoder in (reference, candidate)
+        ],
+    }
+    logger.info(
+        "Сравнение бэкендов эмбеддингов:\n"
+        + orjson.dumps(results, option=orjson.OPT_INDENT_2).decode()
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m src")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("run", help="Загрузка и отслеживание базы знаний")
+    prune = commands.add_parser(
+        "prune-cache", help="Очистка кеша сконвертированных документов"
+    )
+    prune.add_argument(
+        "--max-mb",
+        type=int,
+        default=None,
+        help="Оставить в кеше не больше указанного объема (MB)",
+    )
+    check = commands.add_parser(
+        "check-embeddings",
+        help="Сверка и замер скорости бэкендов эмбеддингов torch и onnx",
+    )
+    check.add_argument(
+        "--texts",
+        default=None,
+        help="Файл с текстами (по одному на строку), по умолчанию - "
+        "чанки базы знаний",
+    )
+    check.add_argument("--limit", type=int, default=500)
+    check.add_argument("--batch-size", type=int, default=32)
+    reindex_parser = commands.add_parser(
+        "reindex", help="Повторная загрузка документов без перезапуска"
+    )
+    reindex_parser.add_argument(
+        "--workers", type=int, default=INGEST_CONCURRENCY
+    )
+    reindex_parser.add_argument("--path", default=KNOWLEDGE_BASE_PATH)
+    reindex_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Только показать, какие документы будут обработаны",
+    )
+    reindex_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Обработать документы, даже если манифест считает их "
+        "неизмененными",
+    )
+    reindex_parser.add_argument(
+        "--blue-green",
+        action="store_true",
+        help="Загрузить все документы в новую коллекцию и переключить "
+        "на нее алиас",
+    )
+    reindex_parser.add_argument(
+        "--grace",
+        type=float,
+        default=REINDEX_GRACE_PERIOD,
+        help="Через сколько секунд после переключения удалить старую "
+        "коллекцию",
+    )
+    status = commands.add_parser(
+        "status", help="Состояние загрузки работающего сервиса"
+    )
+    status.add_argument("--url", default=STATUS_URL)
+    verify_parser = commands.add_parser(
+        "verify", help="Сверка файлов, манифеста и коллекции"
+    )
+    verify_parser.add_argument("--path", default=KNOWLEDGE_BASE_PATH)
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "prune-cache":
+        prune_cache(args.max_mb)
+        raise SystemExit(0)
+    if args.command == "check-embeddings":
+        asyncio.run(check_embeddings(args.texts, args.limit, args.batch_size))
+        raise SystemExit(0)
+    if args.command == "reindex" and args.blue_green:
+        switched = asyncio.run(
+            reindex_blue_green(args.path, args.workers, args.grace)
+        )
+        raise SystemExit(0 if switched else 1)
+    if args.command == "reindex":
+        asyncio.run(reindex(args.path, args.workers, args.dry_run, args.force))
+        raise SystemExit(0)
+    if args.command == "status":
+        asyncio.run(show_status(args.url))
+        raise SystemExit(0)
+    if args.command == "verify":
+        raise SystemExit(0 if asyncio.run(verify(args.path)) else 1)
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
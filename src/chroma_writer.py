@@ -0,0 +1,340 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import chromadb
+from chromadb.api.models.Collection import Collection
+
+from src.config import (
+    CHROMA_FLUSH_INTERVAL,
+    CHROMA_MAX_BATCH,
+    CHROMA_MAX_RETRIES,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Порядок выполнения групп при сбросе буфера. Операции одного документа
+# затрагивают непересекающиеся идентификаторы, а документ ждет записи
+# своих операций, поэтому внутри одного сброса их можно группировать
+UPSERT = "upsert"
+UPDATE = "update"
+DELETE_IDS = "delete_ids"
+DELETE_PATHS = "delete_paths"
+FLUSH_ORDER = (DELETE_PATHS, DELETE_IDS, UPSERT, UPDATE)
+
+
+@dataclass
+class _Operation:
+    kind: str
+    collection: str
+    future: asyncio.Future
+    ids: List[str] = field(default_factory=list)
+    documents: List[str] = field(default_factory=list)
+    embeddings: List[List[float]] = field(default_factory=list)
+    metadatas: List[Dict[str, Any]] = field(default_factory=list)
+    file_paths: List[str] = field(default_factory=list)
+
+    @property
+    def size(self) -> int:
+        return len(self.ids) or len(self.file_paths)
+
+
+@dataclass
+class _Batch:
+    """Данные всех операций группы, отправляемые частями."""
+
+    ids: List[str]
+    documents: List[str]
+    embeddings: List[List[float]]
+    metadatas: List[Dict[str, Any]]
+    file_paths: List[str]
+
+    @classmethod
+    def merge(cls, operations: List[_Operation]) -> "_Batch":
+        ids = _concat(operations, "ids")
+        documents = _concat(operations, "documents")
+        embeddings = _concat(operations, "embeddings")
+        metadatas = _concat(operations, "metadatas")
+        if len(set(ids)) < len(ids):
+            ids, documents, embeddings, metadatas = _collapse(
+                ids, documents, embeddings, metadatas
+            )
+        return cls(
+            ids=ids,
+            documents=documents,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            file_paths=_concat(operations, "file_paths"),
+        )
+
+    def size(self, kind: str) -> int:
+        return len(self.file_paths) if kind == DELETE_PATHS else len(self.ids)
+
+
+def _upsert(collection: Collection, batch: _Batch, start: int, end: int):
+    return collection.upsert(
+        ids=batch.ids[start:end],
+        documents=batch.documents[start:end],
+        embeddings=batch.embeddings[start:end],
+        metadatas=batch.metadatas[start:end],
+    )
+
+
+def _update(collection: Collection, batch: _Batch, start: int, end: int):
+    return collection.update(
+        ids=batch.ids[start:end], metadatas=batch.metadatas[start:end]
+    )
+
+
+def _delete_ids(collection: Collection, batch: _Batch, start: int, end: int):
+    return collection.delete(ids=batch.ids[start:end])
+
+
+def _delete_paths(collection: Collection, batch: _Batch, start: int, end: int):
+    return collection.delete(
+        where={"file_path": {"$in": batch.file_paths[start:end]}}
+    )
+
+
+REQUESTS = {
+    UPSERT: _upsert,
+    UPDATE: _update,
+    DELETE_IDS: _delete_ids,
+    DELETE_PATHS: _delete_paths,
+}
+
+
+class ChromaWriter:
+    """
+    Буфер отложенной записи в Chroma. Upsert, update и delete разных
+    документов объединяются в запросы ограниченного размера и
+    отправляются по достижении размера или по таймеру.
+    """
+
+    def __init__(
+        self,
+        chroma_client: chromadb.AsyncClientAPI,
+        max_batch: int = CHROMA_MAX_BATCH,
+        flush_interval: float = CHROMA_FLUSH_INTERVAL,
+        max_retries: int = CHROMA_MAX_RETRIES,
+    ):
+        self.chroma_client = chroma_client
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+
+        self.requests_sent = 0
+        self._collections: Dict[str, Collection] = {}
+        self._buffer: List[_Operation] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_lock = asyncio.Lock()
+        self._tasks: set = set()
+
+    async def get_collection(self, name: str) -> Collection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = await self.chroma_client.get_or_create_collection(
+                name=name
+            )
+            self._collections[name] = collection
+        return collection
+
+    def forget_collection(self, name: str) -> None:
+        self._collections.pop(name, None)
+
+    async def upsert(
+        self,
+        collection: str,
+        ids: List[str],
+        documents: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]],
+    ) -> None:
+        await self._submit(
+            UPSERT,
+            collection,
+            ids=ids,
+            documents=documents,
+            embeddings=embeddings,
+            metadatas=metadatas,
+        )
+
+    async def update(
+        self,
+        collection: str,
+        ids: List[str],
+        metadatas: List[Dict[str, Any]],
+    ) -> None:
+        await self._submit(UPDATE, collection, ids=ids, metadatas=metadatas)
+
+    async def delete(
+        self,
+        collection: str,
+        ids: Optional[List[str]] = None,
+        file_paths: Optional[List[str]] = None,
+    ) -> None:
+        if ids:
+            await self._submit(DELETE_IDS, collection, ids=ids)
+        if file_paths:
+            await self._submit(DELETE_PATHS, collection, file_paths=file_paths)
+
+    async def _submit(self, kind: str, collection: str, **payload) -> None:
+        operation = _Operation(
+            kind=kind,
+            collection=collection,
+            future=asyncio.get_running_loop().create_future(),
+            **payload,
+        )
+        if not operation.size:
+            return
+        self._buffer.append(operation)
+
+        if self._buffered() >= self.max_batch:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.flush_interval, self._schedule_flush
+            )
+        await operation.future
+
+    def _buffered(self) -> int:
+        return sum(operation.size for operation in self._buffer)
+
+    def _schedule_flush(self) -> None:
+        task = asyncio.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            operations, self._buffer = self._buffer, []
+            if not operations:
+                return
+
+            groups: Dict[tuple, List[_Operation]] = {}
+            for operation in operations:
+                groups.setdefault(
+                    (operation.kind, operation.collection), []
+                ).append(operation)
+
+            for kind in FLUSH_ORDER:
+                for (group_kind, name), group in groups.items():
+                    if group_kind == kind:
+                        await self._flush_group(kind, name, group)
+
+    async def _flush_group(
+        self, kind: str, name: str, operations: List[_Operation]
+    ) -> None:
+        batch = _Batch.merge(operations)
+        send = REQUESTS[kind]
+
+        def make_request(collection: Collection, start: int, end: int):
+            return send(collection, batch, start, end)
+
+        try:
+            for start in range(0, batch.size(kind), self.max_batch):
+                await self._send_with_retry(
+                    kind, name, make_request, start, start + self.max_batch
+                )
+        except Exception as e:
+            for operation in operations:
+                if not operation.future.done():
+                    operation.future.set_exception(e)
+            return
+
+        for operation in operations:
+            if not operation.future.done():
+                operation.future.set_result(None)
+
+    async def _send_with_retry(
+        self, kind: str, name: str, make_request, start: int, end: int
+    ) -> None:
+        delay = 0.5
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                collection = await self.get_collection(name)
+                await make_request(collection, start, end)
+                self.requests_sent += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(
+                        f"Chroma {kind} to {name} failed after "
+                        f"{attempt} attempts: {str(e)}"
+                    )
+                    raise
+                logger.warning(
+                    f"Chroma {kind} to {name} failed (attempt {attempt}): "
+                    f"{str(e)}, retrying in {delay:.1f}s"
+                )
+                # Коллекция могла быть удалена - получим ее заново
+                self.forget_collection(name)
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def _concat(operations: List[_Operation], attribute: str) -> List[Any]:
+    return [
+        value
+        for operation in operations
+        for value in getattr(operation, attribute)
+    ]
+
+
+def _collapse(
+    ids: List[str],
+    documents: List[str],
+    embeddings: List[List[float]],
+    metadatas: List[Dict[str, Any]],
+) -> tuple:
+    # Chroma отклоняет запрос с повторяющимися идентификаторами; такое
+    # бывает, когда несколько документов меняют общий чанк. Побеждает
+    # последняя запись, метаданные update сливаются, как и в самой Chroma
+    positions: Dict[str, int] = {}
+    merged: List[Dict[str, Any]] = []
+    for position, chunk_id in enumerate(ids):
+        metadata = metadatas[position] if metadatas else None
+        if chunk_id in positions:
+            index = positions[chunk_id]
+            if metadata is not None:
+                merged[index] = {**merged[index], **metadata}
+            continue
+        positions[chunk_id] = len(merged)
+        merged.append(metadata)
+    last = {chunk_id: position for position, chunk_id in enumerate(ids)}
+    order = list(positions)
+    return (
+        order,
+        [documents[last[i]] for i in order] if documents else [],
+        [embeddings[last[i]] for i in order] if embeddings else [],
+        merged if metadatas else [],
+    )
+
+
+_writers: Dict[int, ChromaWriter] = {}
+
+
+def get_writer(chroma_client: chromadb.AsyncClientAPI) -> ChromaWriter:
+    writer = _writers.get(id(chroma_client))
+    if writer is None:
+        writer = _writers[id(chroma_client)] = ChromaWriter(chroma_client)
+    return writer
+
+
+async def close_writers() -> None:
+    for writer in list(_writers.values()):
+        await writer.close()
+    _writers.clear()
@@ -0,0 +1,213 @@
+import re
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from src.config import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS
+
+COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+HEADING_RE = re.compile(r"^[ \t]{0,3}(#{1,6})[ \t]+(.*?)[ \t#]*$")
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+# Номера секций вида "1.", "1.1.", "1.1.1" в начале абзаца
+SECTION_NUMBER_RE = re.compile(r"^(\d+(?:\.\d+)*)\.?(?=\s|$)")
+NON_TEXT_RE = re.compile(r"[^\w\s.,;:?!-]")
+WHITESPACE_RE = re.compile(r"\s+")
+TOKEN_RE = re.compile(r"\w+")
+
+SECTION_SEPARATOR = " > "
+
+
+@dataclass(frozen=True)
+class Sentence:
+    text: str
+    start: int
+    end: int
+    section: str
+    tokens: int
+    heading: bool = False
+
+
+def normalize_text(text: str) -> str:
+    text = NON_TEXT_RE.sub(" ", text.lower())
+    return WHITESPACE_RE.sub(" ", text).strip()
+
+
+def count_words(text: str) -> int:
+    return sum(1 for _ in TOKEN_RE.finditer(text))
+
+
+def _blank_comments(markdown: str) -> str:
+    # Комментарии заменяются пробелами той же длины, чтобы не сбить смещения
+    return COMMENT_RE.sub(lambda match: " " * len(match.group()), markdown)
+
+
+def _iter_blocks(
+    markdown: str,
+) -> Iterator[Tuple[int, int, Optional[re.Match]]]:
+    """
+    Абзацы и заголовки по порядку: (начало, конец, совпадение
+    HEADING_RE или None для абзаца).
+    """
+    paragraph_start = paragraph_end = 0
+    in_paragraph = False
+    position = 0
+    for line in markdown.splitlines(keepends=True):
+        line_start, position = position, position + len(line)
+        heading = HEADING_RE.match(line.rstrip("\r\n"))
+        if heading or not line.strip():
+            if in_paragraph:
+                yield paragraph_start, paragraph_end, None
+                in_paragraph = False
+            if heading:
+                yield line_start, position, heading
+            continue
+        if not in_paragraph:
+            paragraph_start, in_paragraph = line_start, True
+        paragraph_end = position
+    if in_paragraph:
+        yield paragraph_start, paragraph_end, None
+
+
+def _split_paragraph(
+    block: str, offset: int, section: str, count_tokens: Callable[[str], int]
+) -> Iterator[Sentence]:
+    bounds = []
+    sentence_start = 0
+    for match in SENTENCE_END_RE.finditer(block):
+        # "2.3." в начале абзаца - номер пункта, а не конец предложения
+        if SECTION_NUMBER_RE.fullmatch(
+            block[sentence_start : match.start()].strip()
+        ):
+            continue
+        bounds.append((sentence_start, match.start()))
+        sentence_start = match.end()
+    bounds.append((sentence_start, len(block)))
+
+    for start, end in bounds:
+        text = normalize_text(block[start:end])
+        if text:
+            yield Sentence(
+                text=text,
+                start=offset + start,
+                end=offset + end,
+                section=section,
+                tokens=count_tokens(text),
+            )
+
+
+def iter_sentences(
+    markdown: str, count_tokens: Callable[[str], int] = count_words
+) -> Iterator[Sentence]:
+    """
+    Один проход по строкам markdown: заголовки обновляют иерархию секций,
+    абзацы режутся на предложения со смещениями в исходном тексте.
+    """
+    markdown = _blank_comments(markdown)
+    headings: List[Tuple[int, str]] = []
+    section = ""
+
+    for start, end, heading in _iter_blocks(markdown):
+        if heading is None:
+            block = markdown[start:end]
+            number = SECTION_NUMBER_RE.match(block.lstrip())
+            if number:
+                path = [title for _, title in headings]
+                section = SECTION_SEPARATOR.join([*path, number.group(1)])
+            yield from _split_paragraph(block, start, section, count_tokens)
+            continue
+
+        level = len(heading.group(1))
+        title = normalize_text(heading.group(2))
+        while headings and headings[-1][0] >= level:
+            headings.pop()
+        if title:
+            headings.append((level, title))
+        section = SECTION_SEPARATOR.join(title for _, title in headings)
+        # Заголовок сам по себе тоже несет смысл для поиска
+        if title:
+            yield Sentence(
+                text=title,
+                start=start + heading.start(2),
+                end=start + heading.end(2),
+                section=section,
+                tokens=count_tokens(title),
+                heading=True,
+            )
+
+
+def _make_chunk(window: Deque[Sentence]) -> Dict[str, str]:
+    return {
+        "text": " ".join(sentence.text for sentence in window),
+        "start_index": window[0].start,
+        "end_index": window[-1].end,
+        "section": window[0].section,
+    }
+
+
+def _opens_section(window: Deque[Sentence], section: str) -> bool:
+    return all(sentence.heading for sentence in window) and section.startswith(
+        window[0].section + SECTION_SEPARATOR
+    )
+
+
+def split_into_chunks(
+    sentences: Iterable[Sentence],
+    chunk_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> List[Dict[str, str]]:
+    """
+    Собирает предложения в чанки не длиннее chunk_tokens токенов
+    (кроме одиночных длинных предложений) с перекрытием overlap_tokens.
+    Чанк не пересекает границу секции. Результат детерминирован.
+    """
+    chunks = []
+    window: Deque[Sentence] = deque()
+    window_tokens = 0
+    has_new = False
+
+    for sentence in sentences:
+        if window and sentence.section != window[0].section:
+            if _opens_section(window, sentence.section):
+                # Заголовок без текста переходит в первый чанк своей
+                # подсекции, а не становится отдельным чанком
+                window = deque(
+                    replace(heading, section=sentence.section)
+                    for heading in window
+                )
+            else:
+                if has_new:
+                    chunks.append(_make_chunk(window))
+                window.clear()
+                window_tokens = 0
+                has_new = False
+        elif (
+            window
+            and has_new
+            and (window_tokens + sentence.tokens > chunk_tokens)
+        ):
+            chunks.append(_make_chunk(window))
+            # Хвост предыдущего чанка переходит в следующий как перекрытие
+            while window and window_tokens > overlap_tokens:
+                window_tokens -= window.popleft().tokens
+            has_new = False
+
+        window.append(sentence)
+        window_tokens += sentence.tokens
+        has_new = True
+
+    if has_new:
+        chunks.append(_make_chunk(window))
+    return chunks
+
+
+def chunk_markdown(markdown: str) -> List[Dict[str, str]]:
+    return split_into_chunks(iter_sentences(markdown))
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Set
+
+import chromadb
+
+from services.collection_alias import resolve_alias
+from services.shards import read_shards, register_shards, shard_name
+from src.config import (
+    CHROMA_COLLECTION_NAME,
+    COLLECTION_SHARD_BY,
+    KNOWLEDGE_BASE_PATH,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+SHARD_BY_FOLDER = "folder"
+
+
+class CollectionRouter:
+    """
+    Определяет, в какую коллекцию Chroma пишутся чанки документа.
+    Документ попадает в шард по ключу (при COLLECTION_SHARD_BY=folder -
+    папка верхнего уровня базы знаний). Логическое имя шарда - это
+    алиас; запись идет в коллекцию, на которую он указывает, а во
+    время blue/green-переиндексации - в новую коллекцию, которая еще
+    загружается.
+    """
+
+    def __init__(
+        self,
+        name: str = CHROMA_COLLECTION_NAME,
+        shard_by: str = COLLECTION_SHARD_BY,
+        root: str = KNOWLEDGE_BASE_PATH,
+    ):
+        if shard_by not in ("", SHARD_BY_FOLDER):
+            raise ValueError(f"Unknown shard key: {shard_by}")
+        self.name = name
+        self.shard_by = shard_by
+        self.root = root
+        self.shards: Set[str] = {name}
+        self.targets: Dict[str, str] = {}
+        self.staging: Dict[str, str] = {}
+        self._lock = asyncio.Lock()
+
+    def shard_key(self, file_path: str) -> str:
+        if self.shard_by != SHARD_BY_FOLDER:
+            return ""
+        parts = os.path.relpath(file_path, self.root).split(os.sep)
+        # Файлы в корне базы знаний остаются в основной коллекции
+        if len(parts) < 2 or parts[0] == os.pardir:
+            return ""
+        return parts[0]
+
+    def logical_names(self) -> List[str]:
+        return sorted(self.shards)
+
+    def logical_name(self, file_path: str) -> str:
+        return shard_name(self.name, self.shard_key(file_path))
+
+    def resolve(self, logical_name: str) -> str:
+        return self.staging.get(logical_name) or self.targets.get(
+            logical_name, logical_name
+        )
+
+    def collection_for(self, file_path: str) -> str:
+        return self.resolve(self.logical_name(file_path))
+
+    def collections(self) -> List[str]:
+        return [self.resolve(name) for name in self.logical_names()]
+
+    def stage(self, logical_name: str, collection: str) -> None:
+        self.staging[logical_name] = collection
+
+    def is_staging(self, collection: str) -> bool:
+        return collection in self.staging.values()
+
+    def scan(self) -> Set[str]:
+        # Шарды по папкам, которые уже есть на диске
+        if self.shard_by != SHARD_BY_FOLDER or not os.path.isdir(self.root):
+            return set()
+        return {
+            shard_name(self.name, entry.name)
+            for entry in os.scandir(self.root)
+            if entry.is_dir()
+        }
+
+    async def register(
+        self,
+        chroma_client: chromadb.AsyncClientAPI,
+        file_path: str,
+        prepare: Callable[[str], Awaitable[object]],
+    ) -> None:
+        """
+        Новая папка появилась во время работы: коллекция шарда готовится
+        через prepare до первой записи, а шард вносится в реестр, чтобы
+        бот начал его опрашивать.
+        """
+        logical_name = self.logical_name(file_path)
+        if logical_name in self.shards:
+            return
+        async with self._lock:
+            if logical_name in self.shards:
+                return
+            self.targets[logical_name] = await resolve_alias(
+                chroma_client, logical_name
+            )
+            await prepare(self.resolve(logical_name))
+            await register_shards(chroma_client, self.name, [logical_name])
+            self.shards.add(logical_name)
+        logger.info(f"Добавлен шард {logical_name}")
+
+    async def refresh(
+        self, chroma_client: chromadb.AsyncClientAPI
+    ) -> List[str]:
+        # Возвращает логические имена, алиас которых переключился
+        async with self._lock:
+            registered = set(await read_shards(chroma_client, self.name))
+            scanned = self.scan()
+            if scanned - registered:
+                await register_shards(chroma_client, self.name, scanned)
+            self.shards |= registered | scanned
+
+            changed = []
+            for name in self.logical_names():
+                target = await resolve_alias(chroma_client, name)
+                if self.targets.get(name, target) != target:
+                    logger.info(
+                        f"Алиас {name}: {self.targets[name]} -> {target}"
+                    )
+                    changed.append(name)
+                self.targets[name] = target
+        return changed
+
+
+collection_router = CollectionRouter()
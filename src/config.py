@@ -9,3 +9,101 @@ EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME")
 CHROMA_COLLECTION_NAME = os.getenv("CHROMA_COLLECTION_NAME")
 CHROMA_HOST = os.getenv("CHROMA_HOST")
 CHROMA_PORT = os.getenv("CHROMA_PORT")
+
+# Общий сервис эмбеддингов: размер батча, время накопления чанков
+# из разных документов и число процессов (0 - без пула процессов)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_MAX_WAIT = float(os.getenv("EMBEDDING_MAX_WAIT", "0.05"))
+EMBEDDING_PROCESSES = int(os.getenv("EMBEDDING_PROCESSES", "0"))
+# Бэкенд энкодера: torch или onnx (экспорт модели при первом запуске,
+# опционально с int8-квантованием весов), число потоков onnxruntime
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", ".cache/onnx")
+EMBEDDING_ONNX_QUANTIZE = (
+    os.getenv("EMBEDDING_ONNX_QUANTIZE", "false") == "true"
+)
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+# Количество документов, обрабатываемых одновременно
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+
+# Пул процессов конвертации PDF в markdown
+CONVERSION_WORKERS = int(os.getenv("CONVERSION_WORKERS", "2"))
+CONVERSION_TIMEOUT = float(os.getenv("CONVERSION_TIMEOUT", "300"))
+CONVERSION_MEMORY_LIMIT_MB = int(
+    os.getenv("CONVERSION_MEMORY_LIMIT_MB", "2048")
+)
+CONVERSION_MAX_TASKS_PER_CHILD = int(
+    os.getenv("CONVERSION_MAX_TASKS_PER_CHILD", "50")
+)
+# Повторная обработка файлов, которые не удалось сконвертировать
+CONVERSION_RETRY_INTERVAL = float(os.getenv("CONVERSION_RETRY_INTERVAL", "600"))
+CONVERSION_MAX_ATTEMPTS = int(os.getenv("CONVERSION_MAX_ATTEMPTS", "3"))
+
+# Пул экземпляров LibreOffice для .doc/.docx/.rtf
+OFFICE_WORKERS = int(os.getenv("OFFICE_WORKERS", "2"))
+OFFICE_BASE_PORT = int(os.getenv("OFFICE_BASE_PORT", "2002"))
+OFFICE_TIMEOUT = float(os.getenv("OFFICE_TIMEOUT", "120"))
+OFFICE_START_TIMEOUT = float(os.getenv("OFFICE_START_TIMEOUT", "60"))
+OFFICE_SERVER_COMMAND = os.getenv(
+    "OFFICE_SERVER_COMMAND", "/usr/bin/python3 -m unoserver.server"
+)
+# Исполняемый файл LibreOffice, который запускает unoserver
+OFFICE_EXECUTABLE = os.getenv("OFFICE_EXECUTABLE", "libreoffice")
+
+# Кеш сконвертированного markdown
+CONVERSION_CACHE_PATH = os.getenv("CONVERSION_CACHE_PATH", ".cache/conversions")
+CONVERSION_CACHE_MAX_MB = int(os.getenv("CONVERSION_CACHE_MAX_MB", "1024"))
+
+# Локальный манифест загруженных файлов
+MANIFEST_PATH = os.getenv("MANIFEST_PATH", ".cache/manifest.sqlite")
+
+# Окно схлопывания событий наблюдателя по одному файлу (секунды)
+WATCHER_DEBOUNCE = float(os.getenv("WATCHER_DEBOUNCE", "1.0"))
+
+# Отложенная запись в Chroma: максимальный размер запроса (записей),
+# интервал сброса буфера (секунды) и число попыток
+CHROMA_MAX_BATCH = int(os.getenv("CHROMA_MAX_BATCH", "500"))
+CHROMA_FLUSH_INTERVAL = float(os.getenv("CHROMA_FLUSH_INTERVAL", "0.5"))
+CHROMA_MAX_RETRIES = int(os.getenv("CHROMA_MAX_RETRIES", "5"))
+
+# Размер чанка и перекрытие между чанками (в токенах)
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "120"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "20"))
+
+# Проекция эмбеддингов (PCA + int8), 0 - хранить эмбеддинги модели как есть
+PROJECTION_DIM = int(os.getenv("PROJECTION_DIM", "0"))
+PROJECTION_QUANTIZE = os.getenv("PROJECTION_QUANTIZE", "false") == "true"
+PROJECTION_DIR = os.getenv("PROJECTION_DIR", ".cache/projections")
+# Выборка чанков для обучения и доля отложенных запросов для отчета
+PROJECTION_SAMPLE_SIZE = int(os.getenv("PROJECTION_SAMPLE_SIZE", "5000"))
+PROJECTION_HOLDOUT = float(os.getenv("PROJECTION_HOLDOUT", "0.1"))
+# Файл с контрольными запросами (по одному на строку) для отчета
+PROJECTION_QUERIES_PATH = os.getenv("PROJECTION_QUERIES_PATH")
+
+# Поиск почти одинаковых чанков (MinHash + LSH): порог похожести
+# по Жаккару, число хеш-функций и полос, сколько источников хранить
+# в метаданных канонического чанка
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true") == "true"
+DEDUP_PATH = os.getenv("DEDUP_PATH", ".cache/dedup.sqlite")
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "64"))
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))
+DEDUP_MAX_SOURCES = int(os.getenv("DEDUP_MAX_SOURCES", "50"))
+
+# HTTP-эндпоинт состояния загрузки (0 - отключен) и его адрес для
+# команды python -m src status
+STATUS_HOST = os.getenv("STATUS_HOST", "127.0.0.1")
+STATUS_PORT = int(os.getenv("STATUS_PORT", "8081"))
+STATUS_URL = os.getenv("STATUS_URL", f"http://localhost:{STATUS_PORT}/status")
+
+# Шардирование коллекции: пусто - одна коллекция, folder - шард на
+# каждую папку верхнего уровня базы знаний
+COLLECTION_SHARD_BY = os.getenv("COLLECTION_SHARD_BY", "")
+
+# Blue/green-переиндексация: как часто перечитывать алиас коллекции
+# (секунды), сколько ждать перед удалением старой коллекции (секунды)
+# и допустимая доля незагруженных документов
+COLLECTION_ALIAS_TTL = float(os.getenv("COLLECTION_ALIAS_TTL", "10"))
+REINDEX_GRACE_PERIOD = float(os.getenv("REINDEX_GRACE_PERIOD", "300"))
+REINDEX_MAX_FAILED_RATIO = float(os.getenv("REINDEX_MAX_FAILED_RATIO", "0.01"))
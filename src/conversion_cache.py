@@ -0,0 +1,141 @@
+import contextlib
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Optional, Tuple
+
+import orjson
+
+from src.config import CONVERSION_CACHE_MAX_MB, CONVERSION_CACHE_PATH
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+class ConversionCache:
+    """
+    Кеш сконвертированного markdown на диске. Ключ - хеш содержимого
+    файла, имя конвертера и его опции/версия, данные хранятся сжатыми,
+    при превышении лимита вытесняются давно не использованные записи.
+    """
+
+    def __init__(
+        self,
+        path: str = CONVERSION_CACHE_PATH,
+        max_bytes: int = CONVERSION_CACHE_MAX_MB * 1024 * 1024,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(content_hash: str, converter: str, options: Any) -> str:
+        payload = orjson.dumps(
+            [content_hash, converter, options],
+            option=orjson.OPT_SORT_KEYS,
+            default=str,
+        )
+        return hashlib.sha256(payload).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._db = sqlite3.connect(
+                os.path.join(self.path, "index.sqlite"),
+                check_same_thread=False,
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                "last_access REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS entries_last_access "
+                "ON entries (last_access)"
+            )
+            self._db.commit()
+        return self._db
+
+    def _file_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.md.z")
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            db = self._connect()
+            row = db.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            try:
+                with open(self._file_path(key), "rb") as file:
+                    content = zlib.decompress(file.read()).decode("utf-8")
+            except (OSError, zlib.error) as e:
+                logger.warning(f"Dropping broken cache entry {key}: {str(e)}")
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                db.commit()
+                return None
+            db.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            db.commit()
+            return content
+
+    def put(self, key: str, content: str) -> None:
+        data = zlib.compress(content.encode("utf-8"), level=6)
+        file_path = self._file_path(key)
+        with self._lock:
+            db = self._connect()
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            tmp_path = f"{file_path}.tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, file_path)
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, size, last_access) "
+                "VALUES (?, ?, ?)",
+                (key, len(data), time.time()),
+            )
+            db.commit()
+            self._prune(self.max_bytes)
+
+    def prune(self, max_bytes: Optional[int] = None) -> Tuple[int, int]:
+        with self._lock:
+            return self._prune(
+                self.max_bytes if max_bytes is None else max_bytes
+            )
+
+    def _prune(self, max_bytes: int) -> Tuple[int, int]:
+        db = self._connect()
+        (total,) = db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        removed, freed = 0, 0
+        if total <= max_bytes:
+            return removed, freed
+
+        for key, size in db.execute(
+            "SELECT key, size FROM entries ORDER BY last_access"
+        ).fetchall():
+            if total - freed <= max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._file_path(key))
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            removed += 1
+            freed += size
+        db.commit()
+        logger.info(f"Evicted {removed} cache entries, freed {freed} bytes")
+        return removed, freed
+
+
+conversion_cache = ConversionCache()
@@ -0,0 +1,131 @@
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import os
+import resource
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional
+
+from src.config import (
+    CONVERSION_MAX_TASKS_PER_CHILD,
+    CONVERSION_MEMORY_LIMIT_MB,
+    CONVERSION_TIMEOUT,
+    CONVERSION_WORKERS,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+class ConversionError(Exception):
+    pass
+
+
+class ConversionTimeoutError(ConversionError):
+    pass
+
+
+def _init_worker(memory_limit_mb: int, worker_pid: Any) -> None:
+    # По этому pid родитель убивает зависший процесс слота
+    worker_pid.value = os.getpid()
+    if memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+class ConversionPool:
+    """
+    Пул процессов для конвертации документов. Каждый слот - отдельный
+    однопроцессный executor, поэтому зависший файл убивает и пересоздает
+    только свой процесс, не затрагивая остальные конвертации.
+    """
+
+    def __init__(
+        self,
+        workers: int = CONVERSION_WORKERS,
+        timeout: float = CONVERSION_TIMEOUT,
+        memory_limit_mb: int = CONVERSION_MEMORY_LIMIT_MB,
+        max_tasks_per_child: int = CONVERSION_MAX_TASKS_PER_CHILD,
+    ):
+        self.workers = max(workers, 1)
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_child = max_tasks_per_child
+
+        self._context = multiprocessing.get_context("spawn")
+        self._slots: List[ProcessPoolExecutor] = []
+        # pid текущего процесса каждого слота, его записывает сам процесс
+        self._pids: List[Any] = []
+        self._free: Optional[asyncio.Queue] = None
+
+    def _create_executor(self, index: int) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self.memory_limit_mb, self._pids[index]),
+            max_tasks_per_child=self.max_tasks_per_child or None,
+        )
+
+    def _ensure_started(self) -> None:
+        if self._free is not None:
+            return
+        self._free = asyncio.Queue()
+        for index in range(self.workers):
+            self._pids.append(self._context.Value("i", 0, lock=False))
+            self._slots.append(self._create_executor(index))
+            self._free.put_nowait(index)
+
+    def _recycle(self, index: int) -> None:
+        # ProcessPoolExecutor не умеет прерывать задачу - убиваем процесс
+        pid = self._pids[index].value
+        if pid:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGKILL)
+            self._pids[index].value = 0
+        self._slots[index].shutdown(wait=False, cancel_futures=True)
+        self._slots[index] = self._create_executor(index)
+
+    async def run(
+        self, func: Callable[..., Any], file_path: str, *args: Any
+    ) -> Any:
+        self._ensure_started()
+        index = await self._free.get()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._slots[index], func, file_path, *args
+            )
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            logger.error(
+                f"Conversion of {file_path} timed out after "
+                f"{self.timeout:.0f}s, recycling worker"
+            )
+            self._recycle(index)
+            raise ConversionTimeoutError(
+                f"Conversion of {file_path} timed out"
+            ) from None
+        except (BrokenProcessPool, MemoryError) as e:
+            logger.error(f"Conversion worker failed on {file_path}: {str(e)}")
+            self._recycle(index)
+            raise ConversionError(
+                f"Conversion worker failed on {file_path}"
+            ) from e
+        finally:
+            self._free.put_nowait(index)
+
+    def shutdown(self) -> None:
+        for executor in self._slots:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._slots = []
+        self._pids = []
+        self._free = None
+
+
+conversion_pool = ConversionPool()
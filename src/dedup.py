@@ -0,0 +1,470 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import orjson
+
+from src.config import (
+    DEDUP_BANDS,
+    DEDUP_MAX_SOURCES,
+    DEDUP_NUM_PERM,
+    DEDUP_PATH,
+    DEDUP_THRESHOLD,
+)
+
+SHINGLE_SIZE = 3
+# Простое число Мерсенна 2^31 - 1: (a * x + b) помещается в uint64
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+class MinHasher:
+    """
+    MinHash-сигнатуры по словесным шинглам текста чанка. Сигнатура
+    режется на полосы для LSH: тексты с похожестью по Жаккару выше
+    порога почти наверняка совпадут хотя бы в одной полосе.
+    """
+
+    def __init__(
+        self, num_perm: int = DEDUP_NUM_PERM, bands: int = DEDUP_BANDS
+    ):
+        if num_perm % bands:
+            raise ValueError("DEDUP_NUM_PERM must be divisible by DEDUP_BANDS")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        # Фиксированное зерно: сигнатуры сравнимы между запусками
+        generator = np.random.default_rng(1)
+        self._a = generator.integers(
+            1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64
+        )
+        self._b = generator.integers(
+            0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64
+        )
+
+    @staticmethod
+    def shingles(text: str) -> Set[str]:
+        words = text.split()
+        if len(words) <= SHINGLE_SIZE:
+            return {" ".join(words)}
+        return {
+            " ".join(words[i : i + SHINGLE_SIZE])
+            for i in range(len(words) - SHINGLE_SIZE + 1)
+        }
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in self.shingles(text)),
+            dtype=np.uint64,
+        )
+        permuted = (np.outer(hashes, self._a) + self._b) % MERSENNE_PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def band_keys(self, signature: np.ndarray) -> List[str]:
+        return [
+            hashlib.md5(
+                signature[band * self.rows : (band + 1) * self.rows].tobytes(),
+                usedforsecurity=False,
+            ).hexdigest()[:16]
+            for band in range(self.bands)
+        ]
+
+    @staticmethod
+    def similarity(first: np.ndarray, second: np.ndarray) -> float:
+        return float(np.mean(first == second))
+
+
+@dataclass
+class DedupPlan:
+    # Чанки, которые нужно векторизовать и записать (metadata в чанке)
+    embed: List[Dict[str, Any]] = field(default_factory=list)
+    # Метаданные уже записанных канонических чанков
+    updates: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    deletes: List[str] = field(default_factory=list)
+    duplicates: int = 0
+
+
+class DedupIndex:
+    """
+    LSH-индекс почти одинаковых чанков по всему корпусу. Из группы
+    похожих чанков в Chroma хранится один канонический, а каждое его
+    вхождение в документы записано как ссылка; список ссылок попадает
+    в метаданные канонического чанка (sources). Канонический чанк
+    удаляется вместе с последней ссылкой, а при удалении документа-
+    владельца переходит к следующему документу.
+    """
+
+    def __init__(
+        self,
+        path: str = DEDUP_PATH,
+        threshold: float = DEDUP_THRESHOLD,
+        hasher: Optional[MinHasher] = None,
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher()
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(
+                "CREATE TABLE IF NOT EXISTS canonicals ("
+                "collection TEXT NOT NULL, chunk_id TEXT NOT NULL, "
+                "signature BLOB NOT NULL, owner_path TEXT NOT NULL, "
+                "owner_ref TEXT NOT NULL, "
+                "committed INTEGER NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (collection, chunk_id));"
+                "CREATE TABLE IF NOT EXISTS bands ("
+                "collection TEXT NOT NULL, band INTEGER NOT NULL, "
+                "key TEXT NOT NULL, chunk_id TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS bands_key "
+                "ON bands (collection, band, key);"
+                "CREATE INDEX IF NOT EXISTS bands_chunk "
+                "ON bands (collection, chunk_id);"
+                "CREATE TABLE IF NOT EXISTS refs ("
+                "collection TEXT NOT NULL, file_path TEXT NOT NULL, "
+                "ref_id TEXT NOT NULL, chunk_id TEXT NOT NULL, "
+                "metadata BLOB NOT NULL, "
+                "PRIMARY KEY (collection, file_path, ref_id));"
+                "CREATE INDEX IF NOT EXISTS refs_chunk "
+                "ON refs (collection, chunk_id);"
+            )
+            columns = {
+                row[1]
+                for row in self._db.execute("PRAGMA table_info(canonicals)")
+            }
+            if "committed" not in columns:
+                # Индекс, созданный до двухфазной записи: его канонические
+                # чанки уже были в Chroma
+                self._db.execute(
+                    "ALTER TABLE canonicals "
+                    "ADD COLUMN committed INTEGER NOT NULL DEFAULT 1"
+                )
+            self._db.commit()
+        return self._db
+
+    def apply(
+        self,
+        collection: str,
+        file_path: str,
+        chunks: List[Dict[str, Any]],
+        existing_ids: Iterable[str],
+        reembed: bool = False,
+    ) -> DedupPlan:
+        """
+        Заменяет ссылки документа на chunks. existing_ids - чанки
+        документа, уже записанные в Chroma (из манифеста). reembed
+        заново записывает канонические чанки документа, даже уже
+        подтвержденные: их эмбеддинги посчитаны прежней моделью.
+
+        Канонический чанк считается записанным только после confirm:
+        пока запись владельца не подтверждена, каждый документ со
+        ссылкой на чанк записывает его сам (своим текстом), а не
+        обновляет метаданные несуществующей записи.
+        """
+        existing_ids = set(existing_ids)
+        current = {chunk["id"]: chunk for chunk in chunks}
+        plan = DedupPlan()
+
+        with self._lock:
+            db = self._connect()
+            with db:
+                refs = dict(
+                    db.execute(
+                        "SELECT ref_id, chunk_id FROM refs "
+                        "WHERE collection = ? AND file_path = ?",
+                        (collection, file_path),
+                    ).fetchall()
+                )
+                touched = self._drop_refs(
+                    db,
+                    collection,
+                    file_path,
+                    refs,
+                    (set(refs) | existing_ids) - set(current),
+                    plan,
+                )
+                texts = self._add_refs(
+                    db, collection, file_path, refs, current, existing_ids, plan
+                )
+                touched.update(texts)
+                self._plan_canonicals(
+                    db, collection, touched, texts, reembed, plan
+                )
+        return plan
+
+    def _drop_refs(
+        self,
+        db: sqlite3.Connection,
+        collection: str,
+        file_path: str,
+        refs: Dict[str, str],
+        ref_ids: Iterable[str],
+        plan: DedupPlan,
+    ) -> Set[str]:
+        # Удаляет ссылки на исчезнувшие из документа чанки и возвращает
+        # канонические чанки, метаданные которых нужно пересобрать
+        touched = set()
+        for ref_id in ref_ids:
+            chunk_id = refs.get(ref_id)
+            if chunk_id is None:
+                # Запись, сделанная без дедупликации
+                if not self._is_canonical(db, collection, ref_id):
+                    plan.deletes.append(ref_id)
+                continue
+            db.execute(
+                "DELETE FROM refs WHERE collection = ? "
+                "AND file_path = ? AND ref_id = ?",
+                (collection, file_path, ref_id),
+            )
+            touched.add(chunk_id)
+        return touched
+
+    def _add_refs(
+        self,
+        db: sqlite3.Connection,
+        collection: str,
+        file_path: str,
+        refs: Dict[str, str],
+        current: Dict[str, Dict[str, Any]],
+        existing_ids: Set[str],
+        plan: DedupPlan,
+    ) -> Dict[str, Dict[str, Any]]:
+        # Возвращает канонический чанк -> чанк документа, текстом
+        # которого он записывается, если его еще нет в Chroma
+        texts: Dict[str, Dict[str, Any]] = {}
+        for ref_id, chunk in current.items():
+            chunk_id = refs.get(ref_id)
+            if chunk_id is None:
+                chunk_id = self._register(db, collection, file_path, chunk)
+                if chunk_id != ref_id:
+                    plan.duplicates += 1
+                    if ref_id in existing_ids:
+                        # Раньше чанк хранился отдельно от дубликатов
+                        plan.deletes.append(ref_id)
+            texts.setdefault(chunk_id, chunk)
+            db.execute(
+                "INSERT OR REPLACE INTO refs (collection, file_path, "
+                "ref_id, chunk_id, metadata) VALUES (?, ?, ?, ?, ?)",
+                (
+                    collection,
+                    file_path,
+                    ref_id,
+                    chunk_id,
+                    orjson.dumps(chunk["metadata"]),
+                ),
+            )
+        return texts
+
+    def _plan_canonicals(
+        self,
+        db: sqlite3.Connection,
+        collection: str,
+        touched: Iterable[str],
+        texts: Dict[str, Dict[str, Any]],
+        reembed: bool,
+        plan: DedupPlan,
+    ) -> None:
+        for chunk_id in touched:
+            metadata = self._canonical_metadata(db, collection, chunk_id)
+            if metadata is None:
+                plan.deletes.append(chunk_id)
+            elif chunk_id in texts and (
+                reembed or not self._is_committed(db, collection, chunk_id)
+            ):
+                plan.embed.append(
+                    {**texts[chunk_id], "id": chunk_id, "metadata": metadata}
+                )
+            else:
+                plan.updates[chunk_id] = metadata
+
+    def confirm(self, collection: str, chunk_ids: Iterable[str]) -> None:
+        """Отмечает канонические чанки, запись которых подтвердила Chroma."""
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.executemany(
+                    "UPDATE canonicals SET committed = 1 "
+                    "WHERE collection = ? AND chunk_id = ?",
+                    [(collection, chunk_id) for chunk_id in chunk_ids],
+                )
+
+    def remove_file(
+        self, collection: str, file_path: str, existing_ids: Iterable[str]
+    ) -> DedupPlan:
+        return self.apply(collection, file_path, [], existing_ids)
+
+    def chunk_ids(self, collection: str, file_path: str) -> Set[str]:
+        # Идентификаторы записей в Chroma, на которые ссылается документ
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(
+                    "SELECT chunk_id FROM refs "
+                    "WHERE collection = ? AND file_path = ?",
+                    (collection, file_path),
+                )
+                .fetchall()
+            )
+        return {chunk_id for (chunk_id,) in rows}
+
+    def clear(self, collection: str) -> None:
+        with self._lock:
+            db = self._connect()
+            with db:
+                for statement in (
+                    "DELETE FROM canonicals WHERE collection = ?",
+                    "DELETE FROM bands WHERE collection = ?",
+                    "DELETE FROM refs WHERE collection = ?",
+                ):
+                    db.execute(statement, (collection,))
+
+    def _is_canonical(
+        self, db: sqlite3.Connection, collection: str, chunk_id: str
+    ) -> bool:
+        return (
+            db.execute(
+                "SELECT 1 FROM canonicals WHERE collection = ? "
+                "AND chunk_id = ?",
+                (collection, chunk_id),
+            ).fetchone()
+            is not None
+        )
+
+    def _is_committed(
+        self, db: sqlite3.Connection, collection: str, chunk_id: str
+    ) -> bool:
+        row = db.execute(
+            "SELECT committed FROM canonicals "
+            "WHERE collection = ? AND chunk_id = ?",
+            (collection, chunk_id),
+        ).fetchone()
+        return bool(row and row[0])
+
+    def _register(
+        self,
+        db: sqlite3.Connection,
+        collection: str,
+        file_path: str,
+        chunk: Dict[str, Any],
+    ) -> str:
+        signature = self.hasher.signature(chunk["text"])
+        keys = self.hasher.band_keys(signature)
+        match = self._find(db, collection, signature, keys)
+        if match:
+            return match
+
+        db.execute(
+            "INSERT OR REPLACE INTO canonicals (collection, chunk_id, "
+            "signature, owner_path, owner_ref) VALUES (?, ?, ?, ?, ?)",
+            (
+                collection,
+                chunk["id"],
+                signature.tobytes(),
+                file_path,
+                chunk["id"],
+            ),
+        )
+        db.executemany(
+            "INSERT INTO bands (collection, band, key, chunk_id) "
+            "VALUES (?, ?, ?, ?)",
+            [
+                (collection, band, key, chunk["id"])
+                for band, key in enumerate(keys)
+            ],
+        )
+        return chunk["id"]
+
+    def _find(
+        self,
+        db: sqlite3.Connection,
+        collection: str,
+        signature: np.ndarray,
+        keys: List[str],
+    ) -> Optional[str]:
+        candidates = {
+            chunk_id
+            for band, key in enumerate(keys)
+            for (chunk_id,) in db.execute(
+                "SELECT chunk_id FROM bands WHERE collection = ? "
+                "AND band = ? AND key = ?",
+                (collection, band, key),
+            )
+        }
+        best: Tuple[float, Optional[str]] = (0.0, None)
+        for chunk_id in sorted(candidates):
+            (stored,) = db.execute(
+                "SELECT signature FROM canonicals WHERE collection = ? "
+                "AND chunk_id = ?",
+                (collection, chunk_id),
+            ).fetchone()
+            similarity = self.hasher.similarity(
+                signature, np.frombuffer(stored, dtype=np.uint32)
+            )
+            if similarity >= self.threshold and similarity > best[0]:
+                best = (similarity, chunk_id)
+        return best[1]
+
+    def _canonical_metadata(
+        self, db: sqlite3.Connection, collection: str, chunk_id: str
+    ) -> Optional[Dict[str, Any]]:
+        refs = db.execute(
+            "SELECT file_path, ref_id, metadata FROM refs "
+            "WHERE collection = ? AND chunk_id = ? ORDER BY rowid",
+            (collection, chunk_id),
+        ).fetchall()
+        if not refs:
+            db.execute(
+                "DELETE FROM canonicals WHERE collection = ? AND chunk_id = ?",
+                (collection, chunk_id),
+            )
+            db.execute(
+                "DELETE FROM bands WHERE collection = ? AND chunk_id = ?",
+                (collection, chunk_id),
+            )
+            return None
+
+        owner = db.execute(
+            "SELECT owner_path, owner_ref FROM canonicals "
+            "WHERE collection = ? AND chunk_id = ?",
+            (collection, chunk_id),
+        ).fetchone()
+        owner_ref = next(
+            (ref for ref in refs if (ref[0], ref[1]) == owner), refs[0]
+        )
+        if (owner_ref[0], owner_ref[1]) != owner:
+            # Документ-владелец больше не содержит чанк
+            db.execute(
+                "UPDATE canonicals SET owner_path = ?, owner_ref = ? "
+                "WHERE collection = ? AND chunk_id = ?",
+                (owner_ref[0], owner_ref[1], collection, chunk_id),
+            )
+
+        sources = []
+        for _, _, blob in refs[:DEDUP_MAX_SOURCES]:
+            ref_metadata = orjson.loads(blob)
+            sources.append(
+                {
+                    "file_path": ref_metadata["file_path"],
+                    "section": ref_metadata.get("section"),
+                    "chunk_start": ref_metadata.get("chunk_start"),
+                    "chunk_end": ref_metadata.get("chunk_end"),
+                }
+            )
+        return {
+            **orjson.loads(owner_ref[2]),
+            "sources": orjson.dumps(sources).decode(),
+            "source_count": len(refs),
+        }
+
+
+dedup_index = DedupIndex()
@@ -1,48 +1,61 @@
 import asyncio
+import hashlib
 import logging
 import os
-from typing import Dict
+from importlib.metadata import version
+from typing import Any, Dict, Optional, Tuple
 
 import aiofiles
 import pymupdf4llm
 
+from src.conversion_cache import conversion_cache
+from src.conversion_pool import conversion_pool
+from src.office_pool import office_pool
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
 )
 logger = logging.getLogger(__name__)
 
+OFFICE_EXTENSIONS = (".doc", ".docx", ".rtf")
+SUPPORTED_EXTENSIONS = (*OFFICE_EXTENSIONS, ".pdf", ".md")
+# Временные и lock-файлы офисных редакторов
+TEMPORARY_PREFIXES = (".~lock.", "~$", ".#")
 
-async def office_to_pdf(file_path: str) -> str:
-    output_dir = os.path.dirname(file_path)
-    base_name = os.path.basename(file_path)
-    pdf_file = os.path.join(output_dir, os.path.splitext(base_name)[0] + ".pdf")
+PDF_MARKDOWN_OPTIONS: Dict[str, Any] = {
+    "write_images": False,
+    "embed_images": False,
+    "graphics_limit": None,
+    "margins": (0, 0, 0, 0),
+    "table_strategy": "lines_strict",
+    "fontsize_limit": 1,
+    "ignore_code": True,
+    "show_progress": False,
+}
 
-    try:
-        process = await asyncio.create_subprocess_exec(
-            "libreoffice",
-            "--headless",
-            "--convert-to",
-            "pdf",
-            file_path,
-            "--outdir",
-            output_dir,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        stdout, stderr = await process.communicate()
+# Версия конвертера входит в ключ кеша: обновление pymupdf4llm
+# или опций конвертации инвалидирует сохраненный markdown
+PDF_CONVERTER_OPTIONS: Dict[str, Any] = {
+    **PDF_MARKDOWN_OPTIONS,
+    "pymupdf4llm": version("pymupdf4llm"),
+}
 
-        if process.returncode != 0:
-            logger.error(
-                f"Error converting {file_path} to PDF: {stderr.decode()}"
-            )
-            raise RuntimeError(f"Failed to convert {file_path} to PDF")
+# Файлы, которые не удалось сконвертировать: путь -> ошибка и число попыток
+failed_files: Dict[str, Dict[str, Any]] = {}
+
+
+def is_ingestible(file_path: str) -> bool:
+    name = os.path.basename(file_path)
+    if name.startswith(TEMPORARY_PREFIXES):
+        return False
+    return os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS
 
-        logger.info(f"Successfully converted {file_path} to PDF")
-        return pdf_file
-    except Exception as e:
-        logger.error(f"Error in office_to_pdf: {str(e)}")
-        raise
+
+async def office_to_pdf(file_path: str) -> str:
+    # PDF создается во временном каталоге пула, а не рядом с исходником,
+    # иначе наблюдатель принял бы его за новый документ
+    return await office_pool.convert(file_path)
 
 
 async def read_markdown_file(file_path: str) -> str:
@@ -55,6 +68,11 @@ async def read_markdown_file(file_path: str) -> str:
         raise
 
 
+def pdf_to_markdown(file_path: str) -> str:
+    # Выполняется в процессе пула конвертации
+    return pymupdf4llm.to_markdown(file_path, **PDF_MARKDOWN_OPTIONS)
+
+
 async def convert_to_markdown(file_path: str) -> Dict[str, str]:
     _, ext = os.path.splitext(file_path)
     ext = ext.lower()
@@ -65,47 +83,20 @@ async def convert_to_markdown(file_path: str) -> Dict[str, str]:
         "conversion_method": "",
     }
 
-    converters = {
-        (".doc", ".docx", ".rtf"): lambda f: (
-            pymupdf4llm.to_markdown(
-                f,
-                write_images=False,
-                embed_images=False,
-                graphics_limit=None,
-                margins=(0, 0, 0, 0),
-                table_strategy="lines_strict",
-                fontsize_limit=1,
-                ignore_code=True,
-                show_progress=False,
-            ),
-            "office_to_pdf",
-        ),
-        ".pdf": lambda f: (
-            pymupdf4llm.to_markdown(
-                f,
-                write_images=False,
-                embed_images=False,
-                graphics_limit=None,
-                margins=(0, 0, 0, 0),
-                table_strategy="lines_strict",
-                fontsize_limit=1,
-                ignore_code=True,
-                show_progress=False,
-            ),
-            "direct_pdf",
-        ),
-        ".md": read_markdown_file,
-    }
-
     try:
-        if ext in (".doc", ".docx", ".rtf"):
+        if ext in OFFICE_EXTENSIONS:
             pdf_file = await office_to_pdf(file_path)
-            content, method = converters[".pdf"](pdf_file)
+            try:
+                content = await conversion_pool.run(pdf_to_markdown, pdf_file)
+            finally:
+                os.remove(pdf_file)
+            method = "office_to_pdf"
         elif ext == ".md":
-            content = await converters[".md"](file_path)
+            content = await read_markdown_file(file_path)
             method = "direct_markdown"
         elif ext == ".pdf":
-            content, method = converters[".pdf"](file_path)
+            content = await conversion_pool.run(pdf_to_markdown, file_path)
+            method = "direct_pdf"
         else:
             raise ValueError(f"Unsupported file extension: {ext}")
 
@@ -117,9 +108,61 @@ async def convert_to_markdown(file_path: str) -> Dict[str, str]:
         raise
 
 
-async def process_file(file_path: str) -> Dict[str, str]:
+def _hash_file(file_path: str) -> str:
+    with open(file_path, "rb") as f:
+        return hashlib.file_digest(f, "md5").hexdigest()
+
+
+def _cache_converter(file_path: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in OFFICE_EXTENSIONS:
+        return "office_to_pdf", {
+            **PDF_CONVERTER_OPTIONS,
+            **office_pool.versions(),
+        }
+    if ext == ".pdf":
+        return "direct_pdf", PDF_CONVERTER_OPTIONS
+    # markdown читается напрямую, кешировать нечего
+    return None
+
+
+async def process_file(
+    file_path: str, file_hash: Optional[str] = None
+) -> Dict[str, str]:
+    cache_key = None
+    converter = await asyncio.to_thread(_cache_converter, file_path)
+    if converter:
+        if file_hash is None:
+            file_hash = await asyncio.to_thread(_hash_file, file_path)
+        cache_key = conversion_cache.make_key(file_hash, *converter)
+        content = await asyncio.to_thread(conversion_cache.get, cache_key)
+        if content is not None:
+            logger.info(f"Using cached markdown for {file_path}")
+            failed_files.pop(file_path, None)
+            ext = os.path.splitext(file_path)[1].lower()
+            return {
+                "content": content,
+                "metadata": {
+                    "original_file": file_path,
+                    "file_type": ext[1:],
+                    "conversion_method": converter[0],
+                },
+            }
+
     try:
-        return await convert_to_markdown(file_path)
+        result = await convert_to_markdown(file_path)
+        failed_files.pop(file_path, None)
+        if cache_key:
+            await asyncio.to_thread(
+                conversion_cache.put, cache_key, result["content"]
+            )
+        return result
     except Exception as e:
-        logger.error(f"Error processing file {file_path}: {str(e)}")
+        # Файл будет повторно обработан позже, см. retry_failed_files
+        error = str(e) or type(e).__name__
+        attempts = failed_files.get(file_path, {}).get("attempts", 0) + 1
+        failed_files[file_path] = {"error": error, "attempts": attempts}
+        logger.error(
+            f"Error processing file {file_path} (attempt {attempts}): {error}"
+        )
         raise
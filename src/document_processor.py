@@ -2,15 +2,20 @@ import asyncio
 import hashlib
 import logging
 import os
-import re
-from typing import Dict, List
+from typing import Awaitable, Dict, List, Optional, Set
 
 import chromadb
-from chromadb.api.models.Collection import Collection
-from sentence_transformers import SentenceTransformer
 
-from src.config import CHROMA_COLLECTION_NAME, EMBEDDING_MODEL_NAME
+from src.chroma_writer import ChromaWriter, get_writer
+from src.chunker import chunk_markdown
+from src.collection_router import collection_router
+from src.config import DEDUP_ENABLED, EMBEDDING_MODEL_NAME
+from src.dedup import DedupPlan, dedup_index
 from src.document_converter import process_file
+from src.embedding_service import embedding_service
+from src.manifest import ManifestEntry, manifest
+from src.projection_manager import projection_manager
+from src.status import ingest_stats
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,179 +23,411 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Увеличивается при изменениях, влияющих на содержимое чанков
+PIPELINE_VERSION = "3"
+HASH_BUFFER_SIZE = 1024 * 1024
+
 
 def calculate_file_hash(file_path: str) -> str:
-    with open(file_path, "rb") as f:
+    with open(file_path, "rb", buffering=0) as f:
         file_hash = hashlib.md5()
-        chunk = f.read(8192)
-        while chunk:
-            file_hash.update(chunk)
-            chunk = f.read(8192)
+        buffer = bytearray(HASH_BUFFER_SIZE)
+        view = memoryview(buffer)
+        while size := f.readinto(buffer):
+            file_hash.update(view[:size])
     return file_hash.hexdigest()
 
 
-async def preprocess_markdown(markdown_content: str) -> str:
-    clean_content = markdown_content.lower()
-    clean_content = re.sub(r"<!--.*?-->", "", clean_content, flags=re.DOTALL)
-    clean_content = re.sub(r"[^\w\s.,;:?!-]", " ", clean_content)
-    clean_content = re.sub(r"\s+", " ", clean_content).strip()
-    return clean_content
-
-
-def extract_section_numbers(content: str) -> List[str]:
-    # Это регулярное выражение ищет номера секций в форматах типа "1.", "1.1.", "1.1.1." и т.д.
-    section_pattern = r"(?<!\d)(\d+(\.\d+)*)(?=\s)"
-    return re.findall(section_pattern, content)
-
+async def hash_file(file_path: str) -> str:
+    return await asyncio.to_thread(calculate_file_hash, file_path)
 
-async def split_into_chunks(
-    clean_content: str, chunk_size: int = 500
-) -> List[Dict[str, str]]:
-    sentences = re.split(r"(?<=[.!?])\s+", clean_content)
-    chunks = []
-    current_chunk = []
-    current_length = 0
-    current_section = ""
-
-    for sentence in sentences:
-        section_numbers = extract_section_numbers(sentence)
-        if section_numbers:
-            current_section = section_numbers[0]
-
-        if current_length + len(sentence) > chunk_size and current_chunk:
-            chunk_text = " ".join(current_chunk)
-            chunks.append(
-                {
-                    "text": chunk_text,
-                    "start_index": clean_content.index(chunk_text),
-                    "end_index": clean_content.index(chunk_text)
-                    + len(chunk_text),
-                    "section": current_section,
-                }
-            )
-            current_chunk = []
-            current_length = 0
-        current_chunk.append(sentence)
-        current_length += len(sentence)
-
-    if current_chunk:
-        chunk_text = " ".join(current_chunk)
-        chunks.append(
-            {
-                "text": chunk_text,
-                "start_index": clean_content.index(chunk_text),
-                "end_index": clean_content.index(chunk_text) + len(chunk_text),
-                "section": current_section,
-            }
-        )
 
-    return chunks
+def pipeline_version() -> str:
+    # Смена модели, проекции или версии пайплайна инвалидирует записи
+    # манифеста
+    version = f"{PIPELINE_VERSION}:{EMBEDDING_MODEL_NAME}"
+    if DEDUP_ENABLED:
+        version = f"{version}:dedup"
+    if projection_manager.id:
+        version = f"{version}:{projection_manager.id}"
+    return version
 
 
 async def create_embeddings(
     chunks: List[Dict[str, str]],
-    model_name: str = EMBEDDING_MODEL_NAME,
-    batch_size: int = 8,
 ) -> List[List[float]]:
-    model = SentenceTransformer(model_name)
-
-    embeddings = []
-
-    for start in range(0, len(chunks), batch_size):
-        end = start + batch_size
-        batch_chunks = [chunk["text"] for chunk in chunks[start:end]]
-        batch_embeddings = await asyncio.to_thread(
-            model.encode,
-            batch_chunks,
-            batch_size=batch_size,
-            show_progress_bar=True,
+    # Чанки попадают в общий батч вместе с чанками других документов
+    with ingest_stats.stage("embed"):
+        embeddings = await embedding_service.encode(
+            [chunk["text"] for chunk in chunks]
         )
-        embeddings.extend(batch_embeddings)
+    # Та же проекция применяется к запросам в services/qna.py
+    return projection_manager.transform(embeddings)
+
 
-    return embeddings
+def make_chunk_id(file_path: str, text: str) -> str:
+    # Идентификатор зависит только от пути и нормализованного текста чанка,
+    # поэтому правка одного абзаца не меняет идентификаторы остальных
+    normalized = " ".join(text.lower().split())
+    digest = hashlib.sha256(f"{file_path}\0{normalized}".encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def assign_chunk_ids(
+    file_path: str, chunks: List[Dict[str, str]]
+) -> List[Dict[str, str]]:
+    # Повторяющийся внутри документа текст хранится один раз
+    unique_chunks = {}
+    for chunk in chunks:
+        chunk_id = make_chunk_id(file_path, chunk["text"])
+        unique_chunks.setdefault(chunk_id, {**chunk, "id": chunk_id})
+    return list(unique_chunks.values())
+
+
+def chunk_metadata(
+    chunk: Dict[str, str], metadata: Dict[str, str]
+) -> Dict[str, str]:
+    return {
+        **metadata,
+        "section": chunk["section"],
+        "chunk_start": chunk["start_index"],
+        "chunk_end": chunk["end_index"],
+        "chunk_index": chunk["index"],
+    }
 
 
 async def upsert_to_chroma(
     embeddings: List[List[float]],
     chunks: List[Dict[str, str]],
     metadata: Dict[str, str],
-    collection: Collection,
-    file_hash: str,
+    writer: ChromaWriter,
+    collection: str,
 ):
-    ids = [f"{file_hash}_{i}" for i in range(len(chunks))]
-    documents = [chunk["text"] for chunk in chunks]
-    metadatas = [
-        {
-            **metadata,
-            "chunk_start": chunk["start_index"],
-            "chunk_end": chunk["end_index"],
-            "chunk_index": i,
-        }
-        for i, chunk in enumerate(chunks)
-    ]
-
-    await collection.upsert(
-        ids=ids,
-        documents=documents,
+    await writer.upsert(
+        collection,
+        ids=[chunk["id"] for chunk in chunks],
+        documents=[chunk["text"] for chunk in chunks],
         embeddings=embeddings,
-        metadatas=metadatas,
+        metadatas=[chunk_metadata(chunk, metadata) for chunk in chunks],
     )
 
 
-async def process_document(
+async def plan_writes(
+    plan: DedupPlan, writer: ChromaWriter, collection: str
+) -> List[Awaitable[None]]:
+    writes = []
+    if plan.embed:
+        embeddings = await create_embeddings(plan.embed)
+        writes.append(
+            writer.upsert(
+                collection,
+                ids=[chunk["id"] for chunk in plan.embed],
+                documents=[chunk["text"] for chunk in plan.embed],
+                embeddings=embeddings,
+                metadatas=[chunk["metadata"] for chunk in plan.embed],
+            )
+        )
+    if plan.updates:
+        # Канонические чанки получают новый список источников
+        writes.append(
+            writer.update(
+                collection,
+                ids=list(plan.updates),
+                metadatas=list(plan.updates.values()),
+            )
+        )
+    if plan.deletes:
+        writes.append(writer.delete(collection, ids=plan.deletes))
+    return writes
+
+
+async def prepare_collection(
     file_path: str, chroma_client: chromadb.AsyncClientAPI
+) -> str:
+    # Коллекция нового шарда создается с той же проекцией, что и остальные
+    await collection_router.register(
+        chroma_client,
+        file_path,
+        lambda name: projection_manager.ensure(chroma_client, name),
+    )
+    return collection_router.collection_for(file_path)
+
+
+async def remove_document(
+    file_path: str,
+    chroma_client: chromadb.AsyncClientAPI,
+    collection_name: Optional[str] = None,
 ):
-    try:
-        logger.info(f"Processing document: {file_path}")
+    writer = get_writer(chroma_client)
+    collection_name = collection_name or collection_router.collection_for(
+        file_path
+    )
+    if DEDUP_ENABLED:
+        # Общие с другими документами чанки остаются, меняется только
+        # список источников и, возможно, документ-владелец
+        entry = manifest.get(collection_name, file_path)
+        plan = await asyncio.to_thread(
+            dedup_index.remove_file,
+            collection_name,
+            file_path,
+            entry.chunk_ids if entry else [],
+        )
+        await asyncio.gather(*await plan_writes(plan, writer, collection_name))
+    else:
+        # Файла уже нет, поэтому удаляем по метаданным file_path
+        await writer.delete(collection_name, file_paths=[file_path])
+    manifest.remove(collection_name, file_path)
+
+
+async def remove_misrouted(chroma_client: chromadb.AsyncClientAPI) -> None:
+    # После включения шардирования документы уходят из основной
+    # коллекции и загружаются заново в коллекции своих шардов
+    for name in collection_router.collections():
+        for file_path in manifest.paths(name):
+            if collection_router.collection_for(file_path) != name:
+                logger.info(f"Документ {file_path} переносится из {name}")
+                await remove_document(file_path, chroma_client, name)
+
+
+async def change_reason(file_path: str) -> Optional[str]:
+    # Почему документ будет обработан заново (None - не будет)
+    entry = manifest.get(collection_router.collection_for(file_path), file_path)
+    if entry is None:
+        return "new"
+    if entry.pipeline_version != pipeline_version():
+        return "pipeline"
+    if entry.matches_stat(os.stat(file_path), entry.pipeline_version):
+        return None
+    if await hash_file(file_path) == entry.content_hash:
+        return None
+    return "content"
+
+
+async def unchanged_hash(
+    file_path: str,
+    collection_name: str,
+    entry: Optional[ManifestEntry],
+    stat: os.stat_result,
+    version: str,
+) -> Optional[str]:
+    """
+    Хеш содержимого файла или None, если по манифесту документ
+    не изменился и обрабатывать его не нужно.
+    """
+    if entry and entry.matches_stat(stat, version):
+        logger.debug(f"Документ {file_path} не изменился, пропускаем")
+        return None
+
+    with ingest_stats.stage("hash"):
+        file_hash = await hash_file(file_path)
+    if (
+        entry
+        and entry.pipeline_version == version
+        and entry.content_hash == file_hash
+    ):
+        manifest.update_stat(collection_name, file_path, stat)
+        logger.info(f"Документ {file_path} не изменился, пропускаем")
+        return None
+    return file_hash
+
+
+async def existing_chunk_ids(
+    file_path: str,
+    collection_name: str,
+    entry: Optional[ManifestEntry],
+    writer: ChromaWriter,
+) -> Set[str]:
+    if entry:
+        return set(entry.chunk_ids)
+    if collection_router.is_staging(collection_name):
+        # Коллекция blue/green-переиндексации создана пустой, и
+        # спрашивать Chroma о каждом документе незачем
+        return set()
+    # Манифест пуст (первый запуск или потерян) - спрашиваем Chroma
+    collection = await writer.get_collection(collection_name)
+    existing_chunks = await collection.get(
+        where={"file_path": file_path}, include=[]
+    )
+    return set(existing_chunks["ids"])
 
-        file_hash = calculate_file_hash(file_path)
-        last_modified = os.path.getmtime(file_path)
 
-        collection = await chroma_client.get_or_create_collection(
-            name=CHROMA_COLLECTION_NAME
+async def write_deduplicated(
+    file_path: str,
+    chunks: List[Dict[str, str]],
+    metadata: Dict[str, str],
+    existing_ids: Set[str],
+    reembed: bool,
+    writer: ChromaWriter,
+    collection_name: str,
+) -> None:
+    for chunk in chunks:
+        chunk["metadata"] = chunk_metadata(chunk, metadata)
+    with ingest_stats.stage("dedup"):
+        plan = await asyncio.to_thread(
+            dedup_index.apply,
+            collection_name,
+            file_path,
+            chunks,
+            existing_ids,
+            reembed,
+        )
+    if plan.duplicates:
+        logger.info(
+            f"Документ {file_path}: {plan.duplicates} чанков "
+            "совпадают с уже загруженными"
+        )
+    writes = await plan_writes(plan, writer, collection_name)
+    with ingest_stats.stage("upsert"):
+        await asyncio.gather(*writes)
+    if plan.embed:
+        # Дубликаты ссылаются на канонический чанк как на записанный
+        # только после подтверждения Chroma
+        await asyncio.to_thread(
+            dedup_index.confirm,
+            collection_name,
+            [chunk["id"] for chunk in plan.embed],
         )
 
-        # Проверяем, есть ли уже документ с таким хешем
-        existing_docs = await collection.get(where={"file_hash": file_hash})
-        if existing_docs["ids"]:
-            existing_doc = existing_docs["metadatas"][0]
-            if existing_doc["last_modified"] == last_modified:
-                logger.info(f"Документ {file_path} не изменился, пропускаем")
-                return
-            logger.info(f"Документ {file_path} изменился, обновляем")
+
+async def write_diff(
+    new_chunks: List[Dict[str, str]],
+    kept_chunks: List[Dict[str, str]],
+    removed_ids: Set[str],
+    metadata: Dict[str, str],
+    writer: ChromaWriter,
+    collection_name: str,
+) -> None:
+    writes = []
+    if new_chunks:
+        embeddings = await create_embeddings(new_chunks)
+        writes.append(
+            upsert_to_chroma(
+                embeddings,
+                new_chunks,
+                metadata,
+                writer,
+                collection_name,
+            )
+        )
+    if kept_chunks:
+        # Смещения и хеш файла у сохранившихся чанков обновляются
+        # без пересчета эмбеддингов
+        writes.append(
+            writer.update(
+                collection_name,
+                ids=[chunk["id"] for chunk in kept_chunks],
+                metadatas=[
+                    chunk_metadata(chunk, metadata) for chunk in kept_chunks
+                ],
+            )
+        )
+    if removed_ids:
+        writes.append(writer.delete(collection_name, ids=list(removed_ids)))
+    with ingest_stats.stage("upsert"):
+        await asyncio.gather(*writes)
+
+
+async def process_document(
+    file_path: str, chroma_client: chromadb.AsyncClientAPI, force: bool = False
+):
+    """
+    force пропускает проверку манифеста: документ заново конвертируется
+    и режется на чанки; эмбеддинги по-прежнему считаются только для
+    чанков, которых еще нет в коллекции.
+    """
+    try:
+        version = pipeline_version()
+        stat = os.stat(file_path)
+        collection_name = await prepare_collection(file_path, chroma_client)
+        entry = manifest.get(collection_name, file_path)
+        if force:
+            with ingest_stats.stage("hash"):
+                file_hash = await hash_file(file_path)
         else:
-            logger.info(f"Добавляем новый документ {file_path}")
+            file_hash = await unchanged_hash(
+                file_path, collection_name, entry, stat, version
+            )
+            if file_hash is None:
+                return
+
+        logger.info(f"Processing document: {file_path}")
+        writer = get_writer(chroma_client)
 
-        conversion_result = await process_file(file_path)
+        with ingest_stats.stage("convert"):
+            conversion_result = await process_file(file_path, file_hash)
         markdown_content = conversion_result["content"]
-        metadata = conversion_result["metadata"]
-
-        clean_content = await preprocess_markdown(markdown_content)
-        chunks = await split_into_chunks(clean_content)
-
-        # Получаем существующие чанки для этого документа
-        existing_chunks = await collection.get(where={"file_path": file_path})
-
-        # Сравниваем новые чанки с существующими и обновляем только измененные
-        chunks_to_update = []
-        for chunk in chunks:
-            existing_chunk = next(
-                (
-                    ec
-                    for ec in existing_chunks["documents"]
-                    if ec["section"] == chunk["section"]
-                ),
-                None,
+        metadata = {
+            **conversion_result["metadata"],
+            "file_path": file_path,
+            "file_hash": file_hash,
+            "last_modified": stat.st_mtime,
+        }
+
+        # Чанкинг - чистая CPU-работа, для больших документов уносим
+        # ее из цикла событий
+        with ingest_stats.stage("chunk"):
+            chunks = assign_chunk_ids(
+                file_path,
+                await asyncio.to_thread(chunk_markdown, markdown_content),
+            )
+        for index, chunk in enumerate(chunks):
+            chunk["index"] = index
+
+        # Сравниваем множества идентификаторов: эмбеддинги нужны только
+        # для новых чанков, исчезнувшие удаляются одним запросом
+        existing_ids = await existing_chunk_ids(
+            file_path, collection_name, entry, writer
+        )
+        # После смены модели или проекции старые эмбеддинги не годятся:
+        # все чанки считаются заново, старые идентификаторы нужны только
+        # для удаления исчезнувших
+        reembed = entry is not None and entry.pipeline_version != version
+        reusable_ids = set() if reembed else existing_ids
+        new_chunks = [c for c in chunks if c["id"] not in reusable_ids]
+        kept_chunks = [c for c in chunks if c["id"] in reusable_ids]
+        removed_ids = existing_ids - {chunk["id"] for chunk in chunks}
+
+        if existing_ids:
+            logger.info(
+                f"Документ {file_path} изменился: {len(new_chunks)} новых, "
+                f"{len(removed_ids)} удаленных чанков"
             )
-            if not existing_chunk or existing_chunk["text"] != chunk["text"]:
-                chunks_to_update.append(chunk)
+        else:
+            logger.info(f"Добавляем новый документ {file_path}")
 
-        if chunks_to_update:
-            embeddings = await create_embeddings(chunks_to_update)
-            await upsert_to_chroma(
-                embeddings, chunks_to_update, metadata, collection, file_hash
+        # Записи попадают в общий буфер и отправляются вместе с записями
+        # других документов; ждем их подтверждения до обновления манифеста
+        if DEDUP_ENABLED:
+            await write_deduplicated(
+                file_path,
+                chunks,
+                metadata,
+                existing_ids,
+                reembed,
+                writer,
+                collection_name,
+            )
+        else:
+            await write_diff(
+                new_chunks,
+                kept_chunks,
+                removed_ids,
+                metadata,
+                writer,
+                collection_name,
             )
 
+        manifest.put(
+            collection_name,
+            ManifestEntry(
+                path=file_path,
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns,
+                content_hash=file_hash,
+                pipeline_version=version,
+                chunk_ids=[chunk["id"] for chunk in chunks],
+            ),
+        )
         logger.info(f"Document processed successfully: {file_path}")
     except Exception as e:
         logger.error(f"Error processing document {file_path}: {str(e)}")
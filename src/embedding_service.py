@@ -0,0 +1,192 @@
+import asyncio
+import contextlib
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from services.embeddings import TORCH, Encoder, load_encoder
+from src.config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_WAIT,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_ONNX_DIR,
+    EMBEDDING_ONNX_QUANTIZE,
+    EMBEDDING_PROCESSES,
+    EMBEDDING_THREADS,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _EncodeRequest:
+    texts: List[str]
+    future: asyncio.Future
+    embeddings: List[Optional[List[float]]] = field(default_factory=list)
+
+
+class EmbeddingService:
+    """
+    Один энкодер на процесс. Чанки из разных документов накапливаются
+    в общие батчи, сортируются по длине и раздаются обратно документам.
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL_NAME,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_wait: float = EMBEDDING_MAX_WAIT,
+        processes: int = EMBEDDING_PROCESSES,
+        backend: str = EMBEDDING_BACKEND,
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.processes = processes
+
+        self._model: Optional[Encoder] = None
+        self._pool: Optional[dict] = None
+        self._pending: List[_EncodeRequest] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        self.total_chunks = 0
+        self.total_seconds = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        if not self.total_seconds:
+            return 0.0
+        return self.total_chunks / self.total_seconds
+
+    async def encode(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        self._ensure_worker()
+
+        request = _EncodeRequest(
+            texts=texts,
+            future=asyncio.get_running_loop().create_future(),
+            embeddings=[None] * len(texts),
+        )
+        self._pending.append(request)
+        # Неполный батч воркер добирает max_wait секунд и кодирует
+        # как есть
+        self._wakeup.set()
+        return await request.future
+
+    async def close(self) -> None:
+        if self._worker:
+            self._worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._worker
+            self._worker = None
+        if self._pool:
+            self._model.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+    def _pending_chunks(self) -> int:
+        return sum(len(request.texts) for request in self._pending)
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    def _load_model(self) -> Encoder:
+        if self._model is None:
+            logger.info(
+                f"Loading embedding model {self.model_name} "
+                f"({self.backend} backend)"
+            )
+            self._model = load_encoder(
+                self.model_name,
+                self.backend,
+                onnx_dir=EMBEDDING_ONNX_DIR,
+                quantize=EMBEDDING_ONNX_QUANTIZE,
+                threads=EMBEDDING_THREADS,
+            )
+            # onnxruntime распараллеливает батч потоками сам, пул
+            # процессов нужен только torch-бэкенду
+            if self.processes > 1 and self.backend == TORCH:
+                self._pool = self._model.model.start_multi_process_pool(
+                    ["cpu"] * self.processes
+                )
+        return self._model
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            # Даем другим документам шанс добавить свои чанки в батч
+            if self._pending_chunks() < self.batch_size:
+                await asyncio.sleep(self.max_wait)
+            self._wakeup.clear()
+
+            requests, self._pending = self._pending, []
+            if not requests:
+                continue
+            try:
+                await self._encode_requests(requests)
+            except Exception as e:
+                logger.error(f"Error encoding batch: {str(e)}")
+                for request in requests:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+            if self._pending:
+                self._wakeup.set()
+
+    async def _encode_requests(self, requests: List[_EncodeRequest]) -> None:
+        # (длина, индекс запроса, позиция в запросе) - сортировка по длине
+        # уменьшает паддинг внутри батча
+        items = sorted(
+            (
+                (len(text), request_index, position)
+                for request_index, request in enumerate(requests)
+                for position, text in enumerate(request.texts)
+            ),
+            reverse=True,
+        )
+        texts = [
+            requests[request_index].texts[position]
+            for _, request_index, position in items
+        ]
+
+        model = await asyncio.to_thread(self._load_model)
+        started = time.perf_counter()
+        if self._pool:
+            vectors = await asyncio.to_thread(
+                model.model.encode_multi_process,
+                texts,
+                self._pool,
+                batch_size=self.batch_size,
+            )
+        else:
+            vectors = await asyncio.to_thread(
+                model.encode, texts, batch_size=self.batch_size
+            )
+        elapsed = time.perf_counter() - started
+
+        for (_, request_index, position), vector in zip(items, vectors):
+            requests[request_index].embeddings[position] = vector.tolist()
+        for request in requests:
+            if not request.future.done():
+                request.future.set_result(request.embeddings)
+
+        self.total_chunks += len(texts)
+        self.total_seconds += elapsed
+        logger.info(
+            f"Encoded {len(texts)} chunks from {len(requests)} documents "
+            f"in {elapsed:.2f}s ({len(texts) / max(elapsed, 1e-9):.1f} "
+            f"chunks/sec, overall {self.chunks_per_second:.1f} chunks/sec)"
+        )
+
+
+embedding_service = EmbeddingService()
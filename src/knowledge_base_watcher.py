@@ -1,13 +1,24 @@
 import asyncio
 import logging
 import os
+from typing import Dict, List
 
 import chromadb
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 
-from src.config import CHROMA_COLLECTION_NAME, KNOWLEDGE_BASE_PATH
-from src.document_processor import calculate_file_hash, process_document
+from src.collection_router import collection_router
+from src.config import (
+    COLLECTION_ALIAS_TTL,
+    CONVERSION_MAX_ATTEMPTS,
+    CONVERSION_RETRY_INTERVAL,
+    KNOWLEDGE_BASE_PATH,
+    WATCHER_DEBOUNCE,
+)
+from src.document_converter import failed_files, is_ingestible
+from src.document_processor import process_document, remove_document
+from src.projection_manager import projection_manager
+from src.status import ingest_stats
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,39 +27,83 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-class KnowledgeBaseHandler(FileSystemEventHandler):
-    chroma_client: chromadb.AsyncClientAPI
-
-    def __init__(self, chroma_client: chromadb.AsyncClientAPI):
+def list_documents(path: str) -> List[str]:
+    return sorted(
+        os.path.join(root, file)
+        for root, dirs, files in os.walk(path)
+        for file in files
+        if is_ingestible(os.path.join(root, file))
+    )
+
+
+class ChangeQueue:
+    """
+    Очередь изменений файлов. События из потока watchdog передаются
+    в цикл событий через call_soon_threadsafe, схлопываются по пути
+    в пределах окна debounce, а каждый путь обрабатывает один воркер.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        chroma_client: chromadb.AsyncClientAPI,
+        debounce: float = WATCHER_DEBOUNCE,
+    ):
+        self.loop = loop
         self.chroma_client = chroma_client
-        self.loop = asyncio.get_event_loop()
-
-    def on_created(self, event):
-        if not event.is_directory:
-            self.loop.create_task(self.process_file(event.src_path))
-
-    def on_modified(self, event):
-        if not event.is_directory:
-            self.loop.create_task(self.process_file(event.src_path))
+        self.debounce = debounce
+        self._pending: Dict[str, str] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+
+    def submit_threadsafe(self, file_path: str, kind: str) -> None:
+        self.loop.call_soon_threadsafe(self.submit, file_path, kind)
+
+    def submit(self, file_path: str, kind: str) -> None:
+        # Последнее событие по пути побеждает: modified после deleted
+        # означает, что файл снова существует
+        self._pending[file_path] = kind
+        ingest_stats.enqueue(file_path)
+        timer = self._timers.pop(file_path, None)
+        if timer:
+            timer.cancel()
+        self._timers[file_path] = self.loop.call_later(
+            self.debounce, self._start_worker, file_path
+        )
+
+    def _start_worker(self, file_path: str) -> None:
+        self._timers.pop(file_path, None)
+        if file_path not in self._workers:
+            self._workers[file_path] = self.loop.create_task(
+                self._work(file_path)
+            )
 
-    def on_deleted(self, event):
-        if not event.is_directory:
-            self.loop.create_task(self.remove_from_chroma(event.src_path))
+    async def _work(self, file_path: str) -> None:
+        try:
+            # Пока идет обработка, новые события копятся в _pending;
+            # если их окно debounce уже истекло, обрабатываем сразу
+            while file_path in self._pending and file_path not in self._timers:
+                kind = self._pending.pop(file_path)
+                if kind == "deleted":
+                    await self.remove_from_chroma(file_path)
+                else:
+                    await self.process_file(file_path)
+        finally:
+            self._workers.pop(file_path, None)
 
     async def process_file(self, file_path):
         try:
-            await process_document(file_path, self.chroma_client)
+            with ingest_stats.track(file_path):
+                await process_document(file_path, self.chroma_client)
             logger.info(f"Обработан файл: {file_path}")
         except Exception as e:
             logger.error(f"Ошибка при обработке файла {file_path}: {str(e)}")
 
     async def remove_from_chroma(self, file_path):
         try:
-            file_hash = await calculate_file_hash(file_path)
-            collection = await self.chroma_client.get_or_create_collection(
-                CHROMA_COLLECTION_NAME
-            )
-            await collection.delete(where={"file_hash": file_hash})
+            with ingest_stats.track(file_path):
+                await remove_document(file_path, self.chroma_client)
+            failed_files.pop(file_path, None)
             logger.info(f"Удален файл из базы знаний: {file_path}")
         except Exception as e:
             logger.error(
@@ -56,8 +111,36 @@ class KnowledgeBaseHandler(FileSystemEventHandler):
             )
 
 
-async def watch_knowledge_base(chroma_client):
-    event_handler = KnowledgeBaseHandler(chroma_client)
+class KnowledgeBaseHandler(FileSystemEventHandler):
+    queue: ChangeQueue
+
+    def __init__(self, queue: ChangeQueue):
+        self.queue = queue
+
+    def _submit(self, file_path: str, kind: str) -> None:
+        if is_ingestible(file_path):
+            self.queue.submit_threadsafe(file_path, kind)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._submit(event.src_path, "modified")
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._submit(event.src_path, "modified")
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self._submit(event.src_path, "deleted")
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._submit(event.src_path, "deleted")
+            self._submit(event.dest_path, "modified")
+
+
+async def watch_knowledge_base(queue: ChangeQueue):
+    event_handler = KnowledgeBaseHandler(queue)
     observer = Observer()
     observer.schedule(event_handler, KNOWLEDGE_BASE_PATH, recursive=True)
     observer.start()
@@ -69,15 +152,46 @@ async def watch_knowledge_base(chroma_client):
     observer.join()
 
 
-async def initial_load(chroma_client):
-    logger.info("Начало начальной загрузки документов")
-    for root, dirs, files in os.walk(KNOWLEDGE_BASE_PATH):
-        for file in files:
-            file_path = os.path.join(root, file)
-            await process_document(file_path, chroma_client)
-    logger.info("Начальная загрузка документов завершена")
+async def retry_failed_files(queue: ChangeQueue):
+    while True:
+        await asyncio.sleep(CONVERSION_RETRY_INTERVAL)
+        for file_path, failure in list(failed_files.items()):
+            if not os.path.exists(file_path):
+                failed_files.pop(file_path, None)
+                continue
+            if failure["attempts"] >= CONVERSION_MAX_ATTEMPTS:
+                continue
+            logger.info(f"Повторная обработка файла: {file_path}")
+            # Через очередь, чтобы не пересечься с событиями наблюдателя
+            queue.submit(file_path, "modified")
+
+
+async def follow_collection_alias(queue: ChangeQueue):
+    # Blue/green-переиндексация переключает алиас из другого процесса.
+    # После переключения изменения пишутся в новую коллекцию, а те, что
+    # успели попасть только в старую, догоняются проходом по всем файлам:
+    # неизмененные документы отсекаются манифестом по stat
+    while True:
+        await asyncio.sleep(COLLECTION_ALIAS_TTL)
+        try:
+            changed = await collection_router.refresh(queue.chroma_client)
+            if not changed:
+                continue
+            await projection_manager.attach(
+                queue.chroma_client, collection_router.resolve(changed[0])
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при чтении алиаса коллекции: {str(e)}")
+            continue
+        for file_path in list_documents(KNOWLEDGE_BASE_PATH):
+            queue.submit(file_path, "modified")
 
 
 async def run_knowledge_base_watcher(chroma_client):
-    await initial_load(chroma_client)
-    await watch_knowledge_base(chroma_client)
+    # Начальная загрузка выполняется в src/__main__.py
+    queue = ChangeQueue(asyncio.get_running_loop(), chroma_client)
+    await asyncio.gather(
+        watch_knowledge_base(queue),
+        retry_failed_files(queue),
+        follow_collection_alias(queue),
+    )
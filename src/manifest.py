@@ -0,0 +1,147 @@
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import orjson
+
+from src.config import MANIFEST_PATH
+
+
+@dataclass
+class ManifestEntry:
+    path: str
+    size: int
+    mtime_ns: int
+    content_hash: str
+    pipeline_version: str
+    chunk_ids: List[str] = field(default_factory=list)
+
+    def matches_stat(self, stat: os.stat_result, pipeline_version: str) -> bool:
+        return (
+            self.pipeline_version == pipeline_version
+            and self.size == stat.st_size
+            and self.mtime_ns == stat.st_mtime_ns
+        )
+
+
+class Manifest:
+    """
+    Локальный манифест загруженных файлов: путь -> размер, mtime,
+    хеш содержимого, идентификаторы чанков и версия пайплайна.
+    Позволяет пропускать неизмененные файлы по одному вызову os.stat.
+    """
+
+    def __init__(self, path: str = MANIFEST_PATH):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "collection TEXT NOT NULL, "
+                "path TEXT NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "mtime_ns INTEGER NOT NULL, "
+                "content_hash TEXT NOT NULL, "
+                "pipeline_version TEXT NOT NULL, "
+                "chunk_ids BLOB NOT NULL, "
+                "updated_at REAL NOT NULL, "
+                "PRIMARY KEY (collection, path))"
+            )
+            self._db.commit()
+        return self._db
+
+    def get(self, collection: str, path: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT size, mtime_ns, content_hash, pipeline_version, "
+                    "chunk_ids FROM files WHERE collection = ? AND path = ?",
+                    (collection, path),
+                )
+                .fetchone()
+            )
+        if row is None:
+            return None
+        size, mtime_ns, content_hash, pipeline_version, chunk_ids = row
+        return ManifestEntry(
+            path=path,
+            size=size,
+            mtime_ns=mtime_ns,
+            content_hash=content_hash,
+            pipeline_version=pipeline_version,
+            chunk_ids=orjson.loads(chunk_ids),
+        )
+
+    def put(self, collection: str, entry: ManifestEntry) -> None:
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO files (collection, path, size, "
+                "mtime_ns, content_hash, pipeline_version, chunk_ids, "
+                "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    collection,
+                    entry.path,
+                    entry.size,
+                    entry.mtime_ns,
+                    entry.content_hash,
+                    entry.pipeline_version,
+                    orjson.dumps(entry.chunk_ids),
+                    time.time(),
+                ),
+            )
+            db.commit()
+
+    def update_stat(
+        self, collection: str, path: str, stat: os.stat_result
+    ) -> None:
+        # Содержимое не изменилось (например, touch), обновляем только stat
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "UPDATE files SET size = ?, mtime_ns = ?, updated_at = ? "
+                "WHERE collection = ? AND path = ?",
+                (stat.st_size, stat.st_mtime_ns, time.time(), collection, path),
+            )
+            db.commit()
+
+    def remove(self, collection: str, path: str) -> None:
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "DELETE FROM files WHERE collection = ? AND path = ?",
+                (collection, path),
+            )
+            db.commit()
+
+    def clear(self, collection: str) -> None:
+        with self._lock:
+            db = self._connect()
+            db.execute("DELETE FROM files WHERE collection = ?", (collection,))
+            db.commit()
+
+    def paths(self, collection: str) -> List[str]:
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(
+                    "SELECT path FROM files WHERE collection = ?",
+                    (collection,),
+                )
+                .fetchall()
+            )
+        return [path for (path,) in rows]
+
+
+manifest = Manifest()
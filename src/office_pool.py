@@ -0,0 +1,216 @@
+import asyncio
+import contextlib
+import logging
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+import uuid
+import xmlrpc.client
+from dataclasses import dataclass
+from importlib.metadata import version
+from typing import Dict, List, Optional
+
+from unoserver.client import UnoClient
+
+from src.config import (
+    OFFICE_BASE_PORT,
+    OFFICE_EXECUTABLE,
+    OFFICE_SERVER_COMMAND,
+    OFFICE_START_TIMEOUT,
+    OFFICE_TIMEOUT,
+    OFFICE_WORKERS,
+)
+from src.conversion_pool import ConversionError, ConversionTimeoutError
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _OfficeWorker:
+    index: int
+    port: int
+    uno_port: int
+    profile_dir: str
+    process: Optional[asyncio.subprocess.Process] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+
+class OfficePool:
+    """
+    Пул долгоживущих экземпляров LibreOffice (через unoserver). У каждого
+    экземпляра свой профиль пользователя, конвертация идет через его
+    слушатель, а PDF пишутся во временный каталог вне базы знаний.
+    """
+
+    def __init__(
+        self,
+        workers: int = OFFICE_WORKERS,
+        base_port: int = OFFICE_BASE_PORT,
+        timeout: float = OFFICE_TIMEOUT,
+        start_timeout: float = OFFICE_START_TIMEOUT,
+        command: str = OFFICE_SERVER_COMMAND,
+        executable: str = OFFICE_EXECUTABLE,
+    ):
+        self.workers = max(workers, 1)
+        self.base_port = base_port
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.command = shlex.split(command)
+        self.executable = executable
+        self._versions: Optional[Dict[str, str]] = None
+
+        self.output_dir: Optional[str] = None
+        self._workers: List[_OfficeWorker] = []
+        self._free: Optional[asyncio.Queue] = None
+        self._lock = asyncio.Lock()
+
+    async def _ensure_started(self) -> None:
+        async with self._lock:
+            if self._free is not None:
+                return
+            self.output_dir = tempfile.mkdtemp(prefix="office-pdf-")
+            self._free = asyncio.Queue()
+            for index in range(self.workers):
+                worker = _OfficeWorker(
+                    index=index,
+                    port=self.base_port + index * 2,
+                    uno_port=self.base_port + index * 2 + 1,
+                    profile_dir=tempfile.mkdtemp(prefix=f"office-{index}-"),
+                )
+                self._workers.append(worker)
+                self._free.put_nowait(worker)
+
+    async def _start_worker(self, worker: _OfficeWorker) -> None:
+        worker.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            "--executable",
+            self.executable,
+            "--interface",
+            "127.0.0.1",
+            "--port",
+            str(worker.port),
+            "--uno-interface",
+            "127.0.0.1",
+            "--uno-port",
+            str(worker.uno_port),
+            "--user-installation",
+            worker.profile_dir,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        await asyncio.to_thread(self._wait_ready, worker)
+        logger.info(
+            f"LibreOffice worker {worker.index} started on port {worker.port}"
+        )
+
+    def _wait_ready(self, worker: _OfficeWorker) -> None:
+        server = xmlrpc.client.ServerProxy(f"http://127.0.0.1:{worker.port}")
+        deadline = time.monotonic() + self.start_timeout
+        while time.monotonic() < deadline:
+            if not worker.alive:
+                raise ConversionError(
+                    f"LibreOffice worker {worker.index} exited on startup"
+                )
+            try:
+                server.info()
+                return
+            except (ConnectionError, OSError, xmlrpc.client.Fault):
+                time.sleep(0.5)
+        raise ConversionTimeoutError(
+            f"LibreOffice worker {worker.index} did not start "
+            f"in {self.start_timeout:.0f}s"
+        )
+
+    def versions(self) -> Dict[str, str]:
+        """
+        Версии unoserver и LibreOffice, которыми конвертируются файлы.
+        Входят в ключ кеша конвертации: после обновления LibreOffice
+        PDF, а значит и markdown, может получиться другим.
+        """
+        if self._versions is not None:
+            return self._versions
+        try:
+            result = subprocess.run(
+                [self.executable, "--version"],  # noqa: S603
+                capture_output=True,
+                text=True,
+                timeout=self.start_timeout,
+                check=True,
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            # Не запоминаем: следующий файл попробует снова
+            logger.warning(f"Failed to get LibreOffice version: {e}")
+            return {"unoserver": version("unoserver"), "libreoffice": "unknown"}
+        self._versions = {
+            "unoserver": version("unoserver"),
+            "libreoffice": result.stdout.strip(),
+        }
+        return self._versions
+
+    async def _stop_worker(self, worker: _OfficeWorker) -> None:
+        if worker.alive:
+            # soffice - дочерний процесс unoserver, убиваем всю группу
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(worker.process.pid, signal.SIGKILL)
+            await worker.process.wait()
+        worker.process = None
+
+    def _convert(self, worker: _OfficeWorker, file_path: str, pdf_file: str):
+        client = UnoClient(server="127.0.0.1", port=str(worker.port))
+        client.convert(inpath=file_path, outpath=pdf_file, convert_to="pdf")
+
+    async def convert(self, file_path: str) -> str:
+        await self._ensure_started()
+        worker = await self._free.get()
+        pdf_file = os.path.join(self.output_dir, f"{uuid.uuid4().hex}.pdf")
+        try:
+            if not worker.alive:
+                await self._start_worker(worker)
+            await asyncio.wait_for(
+                asyncio.to_thread(self._convert, worker, file_path, pdf_file),
+                timeout=self.timeout,
+            )
+            logger.info(f"Successfully converted {file_path} to PDF")
+            return pdf_file
+        except asyncio.TimeoutError:
+            await self._stop_worker(worker)
+            raise ConversionTimeoutError(
+                f"Conversion of {file_path} to PDF timed out"
+            ) from None
+        except ConversionError:
+            await self._stop_worker(worker)
+            raise
+        except Exception as e:
+            logger.error(f"Error converting {file_path} to PDF: {str(e)}")
+            if not worker.alive:
+                await self._stop_worker(worker)
+            raise ConversionError(
+                f"Failed to convert {file_path} to PDF"
+            ) from e
+        finally:
+            self._free.put_nowait(worker)
+
+    async def close(self) -> None:
+        for worker in self._workers:
+            await self._stop_worker(worker)
+            shutil.rmtree(worker.profile_dir, ignore_errors=True)
+        if self.output_dir:
+            shutil.rmtree(self.output_dir, ignore_errors=True)
+        self._workers = []
+        self._free = None
+        self.output_dir = None
+
+
+office_pool = OfficePool()
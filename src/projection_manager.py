@@ -0,0 +1,313 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import chromadb
+import numpy as np
+import orjson
+
+from services.projection import Projection, load_projection, normalize
+from src.chroma_writer import get_writer
+from src.chunker import chunk_markdown
+from src.config import (
+    CHROMA_COLLECTION_NAME,
+    INGEST_CONCURRENCY,
+    KNOWLEDGE_BASE_PATH,
+    PROJECTION_DIM,
+    PROJECTION_DIR,
+    PROJECTION_HOLDOUT,
+    PROJECTION_QUANTIZE,
+    PROJECTION_QUERIES_PATH,
+    PROJECTION_SAMPLE_SIZE,
+)
+from src.dedup import dedup_index
+from src.document_converter import is_ingestible, process_file
+from src.embedding_service import embedding_service
+from src.manifest import manifest
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+RECALL_K = 10
+
+
+def _top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ corpus.T
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def _timed_search(
+    corpus: np.ndarray, queries: np.ndarray, k: int
+) -> Tuple[np.ndarray, float]:
+    started = time.perf_counter()
+    found = _top_k(corpus, queries, k)
+    return found, (time.perf_counter() - started) * 1000 / len(queries)
+
+
+def evaluate_projection(
+    projection: Projection,
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    k: int = RECALL_K,
+) -> Dict[str, Any]:
+    """
+    Полный перебор по корпусу в исходной размерности считается
+    эталоном; для проекции (и ее int8-варианта) измеряются recall@k
+    относительно эталона и время поиска на один запрос.
+    """
+    corpus, queries = normalize(corpus), normalize(queries)
+    k = min(k, len(corpus))
+    truth, full_ms = _timed_search(corpus, queries, k)
+
+    variants: Dict[str, Callable[[Any], np.ndarray]] = {
+        "projected": projection.project
+    }
+    if projection.scales is not None:
+        variants["int8"] = projection.transform
+
+    full_dim = corpus.shape[1]
+    report: Dict[str, Any] = {
+        "projection": projection.id,
+        "corpus_size": len(corpus),
+        "queries": len(queries),
+        "k": k,
+        "full": {
+            "dim": full_dim,
+            "bytes_per_vector": full_dim * 4,
+            "search_ms_per_query": round(full_ms, 4),
+        },
+    }
+    for name, transform in variants.items():
+        found, ms = _timed_search(transform(corpus), transform(queries), k)
+        recall = np.mean(
+            [len(set(a) & set(b)) / k for a, b in zip(truth, found)]
+        )
+        # Chroma хранит любой вектор как float32, коды int8 тоже
+        report[name] = {
+            "dim": projection.dim,
+            "bytes_per_vector": projection.dim * 4,
+            "recall_at_k": round(float(recall), 4),
+            "search_ms_per_query": round(ms, 4),
+        }
+    return report
+
+
+async def collect_sample(path: str, size: int) -> List[str]:
+    semaphore = asyncio.Semaphore(INGEST_CONCURRENCY)
+
+    async def load(file_path: str) -> List[str]:
+        async with semaphore:
+            try:
+                result = await process_file(file_path)
+                chunks = await asyncio.to_thread(
+                    chunk_markdown, result["content"]
+                )
+                return [chunk["text"] for chunk in chunks]
+            except Exception as e:
+                logger.warning(f"Пропускаем {file_path} в выборке: {str(e)}")
+                return []
+
+    files = sorted(
+        os.path.join(root, file)
+        for root, dirs, files in os.walk(path)
+        for file in files
+        if is_ingestible(os.path.join(root, file))
+    )
+    texts = list(
+        dict.fromkeys(
+            text
+            for chunk_texts in await asyncio.gather(*map(load, files))
+            for text in chunk_texts
+        )
+    )
+    # Фиксированное зерно: при том же корпусе выборка та же
+    random.Random(0).shuffle(texts)  # noqa: S311 - не для криптографии
+    return texts[:size]
+
+
+def read_queries(path: Optional[str]) -> List[str]:
+    if not path:
+        return []
+    with open(path, encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def write_report(path: str, report: Dict[str, Any]) -> None:
+    with open(path, "wb") as file:
+        file.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+
+
+class ProjectionManager:
+    """
+    Держит активную проекцию процессора. Проекция обучается на выборке
+    чанков базы знаний, сохраняется в файл и записывается в метаданные
+    коллекции, по которым ее находит бот при поиске.
+    """
+
+    def __init__(
+        self,
+        dim: int = PROJECTION_DIM,
+        quantize: bool = PROJECTION_QUANTIZE,
+        directory: str = PROJECTION_DIR,
+    ):
+        self.dim = dim
+        self.quantize = quantize
+        self.directory = directory
+        self.active: Optional[Projection] = None
+
+    @property
+    def id(self) -> Optional[str]:
+        return self.active.id if self.active else None
+
+    def transform(self, embeddings: List[List[float]]) -> List[List[float]]:
+        if self.active is None:
+            return embeddings
+        return self.active.transform(embeddings).tolist()
+
+    def _matches(self, projection: Optional[Projection]) -> bool:
+        return (
+            projection is not None
+            and projection.dim == self.dim
+            and (projection.scales is not None) == self.quantize
+        )
+
+    def _configured(self, metadata: Dict[str, Any]) -> bool:
+        # Сравниваются метаданные коллекции: решение о ее пересоздании
+        # не должно зависеть от того, найден ли файл проекции
+        if not metadata.get("projection"):
+            return not self.dim
+        quantization = "int8" if self.quantize else "none"
+        return (
+            metadata.get("projection_dim") == self.dim
+            and metadata.get("projection_quantization") == quantization
+        )
+
+    def _read(self, projection_id: str) -> Optional[Projection]:
+        try:
+            return load_projection(self.directory, projection_id)
+        except (OSError, KeyError) as e:
+            logger.warning(f"Projection {projection_id} unavailable: {str(e)}")
+            return None
+
+    async def attach(
+        self,
+        chroma_client: chromadb.AsyncClientAPI,
+        name: str = CHROMA_COLLECTION_NAME,
+    ) -> Optional[Projection]:
+        # Только чтение: берем проекцию, с которой записана коллекция
+        collection = await get_writer(chroma_client).get_collection(name)
+        projection_id = (collection.metadata or {}).get("projection")
+        self.active = self._read(projection_id) if projection_id else None
+        return self.active
+
+    async def ensure(
+        self,
+        chroma_client: chromadb.AsyncClientAPI,
+        name: str = CHROMA_COLLECTION_NAME,
+    ) -> Optional[Projection]:
+        writer = get_writer(chroma_client)
+        collection = await writer.get_collection(name)
+        metadata = collection.metadata or {}
+        stored_id = metadata.get("projection")
+
+        projection = None
+        if stored_id and self._configured(metadata):
+            projection = self._read(stored_id)
+            if projection is None and await collection.count():
+                # Новая проекция дала бы векторы, несравнимые с уже
+                # записанными, а удалять коллекцию из-за потерянного
+                # файла нельзя
+                raise RuntimeError(
+                    f"Файл проекции {stored_id} коллекции {name} не найден "
+                    f"в {self.directory}: восстановите его или "
+                    "переиндексируйте коллекцию"
+                )
+        if projection is None and self.dim:
+            # Новая коллекция blue/green-переиндексации наследует проекцию
+            # текущей, если та подходит под настройки
+            projection = (
+                self.active if self._matches(self.active) else None
+            ) or await self.fit()
+        new_id = projection.id if projection else None
+
+        if stored_id != new_id:
+            # Векторы другой размерности в одну коллекцию не записать,
+            # поэтому коллекция создается заново и загружается с нуля
+            count = await collection.count()
+            if count:
+                logger.warning(
+                    f"Проекция коллекции {name} меняется "
+                    f"({stored_id} -> {new_id}), удаляем {count} записей"
+                )
+            await chroma_client.delete_collection(name)
+            writer.forget_collection(name)
+            manifest.clear(name)
+            dedup_index.clear(name)
+            collection = await chroma_client.get_or_create_collection(
+                name=name,
+                metadata=projection.metadata() if projection else None,
+            )
+
+        self.active = projection
+        return projection
+
+    async def fit(self) -> Optional[Projection]:
+        texts = await collect_sample(
+            KNOWLEDGE_BASE_PATH, PROJECTION_SAMPLE_SIZE
+        )
+        queries = await asyncio.to_thread(read_queries, PROJECTION_QUERIES_PATH)
+        # Без контрольных запросов запросами служат отложенные чанки
+        holdout_size = 0 if queries else int(len(texts) * PROJECTION_HOLDOUT)
+        holdout = texts[:holdout_size]
+        fit_texts = texts[len(holdout) :]
+        if len(fit_texts) < self.dim:
+            logger.warning(
+                f"Недостаточно чанков для проекции в {self.dim} измерений "
+                f"({len(fit_texts)}), эмбеддинги сохраняются без проекции"
+            )
+            return None
+
+        embeddings = np.asarray(
+            await embedding_service.encode(fit_texts + holdout + queries),
+            dtype=np.float32,
+        )
+        corpus = embeddings[: len(fit_texts)]
+        query_vectors = embeddings[len(fit_texts) :]
+
+        projection = await asyncio.to_thread(
+            Projection.fit, corpus, self.dim, self.quantize
+        )
+        path = await asyncio.to_thread(projection.save, self.directory)
+        logger.info(
+            f"Fitted projection {projection.id} on {len(corpus)} chunks, "
+            f"saved to {path}"
+        )
+
+        if len(query_vectors):
+            report = await asyncio.to_thread(
+                evaluate_projection, projection, corpus, query_vectors
+            )
+            report_path = os.path.join(
+                self.directory, f"{projection.id}.report.json"
+            )
+            await asyncio.to_thread(write_report, report_path, report)
+            for variant in ("projected", "int8"):
+                if variant in report:
+                    logger.info(
+                        f"Projection {variant}: "
+                        f"recall@{report['k']}="
+                        f"{report[variant]['recall_at_k']:.3f}, "
+                        f"{report[variant]['search_ms_per_query']:.3f} ms "
+                        f"vs {report['full']['search_ms_per_query']:.3f} ms "
+                        "per query"
+                    )
+        return projection
+
+
+projection_manager = ProjectionManager()
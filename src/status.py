@@ -0,0 +1,134 @@
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional, Set
+
+import orjson
+from aiohttp import web
+
+from src.config import STATUS_HOST, STATUS_PORT
+from src.document_converter import failed_files
+from src.embedding_service import embedding_service
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+LAST_ERRORS = 20
+
+
+class IngestStats:
+    """
+    Состояние загрузки для /status: файлы в очереди и в работе,
+    обработанные документы и последние ошибки.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.pending: Set[str] = set()
+        self.in_progress: Dict[str, float] = {}
+        self.processed = 0
+        self.errors = 0
+        # Время, когда хотя бы один документ был в работе: простой между
+        # изменениями файлов не занижает скорость обработки
+        self.busy_seconds = 0.0
+        self.busy_since: Optional[float] = None
+        # Суммарное время по стадиям пайплайна; документы обрабатываются
+        # параллельно, поэтому сумма может превышать время работы
+        self.stage_seconds: Dict[str, float] = {}
+        self.last_errors: Deque[Dict[str, Any]] = deque(maxlen=LAST_ERRORS)
+
+    def enqueue(self, file_path: str) -> None:
+        self.pending.add(file_path)
+
+    @contextmanager
+    def track(self, file_path: str) -> Iterator[None]:
+        self.pending.discard(file_path)
+        self.in_progress[file_path] = time.monotonic()
+        if self.busy_since is None:
+            self.busy_since = self.in_progress[file_path]
+        try:
+            yield
+        except Exception as e:
+            self.errors += 1
+            self.last_errors.append(
+                {"file_path": file_path, "error": str(e), "at": time.time()}
+            )
+            raise
+        else:
+            self.processed += 1
+        finally:
+            self.in_progress.pop(file_path, None)
+            if not self.in_progress and self.busy_since is not None:
+                self.busy_seconds += time.monotonic() - self.busy_since
+                self.busy_since = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] = (
+                self.stage_seconds.get(name, 0.0)
+                + time.perf_counter()
+                - started
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        uptime = now - self.started_at
+        busy = self.busy_seconds
+        if self.busy_since is not None:
+            busy += now - self.busy_since
+        return {
+            "uptime_seconds": round(uptime, 1),
+            "busy_seconds": round(busy, 1),
+            "pending": len(self.pending),
+            "in_progress": [
+                {"file_path": path, "seconds": round(now - started, 1)}
+                for path, started in sorted(
+                    self.in_progress.items(), key=lambda item: item[1]
+                )
+            ],
+            "processed": self.processed,
+            "errors": self.errors,
+            "failed": [
+                {"file_path": path, **failure}
+                for path, failure in failed_files.items()
+            ],
+            "docs_per_second": round(self.processed / max(busy, 1e-9), 3),
+            "chunks_per_second": round(embedding_service.chunks_per_second, 1),
+            "chunks_embedded": embedding_service.total_chunks,
+            "stage_seconds": {
+                name: round(seconds, 3)
+                for name, seconds in self.stage_seconds.items()
+            },
+            "last_errors": list(self.last_errors),
+        }
+
+
+ingest_stats = IngestStats()
+
+
+async def handle_status(request: web.Request) -> web.Response:
+    return web.json_response(
+        ingest_stats.snapshot(), dumps=lambda data: orjson.dumps(data).decode()
+    )
+
+
+async def start_status_server(
+    host: str = STATUS_HOST, port: int = STATUS_PORT
+) -> Optional[web.AppRunner]:
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/status", handle_status)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Status endpoint listening on http://{host}:{port}/status")
+    return runner
@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("chromadb")
+
+from src.chroma_writer import ChromaWriter  # noqa: E402
+
+
+class FakeCollection:
+    def __init__(self, name, requests, fail=False):
+        self.name = name
+        self.requests = requests
+        self.fail = fail
+
+    async def _record(self, kind, kwargs):
+        if self.fail:
+            raise RuntimeError("chroma is down")
+        self.requests.append((self.name, kind, kwargs))
+
+    async def upsert(self, **kwargs):
+        await self._record("upsert", kwargs)
+
+    async def update(self, **kwargs):
+        await self._record("update", kwargs)
+
+    async def delete(self, **kwargs):
+        await self._record("delete", kwargs)
+
+
+class FakeClient:
+    def __init__(self, fail=False):
+        self.requests = []
+        self.fail = fail
+
+    async def get_or_create_collection(self, name):
+        return FakeCollection(name, self.requests, self.fail)
+
+
+def upsert(writer, collection, ids):
+    return writer.upsert(
+        collection,
+        ids=ids,
+        documents=[f"text {i}" for i in ids],
+        embeddings=[[0.0] for _ in ids],
+        metadatas=[{"id": i} for i in ids],
+    )
+
+
+async def submit_and_flush(writer, *calls):
+    tasks = [asyncio.create_task(call) for call in calls]
+    await asyncio.sleep(0)
+    await writer.flush()
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def test_flush_groups_operations_by_kind_and_collection():
+    client = FakeClient()
+
+    async def run():
+        writer = ChromaWriter(client, max_batch=100, flush_interval=60)
+        await submit_and_flush(
+            writer,
+            upsert(writer, "docs", ["a1", "a2"]),
+            writer.update("docs", ids=["u1"], metadatas=[{"x": 1}]),
+            upsert(writer, "docs", ["b1"]),
+            writer.delete("docs", ids=["old"]),
+            writer.delete("docs", file_paths=["c.md"]),
+            upsert(writer, "other", ["o1"]),
+        )
+        return writer.requests_sent
+
+    assert asyncio.run(run()) == 5
+    kinds = [(name, kind) for name, kind, _ in client.requests]
+    assert kinds == [
+        ("docs", "delete"),
+        ("docs", "delete"),
+        ("docs", "upsert"),
+        ("other", "upsert"),
+        ("docs", "update"),
+    ]
+    assert client.requests[0][2] == {"where": {"file_path": {"$in": ["c.md"]}}}
+    assert client.requests[1][2] == {"ids": ["old"]}
+    assert client.requests[2][2]["ids"] == ["a1", "a2", "b1"]
+
+
+def test_large_group_is_sent_in_parts():
+    client = FakeClient()
+
+    async def run():
+        writer = ChromaWriter(client, max_batch=2, flush_interval=60)
+        await upsert(writer, "docs", ["1", "2", "3", "4", "5"])
+        await writer.close()
+
+    asyncio.run(run())
+    assert [kwargs["ids"] for _, _, kwargs in client.requests] == [
+        ["1", "2"],
+        ["3", "4"],
+        ["5"],
+    ]
+
+
+def test_repeated_ids_are_collapsed():
+    client = FakeClient()
+
+    async def run():
+        writer = ChromaWriter(client, max_batch=100, flush_interval=60)
+        await submit_and_flush(
+            writer,
+            writer.update("docs", ids=["c1"], metadatas=[{"a": 1, "b": 1}]),
+            writer.update("docs", ids=["c1"], metadatas=[{"b": 2}]),
+            upsert(writer, "docs", ["c2"]),
+            writer.upsert(
+                "docs",
+                ids=["c2"],
+                documents=["newer"],
+                embeddings=[[1.0]],
+                metadatas=[{"id": "c2", "v": 2}],
+            ),
+        )
+
+    asyncio.run(run())
+    upserted, updated = (kwargs for _, _, kwargs in client.requests)
+    assert updated == {"ids": ["c1"], "metadatas": [{"a": 1, "b": 2}]}
+    assert upserted["ids"] == ["c2"]
+    assert upserted["documents"] == ["newer"]
+    assert upserted["metadatas"] == [{"id": "c2", "v": 2}]
+
+
+def test_failed_group_fails_its_operations():
+    client = FakeClient(fail=True)
+
+    async def run():
+        writer = ChromaWriter(
+            client, max_batch=100, flush_interval=60, max_retries=1
+        )
+        return await submit_and_flush(
+            writer,
+            upsert(writer, "docs", ["a1"]),
+            upsert(writer, "docs", ["b1"]),
+        )
+
+    results = asyncio.run(run())
+    assert [type(result) for result in results] == [RuntimeError] * 2
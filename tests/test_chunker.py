@@ -0,0 +1,73 @@
+from src.chunker import chunk_markdown, iter_sentences, split_into_chunks
+
+MARKDOWN = """# Guide
+
+Intro sentence one. Intro sentence two!
+
+## Setup
+
+<!-- hidden note -->
+1.2. Install the package. Run the tests.
+
+Another paragraph here.
+"""
+
+
+def test_sentence_offsets_point_into_source():
+    sentences = list(iter_sentences(MARKDOWN))
+    assert [s.text for s in sentences] == [
+        "guide",
+        "intro sentence one.",
+        "intro sentence two!",
+        "setup",
+        "1.2. install the package.",
+        "run the tests.",
+        "another paragraph here.",
+    ]
+    for sentence in sentences:
+        source = MARKDOWN[sentence.start : sentence.end]
+        assert source.lower().startswith(sentence.text[:5])
+    assert "hidden" not in " ".join(s.text for s in sentences)
+
+
+def test_sections_follow_headings_and_numbers():
+    sections = [s.section for s in iter_sentences(MARKDOWN)]
+    assert sections == [
+        "guide",
+        "guide",
+        "guide",
+        "guide > setup",
+        "guide > setup > 1.2",
+        "guide > setup > 1.2",
+        "guide > setup > 1.2",
+    ]
+
+
+def test_chunking_is_deterministic():
+    assert chunk_markdown(MARKDOWN) == chunk_markdown(MARKDOWN)
+
+
+def test_chunks_respect_limit_and_overlap():
+    text = " ".join(f"Sentence number {i} ends." for i in range(10))
+    chunks = split_into_chunks(
+        iter_sentences(text), chunk_tokens=8, overlap_tokens=4
+    )
+    assert len(chunks) == 9
+    for chunk in chunks:
+        assert len(chunk["text"].split()) <= 8
+    # Each chunk starts with the last sentence of the previous one
+    for previous, chunk in zip(chunks, chunks[1:]):
+        last = previous["text"].split(" sentence ")[-1]
+        assert chunk["text"].startswith("sentence " + last)
+        assert chunk["start_index"] < previous["end_index"]
+
+
+def test_chunk_does_not_cross_sections():
+    chunks = chunk_markdown(MARKDOWN)
+    assert [chunk["section"] for chunk in chunks] == [
+        "guide",
+        "guide > setup > 1.2",
+    ]
+    # The empty "Setup" heading joins the first chunk of its subsection
+    assert chunks[1]["text"].startswith("setup 1.2. install")
+    assert MARKDOWN[chunks[1]["start_index"]] == "S"
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from src.dedup import DedupIndex
+
+TEXT = "the quick brown fox jumps over the lazy dog near the river bank"
+OTHER = "completely different words about database migrations and indexes"
+
+
+def chunk(file_path, chunk_id, text=TEXT):
+    return {
+        "id": chunk_id,
+        "text": text,
+        "metadata": {"file_path": file_path, "section": "intro"},
+    }
+
+
+@pytest.fixture
+def index(tmp_path):
+    return DedupIndex(path=str(tmp_path / "dedup.sqlite"))
+
+
+def test_duplicate_uses_canonical_chunk(index):
+    first = index.apply("docs", "a.md", [chunk("a.md", "a1")], [])
+    assert [c["id"] for c in first.embed] == ["a1"]
+    assert first.duplicates == 0
+
+    second = index.apply(
+        "docs",
+        "b.md",
+        [chunk("b.md", "b1"), chunk("b.md", "b2", OTHER)],
+        [],
+    )
+    assert second.duplicates == 1
+    # a1 is not confirmed yet, so b.md writes it with its own text
+    assert sorted(c["id"] for c in second.embed) == ["a1", "b2"]
+    canonical = next(c for c in second.embed if c["id"] == "a1")
+    assert canonical["metadata"]["source_count"] == 2
+    assert index.chunk_ids("docs", "b.md") == {"a1", "b2"}
+
+
+def test_confirmed_canonical_only_updates_metadata(index):
+    index.apply("docs", "a.md", [chunk("a.md", "a1")], [])
+    index.confirm("docs", ["a1"])
+
+    plan = index.apply("docs", "b.md", [chunk("b.md", "b1")], [])
+    assert plan.embed == []
+    assert list(plan.updates) == ["a1"]
+    sources = json.loads(plan.updates["a1"]["sources"])
+    assert [s["file_path"] for s in sources] == ["a.md", "b.md"]
+
+    reembedded = index.apply(
+        "docs", "b.md", [chunk("b.md", "b1")], [], reembed=True
+    )
+    assert [c["id"] for c in reembedded.embed] == ["a1"]
+
+
+def test_removing_owner_moves_canonical(index):
+    index.apply("docs", "a.md", [chunk("a.md", "a1")], [])
+    index.apply("docs", "b.md", [chunk("b.md", "b1")], [])
+    index.confirm("docs", ["a1"])
+
+    plan = index.remove_file("docs", "a.md", ["a1"])
+    assert plan.deletes == []
+    assert plan.updates["a1"]["file_path"] == "b.md"
+    assert plan.updates["a1"]["source_count"] == 1
+
+    plan = index.remove_file("docs", "b.md", [])
+    assert plan.deletes == ["a1"]
+    assert index.chunk_ids("docs", "b.md") == set()
+
+
+def test_chunk_stored_without_dedup_is_deleted(index):
+    index.apply("docs", "a.md", [chunk("a.md", "a1")], [])
+    index.confirm("docs", ["a1"])
+
+    # b1 was written before deduplication and now matches a1
+    plan = index.apply("docs", "b.md", [chunk("b.md", "b1")], ["b1", "b0"])
+    assert sorted(plan.deletes) == ["b0", "b1"]
+    assert list(plan.updates) == ["a1"]
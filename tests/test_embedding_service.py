@@ -0,0 +1,32 @@
+import asyncio
+
+import numpy as np
+
+from src.embedding_service import EmbeddingService
+
+
+class StubEncoder:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size):
+        self.calls.append(list(texts))
+        return np.array([[float(len(text))] for text in texts])
+
+
+def test_sub_batch_request_completes():
+    service = EmbeddingService(batch_size=64, max_wait=0.01, processes=1)
+    service._model = StubEncoder()
+
+    async def run():
+        try:
+            return await asyncio.wait_for(
+                service.encode([f"chunk {i}" for i in range(10)]), 5
+            )
+        finally:
+            await service.close()
+
+    texts = [f"chunk {i}" for i in range(10)]
+    embeddings = asyncio.run(run())
+    assert embeddings == [[float(len(text))] for text in texts]
+    assert len(service._model.calls) == 1
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy.exc import IntegrityError, OperationalError  # noqa: E402
+
+from services.database.feedback_queue import FeedbackQueue  # noqa: E402
+
+
+class RecordingQueue(FeedbackQueue):
+    """Keeps inserted rows in memory and fails inserts on demand."""
+
+    def __init__(self, **kwargs):
+        super().__init__(session_pool=None, **kwargs)
+        self.stored = {}
+        self.errors = []
+        self.rejected = set()
+
+    async def _insert(self, rows):
+        rows = list(rows)
+        if self.errors:
+            raise self.errors.pop(0)
+        if any(row["id"] in self.rejected for row in rows):
+            raise IntegrityError("INSERT", {}, Exception("rejected"))
+        for row in rows:
+            self.stored.setdefault(row["id"], dict(row))
+
+    async def _update_rating(self, feedback_id, rating):
+        row = self.stored.get(feedback_id)
+        if row is None:
+            return False
+        row["is_helpful"] = rating
+        return True
+
+
+def put(queue, feedback_id, **kwargs):
+    return queue.put(
+        user=1,
+        question="question",
+        answer="answer",
+        feedback_id=feedback_id,
+        **kwargs,
+    )
+
+
+def test_rating_is_merged_into_queued_row():
+    async def run():
+        queue = RecordingQueue()
+        put(queue, 1)
+        assert await queue.set_rating(1, True)
+        assert queue.stored == {}
+        await queue.flush()
+        return queue
+
+    queue = asyncio.run(run())
+    assert queue.stored[1]["is_helpful"] is True
+
+
+def test_rating_of_inserted_row_updates_database():
+    async def run():
+        queue = RecordingQueue()
+        put(queue, 1)
+        await queue.flush()
+        found = await queue.set_rating(1, False)
+        missing = await queue.set_rating(2, True)
+        return queue, found, missing
+
+    queue, found, missing = asyncio.run(run())
+    assert found is True
+    assert missing is False
+    assert queue.stored[1]["is_helpful"] is False
+
+
+def test_connection_error_requeues_rows():
+    async def run():
+        queue = RecordingQueue()
+        put(queue, 1)
+        queue.errors.append(OperationalError("INSERT", {}, Exception()))
+        await queue.flush()
+        assert queue.stored == {}
+        # The rating reaches the row that went back to the queue
+        assert await queue.set_rating(1, True)
+        await queue.flush()
+        return queue
+
+    queue = asyncio.run(run())
+    assert queue.stored[1]["is_helpful"] is True
+
+
+def test_requeue_drops_oldest_rows_over_max_pending():
+    async def run():
+        queue = RecordingQueue(max_pending=2)
+        for feedback_id in (1, 2, 3):
+            put(queue, feedback_id)
+        queue.errors.append(OperationalError("INSERT", {}, Exception()))
+        await queue.flush()
+        await queue.flush()
+        return queue
+
+    assert set(asyncio.run(run()).stored) == {2, 3}
+
+
+def test_rejected_row_does_not_drop_batch():
+    async def run():
+        queue = RecordingQueue()
+        for feedback_id in (1, 2, 3):
+            put(queue, feedback_id)
+        queue.rejected.add(2)
+        await queue.flush()
+        return queue
+
+    queue = asyncio.run(run())
+    assert set(queue.stored) == {1, 3}
+    assert not queue._pending
+
+
+def test_unexpected_error_drops_batch():
+    async def run():
+        queue = RecordingQueue()
+        put(queue, 1)
+        queue.errors.append(ValueError("bad row"))
+        await queue.flush()
+        await queue.flush()
+        return queue
+
+    queue = asyncio.run(run())
+    assert queue.stored == {}
+    assert not queue._pending
@@ -0,0 +1,165 @@
+import asyncio
+import heapq
+import sys
+
+import pytest
+
+if sys.version_info < (3, 12):
+    pytest.skip("the bot package needs Python 3.12", allow_module_level=True)
+pytest.importorskip("aiogram")
+
+from bot.middlewares.request.scheduler import (  # noqa: E402
+    PRIORITY_BULK,
+    PRIORITY_CALLBACK,
+    PRIORITY_DEFAULT,
+    RequestScheduler,
+    TokenBucket,
+)
+
+
+def queue(scheduler, requests):
+    """Queues (name, priority, chat_id) requests without the grant task."""
+    loop = asyncio.get_running_loop()
+    futures = {}
+    for name, priority, chat_id in requests:
+        futures[name] = loop.create_future()
+        heapq.heappush(
+            scheduler._waiters,
+            (priority, next(scheduler._counter), chat_id, futures[name]),
+        )
+    return futures
+
+
+def granted(futures):
+    return [name for name, future in futures.items() if future.done()]
+
+
+def test_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(rate=2, capacity=3)
+    now = bucket.updated_at
+    for _ in range(3):
+        assert bucket.delay(now) == 0
+        bucket.take()
+    assert bucket.delay(now) == pytest.approx(0.5)
+    assert bucket.delay(now + 0.5) == 0
+    assert bucket.delay(now + 100) == 0
+    assert bucket.tokens == 3
+
+
+def test_bucket_pause_leaves_one_token():
+    bucket = TokenBucket(rate=1, capacity=5)
+    bucket.pause(10)
+    now = bucket.updated_at
+    assert bucket.delay(now) == pytest.approx(10, abs=0.1)
+    assert bucket.delay(bucket.paused_until) == 0
+    bucket.take()
+    assert bucket.delay(bucket.paused_until) > 0
+
+
+def test_higher_priority_is_granted_first():
+    async def run():
+        scheduler = RequestScheduler(global_rate=2)
+        futures = queue(
+            scheduler,
+            [
+                ("bulk", PRIORITY_BULK, 1),
+                ("default", PRIORITY_DEFAULT, 2),
+                ("callback", PRIORITY_CALLBACK, 3),
+            ],
+        )
+        delay = await scheduler._grant()
+        return granted(futures), delay
+
+    names, delay = asyncio.run(run())
+    assert sorted(names) == ["callback", "default"]
+    assert delay == pytest.approx(0.5, abs=0.01)
+
+
+def test_blocked_chat_does_not_hold_back_other_chats():
+    async def run():
+        scheduler = RequestScheduler(chat_rate=1, chat_burst=1)
+        futures = queue(
+            scheduler,
+            [
+                ("first", PRIORITY_DEFAULT, 1),
+                ("second", PRIORITY_DEFAULT, 1),
+                ("other", PRIORITY_DEFAULT, 2),
+            ],
+        )
+        await scheduler._grant()
+        return granted(futures), scheduler._waiters
+
+    names, waiters = asyncio.run(run())
+    assert sorted(names) == ["first", "other"]
+    assert [chat_id for _, _, chat_id, _ in waiters] == [1]
+
+
+def test_pause_blocks_only_the_chat():
+    async def run():
+        scheduler = RequestScheduler()
+        await scheduler.pause(1, 5)
+        futures = queue(
+            scheduler,
+            [("paused", PRIORITY_DEFAULT, 1), ("other", PRIORITY_DEFAULT, 2)],
+        )
+        delay = await scheduler._grant()
+        return granted(futures), delay
+
+    names, delay = asyncio.run(run())
+    assert names == ["other"]
+    assert delay == pytest.approx(5, abs=0.1)
+
+
+def test_shared_buckets_limit_processes_together():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+
+    async def run():
+        redis = fakeredis.FakeAsyncRedis()
+        first = RequestScheduler(global_rate=3, redis=redis)
+        second = RequestScheduler(global_rate=3, redis=redis)
+        first_futures = queue(
+            first,
+            [("a", PRIORITY_DEFAULT, 1), ("b", PRIORITY_DEFAULT, 2)],
+        )
+        await first._grant()
+        second_futures = queue(
+            second,
+            [("c", PRIORITY_DEFAULT, 3), ("d", PRIORITY_DEFAULT, 4)],
+        )
+        delay = await second._grant()
+        return (
+            granted(first_futures),
+            granted(second_futures),
+            delay,
+            second._global.tokens,
+        )
+
+    first, second, delay, local_tokens = asyncio.run(run())
+    assert first == ["a", "b"]
+    # One shared token was left; the refused request keeps its local one
+    assert second == ["c"]
+    assert 0 < delay <= 1 / 3 + 0.01
+    assert local_tokens == pytest.approx(2, abs=0.01)
+
+
+def test_shared_chat_bucket_keeps_chat_order():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+
+    async def run():
+        redis = fakeredis.FakeAsyncRedis()
+        first = RequestScheduler(chat_rate=1, chat_burst=1, redis=redis)
+        second = RequestScheduler(chat_rate=1, chat_burst=1, redis=redis)
+        queue(first, [("a", PRIORITY_DEFAULT, 1)])
+        await first._grant()
+        futures = queue(
+            second,
+            [("b", PRIORITY_DEFAULT, 1), ("c", PRIORITY_DEFAULT, 2)],
+        )
+        await second._grant()
+        return granted(futures), second._waiters
+
+    names, waiters = asyncio.run(run())
+    assert names == ["c"]
+    assert [chat_id for _, _, chat_id, _ in waiters] == [1]
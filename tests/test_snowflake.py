@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from utils import snowflake as snowflake_module
+from utils.snowflake import (
+    MAX_SEQUENCE,
+    MAX_WORKER_ID,
+    ClockMovedBackwardsError,
+    Snowflake,
+    worker_of,
+)
+
+
+class FakeClock:
+    def __init__(self, ms):
+        self.ms = ms
+        self.sleeps = 0
+
+    def time(self):
+        return self.ms / 1000
+
+    def sleep(self, seconds):
+        self.sleeps += 1
+        self.ms += 1
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock(1_800_000_000_000)
+    monkeypatch.setattr(snowflake_module.time, "time", clock.time)
+    monkeypatch.setattr(snowflake_module.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_ids_are_increasing(clock):
+    generator = Snowflake(worker_id=7)
+    ids = []
+    for _ in range(3):
+        ids += [generator.next_id() for _ in range(10)]
+        clock.ms += 1
+    assert ids == sorted(set(ids))
+    assert {worker_of(i) for i in ids} == {7}
+
+
+def test_sequence_overflow_waits_for_next_millisecond(clock):
+    generator = Snowflake(worker_id=1)
+    start = clock.ms
+    ids = [generator.next_id() for _ in range(MAX_SEQUENCE + 2)]
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert clock.sleeps == 1
+    assert clock.ms == start + 1
+
+
+def test_clock_moving_backwards_raises(clock):
+    generator = Snowflake(worker_id=1)
+    first = generator.next_id()
+    clock.ms -= 5
+    with pytest.raises(ClockMovedBackwardsError):
+        generator.next_id()
+    clock.ms += 5
+    assert generator.next_id() > first
+
+
+def test_worker_id_is_reset_after_fork():
+    generator = Snowflake()
+    generator.next_id()
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        os.write(write, f"{generator.worker_id}".encode())
+        os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as pipe:
+        child_worker_id = int(pipe.read())
+    os.waitpid(pid, 0)
+    assert generator.worker_id == os.getpid() & MAX_WORKER_ID
+    assert child_worker_id == pid & MAX_WORKER_ID
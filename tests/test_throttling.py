@@ -0,0 +1,50 @@
+import asyncio
+import sys
+
+import pytest
+
+if sys.version_info < (3, 12):
+    pytest.skip("the bot package needs Python 3.12", allow_module_level=True)
+pytest.importorskip("aiogram")
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from bot.middlewares.outer.throttling import (  # noqa: E402
+    RELEASE_LOCK_SCRIPT,
+    TOKEN_BUCKET_SCRIPT,
+    release_question_lock,
+)
+
+
+def test_token_bucket_allows_burst_then_refills():
+    async def run():
+        redis = fakeredis.FakeAsyncRedis()
+        take = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        burst = [await take(keys=["bucket"], args=[0.001, 3]) for _ in range(4)]
+        # Pretend the last call was two seconds ago
+        seconds, microseconds = await redis.time()
+        now = seconds * 1000 + microseconds // 1000
+        await redis.hset("bucket", "ts", now - 2000)
+        refilled = await take(keys=["bucket"], args=[1, 3])
+        return burst, refilled, await redis.pttl("bucket")
+
+    burst, refilled, ttl = asyncio.run(run())
+    assert burst == [1, 1, 1, 0]
+    assert refilled == 1
+    assert 0 < ttl <= 3000
+
+
+def test_lock_is_released_only_by_its_owner():
+    async def run():
+        redis = fakeredis.FakeAsyncRedis()
+        release = redis.register_script(RELEASE_LOCK_SCRIPT)
+        await redis.set("lock", "mine")
+        foreign = await release(keys=["lock"], args=["theirs"])
+        kept = await redis.get("lock")
+        await release_question_lock(redis, "lock", "mine")
+        return foreign, kept, await redis.exists("lock")
+
+    foreign, kept, exists = asyncio.run(run())
+    assert foreign == 0
+    assert kept == b"mine"
+    assert exists == 0
@@ -4,15 +4,18 @@ from typing import Any
 from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest
 
+from bot.middlewares import bulk_requests
 from bot.settings import settings
 
 
 async def to_admins(bot: Bot, text: str, **kwargs: Any) -> None:
     admin_ids = settings.get_admin_ids()
-    tasks = []
-    for user_id in admin_ids:
-        tasks.append(send_message(bot, user_id, text, **kwargs))
-    await asyncio.gather(*tasks)
+    # Sent after the replies to users; the tasks copy the priority
+    with bulk_requests():
+        tasks = []
+        for user_id in admin_ids:
+            tasks.append(send_message(bot, user_id, text, **kwargs))
+        await asyncio.gather(*tasks)
 
 
 async def send_message(
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Final, Optional
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+# 41 bits of milliseconds since EPOCH_MS, 10 bits of worker id and
+# 12 bits of sequence: ids are sortable by creation time and fit into
+# a signed BIGINT for about 69 years
+EPOCH_MS: Final[int] = 1704067200000  # 2024-01-01T00:00:00Z
+WORKER_BITS: Final[int] = 10
+SEQUENCE_BITS: Final[int] = 12
+MAX_WORKER_ID: Final[int] = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE: Final[int] = (1 << SEQUENCE_BITS) - 1
+WORKER_ID_KEY: Final[str] = "snowflake:worker_id"
+
+
+class ClockMovedBackwardsError(RuntimeError):
+    pass
+
+
+class Snowflake:
+    """
+    Time-based 64-bit id generator. Without an explicit worker id the
+    process id is used; it is picked up again after ``fork`` so forked
+    workers don't produce the same ids. Processes in separate
+    containers all run as the same pid and take a worker id with
+    ``claim_worker_id`` instead.
+    """
+
+    def __init__(self, worker_id: Optional[int] = None) -> None:
+        self._configured_worker_id = worker_id
+        self._lock = threading.Lock()
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        worker_id = self._configured_worker_id
+        if worker_id is None:
+            worker_id = os.getpid()
+        self.worker_id = worker_id & MAX_WORKER_ID
+        self._last_ms = -1
+        self._sequence = 0
+
+    def set_worker_id(self, worker_id: int) -> None:
+        with self._lock:
+            self._configured_worker_id = worker_id
+            self._reset()
+
+    def _now_ms(self) -> int:
+        now_ms = int(time.time() * 1000)
+        if now_ms < self._last_ms:
+            # Ids issued from now on could repeat the earlier ones
+            raise ClockMovedBackwardsError(
+                f"Clock moved backwards by {self._last_ms - now_ms} ms"
+            )
+        return now_ms
+
+    def next_id(self) -> int:
+        """
+        :raises ClockMovedBackwardsError: if the wall clock is behind
+            the time of the last id
+        """
+        with self._lock:
+            now_ms = self._now_ms()
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # 4096 ids in one millisecond: sleep into the next one
+                    while now_ms == self._last_ms:
+                        time.sleep(0.001)
+                        now_ms = self._now_ms()
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+            return (
+                (now_ms - EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS)
+                | self.worker_id << SEQUENCE_BITS
+                | self._sequence
+            )
+
+
+snowflake: Final[Snowflake] = Snowflake()
+
+
+def next_id() -> int:
+    return snowflake.next_id()
+
+
+def worker_of(snowflake_id: int) -> int:
+    """Worker id of the process that generated ``snowflake_id``."""
+    return (snowflake_id >> SEQUENCE_BITS) & MAX_WORKER_ID
+
+
+async def claim_worker_id(redis: Redis, worker_id: Optional[int] = None) -> int:
+    """
+    Sets the worker id of ``next_id``: the configured ``worker_id`` if
+    given, otherwise the next value of a shared Redis counter. Claimed
+    ids repeat only after 1024 claims, i.e. process restarts.
+    """
+    if worker_id is None:
+        worker_id = await redis.incr(WORKER_ID_KEY) - 1
+    snowflake.set_worker_id(worker_id)
+    return snowflake.worker_id